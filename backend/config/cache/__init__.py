@@ -0,0 +1,30 @@
+"""
+Cache backends shared by every worker process (sqlite.py, redis.py)
+
+Both add pop(), which reads and removes an entry atomically in one round
+trip, so two requests racing with the same one-time value (an OAuth state)
+can't both accept it. get_and_delete() uses it when the configured backend
+has it; on other backends only the caller whose delete() removed the key
+gets the value.
+"""
+
+_missing = object()
+
+
+def get_and_delete(cache, key, default=None):
+    """Remove key from cache and return its value, or default if it wasn't there"""
+    if hasattr(cache, 'pop'):
+        return cache.pop(key, default)
+    value = cache.get(key, _missing)
+    if value is _missing or not cache.delete(key):
+        return default
+    return value
+
+
+async def aget_and_delete(cache, key, default=None):
+    if hasattr(cache, 'apop'):
+        return await cache.apop(key, default)
+    value = await cache.aget(key, _missing)
+    if value is _missing or not await cache.adelete(key):
+        return default
+    return value
@@ -0,0 +1,19 @@
+"""
+Django's Redis cache backend plus an atomic pop()
+
+For deployments spanning several hosts: point REDIS_URL at Redis 6.2+ or a
+server speaking its protocol (Valkey, KeyDB, ...). pop() is a single GETDEL.
+"""
+from asgiref.sync import sync_to_async
+from django.core.cache.backends.redis import RedisCache as BaseRedisCache
+
+
+class RedisCache(BaseRedisCache):
+    def pop(self, key, default=None, version=None):
+        """Remove key and return its value (default if missing), in one round trip"""
+        key = self.make_and_validate_key(key, version=version)
+        value = self._cache.get_client(key, write=True).getdel(key)
+        return default if value is None else self._cache._serializer.loads(value)
+
+    async def apop(self, key, default=None, version=None):
+        return await sync_to_async(self.pop, thread_sensitive=True)(key, default, version)
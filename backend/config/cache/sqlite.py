@@ -0,0 +1,186 @@
+"""
+Cache backend on a local SQLite file, shared by every worker process
+
+LocMemCache lives inside one process: with several workers an OAuth state
+stored by one is invisible to the worker that gets the callback, and OTP
+attempt counters and throttle buckets are kept once per process. This
+backend keeps entries in one SQLite file in WAL mode, so all processes on
+the host see the same entries and readers never wait for the writer.
+
+Every operation is one statement, hence atomic across processes: incr() is
+an UPDATE ... RETURNING on an integer column (integers are stored unpickled),
+add() an upsert that only replaces an expired row and pop() a
+DELETE ... RETURNING, so concurrent callers can't both claim an entry.
+Requires SQLite 3.35+.
+
+Each thread (and each forked process) opens its own connection. Every
+CULL_EVERY writes, expired rows are purged and, beyond MAX_ENTRIES, the rows
+closest to expiry are culled.
+"""
+from asgiref.sync import sync_to_async
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+import itertools
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+PRAGMAS = {
+    # Wait this long (ms) for the write lock instead of failing at once
+    'busy_timeout': 5000,
+    # Readers never wait for the writer, and the writer never waits for readers
+    'journal_mode': 'WAL',
+    # With WAL, fsync at checkpoints rather than at every commit
+    'synchronous': 'NORMAL',
+}
+
+# Writes between purges of expired rows
+CULL_EVERY = 100
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL) WITHOUT ROWID',
+    'CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires)',
+)
+
+LIVE = '(expires IS NULL OR expires > ?)'
+
+UPSERT = ('INSERT INTO cache (key, value, expires) VALUES (?, ?, ?) '
+          'ON CONFLICT (key) DO UPDATE SET value = excluded.value, expires = excluded.expires')
+
+
+class SQLiteCache(BaseCache):
+    def __init__(self, location, params):
+        super().__init__(params)
+        self.location = location
+        self.pragmas = {**PRAGMAS, **params.get('OPTIONS', {}).get('pragmas', {})}
+        self._local = threading.local()
+        self._writes = itertools.count(1)
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        # A forked worker must not share its parent's connection
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.location, isolation_level=None)
+            for name, value in self.pragmas.items():
+                conn.execute(f'PRAGMA {name} = {value}')
+            for statement in SCHEMA:
+                conn.execute(statement)
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def _read(self, sql, params):
+        return self._connection().execute(sql, params).fetchall()
+
+    def _write(self, sql, params):
+        """Run one write statement; returns (rowcount, rows it RETURNED)"""
+        cursor = self._connection().execute(sql, params)
+        # Stepping a RETURNING statement to the end is what commits it
+        rows = cursor.fetchall()
+        if next(self._writes) % CULL_EVERY == 0:
+            self._cull()
+        return cursor.rowcount, rows
+
+    def _cull(self):
+        conn = self._connection()
+        conn.execute('DELETE FROM cache WHERE expires <= ?', (time.time(),))
+        count = conn.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+        if count > self._max_entries:
+            limit = count if self._cull_frequency == 0 else count // self._cull_frequency
+            conn.execute('DELETE FROM cache WHERE key IN '
+                         '(SELECT key FROM cache ORDER BY expires IS NULL, expires LIMIT ?)', (limit,))
+
+    def _dump(self, value):
+        # type() rather than isinstance() keeps bools pickled
+        if type(value) is int and -2 ** 63 <= value < 2 ** 63:
+            return value
+        return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+    def _load(self, value):
+        return value if type(value) is int else pickle.loads(value)
+
+    def get(self, key, default=None, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        rows = self._read(f'SELECT value FROM cache WHERE key = ? AND {LIVE}', (key, time.time()))
+        return self._load(rows[0][0]) if rows else default
+
+    def get_many(self, keys, version=None):
+        keys = {self.make_and_validate_key(key, version=version): key for key in keys}
+        if not keys:
+            return {}
+        placeholders = ', '.join('?' * len(keys))
+        rows = self._read(f'SELECT key, value FROM cache WHERE key IN ({placeholders}) AND {LIVE}',
+                          (*keys, time.time()))
+        return {keys[key]: self._load(value) for key, value in rows}
+
+    def has_key(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        return bool(self._read(f'SELECT 1 FROM cache WHERE key = ? AND {LIVE}', (key, time.time())))
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        self._write(UPSERT, (key, self._dump(value), self.get_backend_timeout(timeout)))
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        expires = self.get_backend_timeout(timeout)
+        rows = [(self.make_and_validate_key(key, version=version), self._dump(value), expires)
+                for key, value in data.items()]
+        conn = self._connection()
+        # All or nothing, like a single set()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.executemany(UPSERT, rows)
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        # Inserts, or replaces only a row that has expired
+        count, _ = self._write(f'{UPSERT} WHERE cache.expires <= ?',
+                               (key, self._dump(value), self.get_backend_timeout(timeout), time.time()))
+        return count == 1
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        _, rows = self._write(
+            f"UPDATE cache SET value = value + ? WHERE key = ? AND typeof(value) = 'integer' AND {LIVE} "
+            'RETURNING value',
+            (delta, key, time.time()),
+        )
+        if not rows:
+            raise ValueError("Key '%s' not found." % key)
+        return rows[0][0]
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        count, _ = self._write(f'UPDATE cache SET expires = ? WHERE key = ? AND {LIVE}',
+                               (self.get_backend_timeout(timeout), key, time.time()))
+        return count == 1
+
+    def pop(self, key, default=None, version=None):
+        """Remove key and return its value (default if missing or expired), in one statement"""
+        key = self.make_and_validate_key(key, version=version)
+        _, rows = self._write('DELETE FROM cache WHERE key = ? RETURNING value, expires', (key,))
+        if not rows or (rows[0][1] is not None and rows[0][1] <= time.time()):
+            return default
+        return self._load(rows[0][0])
+
+    async def apop(self, key, default=None, version=None):
+        return await sync_to_async(self.pop, thread_sensitive=True)(key, default, version)
+
+    def delete(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        count, _ = self._write('DELETE FROM cache WHERE key = ?', (key,))
+        return count == 1
+
+    def delete_many(self, keys, version=None):
+        keys = [self.make_and_validate_key(key, version=version) for key in keys]
+        if keys:
+            self._write(f"DELETE FROM cache WHERE key IN ({', '.join('?' * len(keys))})", keys)
+
+    def clear(self):
+        self._write('DELETE FROM cache', ())
+
@@ -50,6 +50,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "users.middleware.MetricsMiddleware",  # first, so it times the whole stack
     "django.middleware.security.SecurityMiddleware",
     "corsheaders.middleware.CorsMiddleware",  # CORS must be before CommonMiddleware
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -78,16 +79,29 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = "config.wsgi.application"
+ASGI_APPLICATION = "config.asgi.application"
+
+# Route login, /me/, OTP verification and OAuth callbacks to native async views
+# (enable when serving config.asgi, e.g. with uvicorn)
+AUTH_ASYNC_VIEWS = config('AUTH_ASYNC_VIEWS', default=False, cast=bool)
 
 
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
 
 # Using SQLite for development (switch to PostgreSQL in production)
+# config.sqlite is Django's SQLite backend plus WAL and pragma tuning
 DATABASES = {
     "default": {
-        "ENGINE": "django.db.backends.sqlite3",
+        "ENGINE": "config.sqlite",
         "NAME": BASE_DIR / "db.sqlite3",
+        # Reuse connections across requests (seconds; 0 = one per request)
+        "CONN_MAX_AGE": config('DB_CONN_MAX_AGE', default=600, cast=int),
+        "CONN_HEALTH_CHECKS": True,
+        "OPTIONS": {
+            # Writes in atomic blocks take the write lock when they start
+            "transaction_mode": "IMMEDIATE",
+        },
     }
 }
 
@@ -105,40 +119,113 @@ DATABASES = {
 
 
 # Cache Configuration
-CACHES = {
-    'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-        'LOCATION': 'trueneed-cache',
+# Holds OAuth state, OTP records and throttle counters, which every worker
+# process must see: a SQLite (WAL) file shared by the processes on this host,
+# or Redis when REDIS_URL is set (workers on several hosts)
+REDIS_URL = config('REDIS_URL', default='')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'config.cache.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
     }
-}
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'config.cache.sqlite.SQLiteCache',
+            'LOCATION': config('CACHE_LOCATION', default=str(BASE_DIR / 'cache.sqlite3')),
+            'OPTIONS': {
+                'MAX_ENTRIES': config('CACHE_MAX_ENTRIES', default=100000, cast=int),
+            },
+        }
+    }
+
 
+# OTP storage: 'cache' (TTL expiry, atomic attempt counters) or 'database' (fallback)
+OTP_STORE = config('OTP_STORE', default='cache')
+OTP_EXPIRY_SECONDS = 600
+OTP_RECORD_TTL_SECONDS = 3600
+
+# Retention: purge expired OTP rows and old outbox mail (python manage.py purge_expired).
+# Set RETENTION_INTERVAL_SECONDS to also run it periodically inside each worker.
+RETENTION_INTERVAL_SECONDS = config('RETENTION_INTERVAL_SECONDS', default=0, cast=int)
+RETENTION_BATCH_SIZE = config('RETENTION_BATCH_SIZE', default=500, cast=int)
+EMAIL_OUTBOX_RETENTION_DAYS = config('EMAIL_OUTBOX_RETENTION_DAYS', default=7, cast=int)
 
 # Custom User Model
 AUTH_USER_MODEL = 'users.User'
 
 # Custom Authentication Backend for email login
+# (EmailBackend extends ModelBackend, so listing ModelBackend as well would only
+# repeat the lookup and the dummy hash for every failed login)
 AUTHENTICATION_BACKENDS = [
     'users.backends.EmailBackend',
-    'django.contrib.auth.backends.ModelBackend',
 ]
 
+# Request threads per server process (the WSGI/ASGI server's thread count)
+SERVER_THREADS = config('SERVER_THREADS', default=8, cast=int)
+
+# Password hashing pool: PBKDF2 runs on at most HASHING_POOL_WORKERS threads, with
+# HASHING_POOL_QUEUE more waiting; further logins/registrations get a fast 503, as
+# does a hash still waiting after HASHING_POOL_TIMEOUT seconds. Unset, the pool
+# admits half of SERVER_THREADS so the other half keep serving cheap endpoints
+HASHING_POOL_WORKERS = config('HASHING_POOL_WORKERS', default=0, cast=int) or None
+HASHING_POOL_QUEUE = config('HASHING_POOL_QUEUE', default=None, cast=lambda v: v if v is None else int(v))
+HASHING_POOL_TIMEOUT = config('HASHING_POOL_TIMEOUT', default=5, cast=float)
+
 
 # Django REST Framework Settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'users.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
+    # orjson-backed (falls back to DRF's JSON classes when orjson is missing)
     'DEFAULT_RENDERER_CLASSES': (
-        'rest_framework.renderers.JSONRenderer',
+        'users.renderers.ORJSONRenderer',
     ),
     'DEFAULT_PARSER_CLASSES': (
-        'rest_framework.parsers.JSONParser',
+        'users.renderers.ORJSONParser',
     ),
+    # Sliding-window limits for views with a throttle_scope, as
+    # '<scope>_<ip|email|phone>' (see users/throttling.py); THROTTLING=False
+    # turns them off (load tests)
+    'DEFAULT_THROTTLE_RATES': {} if not config('THROTTLING', default=True, cast=bool) else {
+        'login_ip': '30/min',
+        'login_email': '10/min',
+        'register_ip': '20/hour',
+        'register_email': '5/hour',
+        'resend_otp_ip': '20/hour',
+        'resend_otp_email': '5/hour',
+        'phone_register_ip': '20/hour',
+        'phone_register_phone': '5/hour',
+        'phone_login_ip': '20/hour',
+        'phone_login_phone': '5/hour',
+    },
+    # Reverse proxies in front of the app: the client IP throttles key on is
+    # taken that many hops from the end of X-Forwarded-For. 0 ignores the
+    # header (clients can set it to anything) and uses REMOTE_ADDR
+    'NUM_PROXIES': config('NUM_PROXIES', default=0, cast=int),
 }
 
+# Bearer token Prometheus must send to scrape /metrics (empty = no auth)
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+
+# Views over their @query_budget log the SQL they ran; strict mode raises
+# instead, so tests fail on a redundant query (the test base class turns it on)
+QUERY_BUDGETS_STRICT = config('QUERY_BUDGETS_STRICT', default=False, cast=bool)
+
+# Cache holding throttle counters; must be shared by all workers for the
+# limits to be global rather than per process
+THROTTLE_CACHE = 'default'
+
+# Per-process cache of authenticated users (entries are dropped on save/delete;
+# the TTL bounds staleness across processes)
+USER_CACHE_SIZE = config('USER_CACHE_SIZE', default=1024, cast=int)
+USER_CACHE_TTL_SECONDS = config('USER_CACHE_TTL_SECONDS', default=60, cast=int)
 
 # JWT Settings
 SIMPLE_JWT = {
@@ -159,10 +246,15 @@ SIMPLE_JWT = {
     'USER_ID_FIELD': 'id',
     'USER_ID_CLAIM': 'user_id',
     
-    'AUTH_TOKEN_CLASSES': ('rest_framework_simplejwt.tokens.AccessToken',),
+    'AUTH_TOKEN_CLASSES': ('users.tokens.RevocableAccessToken',),
     'TOKEN_TYPE_CLAIM': 'token_type',
+    'TOKEN_REFRESH_SERIALIZER': 'users.serializers.TokenRefreshSerializer',
 }
 
+# Seconds between pulls of revocations made by other processes (logout is
+# effective immediately in the process that handled it)
+REVOCATION_SYNC_SECONDS = config('REVOCATION_SYNC_SECONDS', default=5, cast=int)
+
 
 # CORS Settings
 # For development - add all common frontend ports
@@ -196,12 +288,17 @@ CORS_ALLOW_HEADERS = [
     'authorization',
     'content-type',
     'dnt',
+    'if-match',
+    'if-none-match',
     'origin',
     'user-agent',
     'x-csrftoken',
     'x-requested-with',
 ]
 
+# Lets the frontend read profile ETags for If-Match on /profile/
+CORS_EXPOSE_HEADERS = ['etag']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
@@ -239,6 +336,19 @@ USE_TZ = True
 
 STATIC_URL = "static/"
 
+# Uploaded files; profile images live in a content-addressed store under it
+MEDIA_ROOT = config('MEDIA_ROOT', default=str(BASE_DIR / 'media'))
+IMAGE_STORE_ROOT = Path(MEDIA_ROOT) / 'images'
+IMAGE_MAX_BYTES = config('IMAGE_MAX_BYTES', default=2 * 1024 * 1024, cast=int)
+# Origin prefixed to image URLs in API responses (the frontend runs on another origin)
+IMAGE_BASE_URL = config('IMAGE_BASE_URL', default='http://localhost:8000')
+
+# Multipart avatar uploads: originals are capped, then resized to these square
+# bounds (px) by a pool of worker processes
+AVATAR_MAX_UPLOAD_BYTES = config('AVATAR_MAX_UPLOAD_BYTES', default=5 * 1024 * 1024, cast=int)
+AVATAR_SIZES = (512, 128)
+AVATAR_WORKERS = config('AVATAR_WORKERS', default=2, cast=int)
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/6.0/ref/settings/#default-auto-field
 
@@ -258,6 +368,18 @@ EMAIL_HOST_USER = config('EMAIL_HOST_USER', default='')
 EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD', default='')
 DEFAULT_FROM_EMAIL = config('DEFAULT_FROM_EMAIL', default='TrueNeed <noreply@trueneed.com>')
 
+# Pooled email transport (SMTP connections are kept open and reused between messages)
+EMAIL_POOL_SIZE = config('EMAIL_POOL_SIZE', default=2, cast=int)
+EMAIL_POOL_KEEPALIVE_SECONDS = config('EMAIL_POOL_KEEPALIVE_SECONDS', default=60, cast=int)
+
+# Email outbox (emails are queued in the DB and sent after commit by a worker pool)
+EMAIL_OUTBOX_ASYNC = config('EMAIL_OUTBOX_ASYNC', default=True, cast=bool)
+EMAIL_OUTBOX_WORKERS = config('EMAIL_OUTBOX_WORKERS', default=2, cast=int)
+EMAIL_OUTBOX_MAX_ATTEMPTS = config('EMAIL_OUTBOX_MAX_ATTEMPTS', default=5, cast=int)
+EMAIL_OUTBOX_BACKOFF_SECONDS = config('EMAIL_OUTBOX_BACKOFF_SECONDS', default=5, cast=int)
+EMAIL_OUTBOX_MAX_BACKOFF_SECONDS = config('EMAIL_OUTBOX_MAX_BACKOFF_SECONDS', default=600, cast=int)
+EMAIL_OUTBOX_LOCK_TIMEOUT_SECONDS = config('EMAIL_OUTBOX_LOCK_TIMEOUT_SECONDS', default=300, cast=int)
+
 
 # Frontend URL (for password reset links and OAuth redirects)
 FRONTEND_URL = config('FRONTEND_URL', default='http://localhost:5173')
@@ -279,6 +401,21 @@ MICROSOFT_CLIENT_ID = config('MICROSOFT_CLIENT_ID', default='')
 MICROSOFT_CLIENT_SECRET = config('MICROSOFT_CLIENT_SECRET', default='')
 MICROSOFT_TENANT = config('MICROSOFT_TENANT', default='common')
 
+# Calls to OAuth providers: pooled keep-alive sessions per provider (users/http.py)
+OAUTH_HTTP_TIMEOUT = (
+    config('OAUTH_HTTP_CONNECT_TIMEOUT', default=3.05, cast=float),
+    config('OAUTH_HTTP_READ_TIMEOUT', default=10, cast=float),
+)
+OAUTH_HTTP_POOL_SIZE = config('OAUTH_HTTP_POOL_SIZE', default=10, cast=int)
+OAUTH_HTTP_RETRIES = config('OAUTH_HTTP_RETRIES', default=2, cast=int)
+
+# Provider signing keys for id_token verification (users/id_tokens.py): kept
+# for the JWKS response's max-age (this default when it has none); unknown key
+# ids refetch at most this often
+JWKS_DEFAULT_TTL_SECONDS = config('JWKS_DEFAULT_TTL_SECONDS', default=3600, cast=int)
+JWKS_MIN_REFETCH_SECONDS = config('JWKS_MIN_REFETCH_SECONDS', default=60, cast=int)
+ID_TOKEN_LEEWAY_SECONDS = config('ID_TOKEN_LEEWAY_SECONDS', default=60, cast=int)
+
 
 # Session Configuration for OAuth
 SESSION_COOKIE_SECURE = not DEBUG
@@ -290,3 +427,13 @@ SESSION_COOKIE_SAMESITE = 'Lax'
 TWILIO_ACCOUNT_SID = config('TWILIO_ACCOUNT_SID', default='')
 TWILIO_AUTH_TOKEN = config('TWILIO_AUTH_TOKEN', default='')
 TWILIO_PHONE_NUMBER = config('TWILIO_PHONE_NUMBER', default='')
+
+# SMS provider (dotted path; users.sms_utils.ConsoleBackend / StubBackend for local use)
+SMS_BACKEND = config('SMS_BACKEND', default='users.sms_utils.TwilioBackend')
+SMS_WORKERS = config('SMS_WORKERS', default=4, cast=int)
+
+# Verified Firebase ID tokens kept in memory (until their exp) per process
+FIREBASE_TOKEN_CACHE_SIZE = config('FIREBASE_TOKEN_CACHE_SIZE', default=1024, cast=int)
+
+# Seconds before a failed Firebase initialization (e.g. credentials not mounted yet) is retried
+FIREBASE_INIT_RETRY_SECONDS = config('FIREBASE_INIT_RETRY_SECONDS', default=60, cast=int)
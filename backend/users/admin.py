@@ -1,6 +1,9 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth import get_user_model
+from django.utils import timezone
+
+from .models import EmailOutbox
 
 User = get_user_model()
 
@@ -30,3 +33,25 @@ class UserAdmin(BaseUserAdmin):
     )
     
     readonly_fields = ['date_joined', 'last_login']
+
+
+@admin.register(EmailOutbox)
+class EmailOutboxAdmin(admin.ModelAdmin):
+    """Admin interface for queued and dead-lettered emails"""
+    
+    list_display = ['to_email', 'subject', 'status', 'attempts', 'next_attempt_at', 'created_at', 'sent_at']
+    list_filter = ['status', 'created_at']
+    search_fields = ['to_email', 'subject']
+    ordering = ['-created_at']
+    readonly_fields = ['attempts', 'locked_at', 'last_error', 'created_at', 'sent_at']
+    actions = ['requeue']
+    
+    @admin.action(description='Requeue selected emails')
+    def requeue(self, request, queryset):
+        updated = queryset.exclude(status=EmailOutbox.STATUS_SENT).update(
+            status=EmailOutbox.STATUS_PENDING,
+            attempts=0,
+            next_attempt_at=timezone.now(),
+            locked_at=None,
+        )
+        self.message_user(request, f"{updated} email(s) requeued")
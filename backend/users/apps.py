@@ -3,3 +3,21 @@ from django.apps import AppConfig
 
 class UsersConfig(AppConfig):
     name = "users"
+
+    def ready(self):
+        from django.conf import settings
+        from django.core.signals import request_started
+        from django.db.backends.signals import connection_created
+
+        # Keep the authentication user cache in step with user saves/deletes
+        from . import signals  # noqa: F401
+
+        # Count async requests' queries, whichever thread's connection runs them
+        from .metrics import install_query_timer
+        connection_created.connect(install_query_timer, dispatch_uid='users.query_timer')
+
+        # Start the retention scheduler with the first request, so management
+        # commands and migrations never spawn it
+        if getattr(settings, 'RETENTION_INTERVAL_SECONDS', 0):
+            from .retention import start_scheduler
+            request_started.connect(start_scheduler, dispatch_uid='users.retention')
@@ -0,0 +1,401 @@
+"""
+Async versions of the hot auth endpoints for ASGI deployments
+
+Under ASGI every sync APIView is run through a thread-sensitive adapter, so
+requests queue behind one another on a single thread. The views here are
+native coroutines: reads and writes go through Django's async ORM, password
+checks await the hashing pool and OAuth provider calls use an async HTTP
+client, so slow providers no longer hold a worker.
+
+They keep the request/response format of the views in views.py and are
+routed in place of them when AUTH_ASYNC_VIEWS is enabled.
+"""
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from config.cache import aget_and_delete
+from django.http import HttpResponse, HttpResponseRedirect
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import status
+from rest_framework.exceptions import APIException, AuthenticationFailed, ParseError, Throttled
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+import asyncio
+import threading
+
+from .authentication import CachedJWTAuthentication, check_user, token_user_id
+from . import http
+from .hashing import arun_dummy_hash, averify_password
+from .id_tokens import verify_id_token
+from .metrics import external_call
+from .otp_store import get_otp_store, EMAIL_REGISTRATION, PHONE
+from .query_budget import query_budget
+from .renderers import dumps, loads
+from .revocation import get_revocation_list
+from .serializers import LoginSerializer, UserSerializer, VerifyOTPSerializer
+from .throttling import EmailThrottle, IPThrottle
+from .user_cache import get_user_cache
+from .views import (
+    microsoft_user_info, not_modified, oauth_error_url, oauth_success_url, oauth_user, provider_endpoints,
+    with_user_validators
+)
+
+User = get_user_model()
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_http_client():
+    """
+    Return the shared async HTTP client for the running event loop
+
+    Clients hold a connection pool bound to the loop that created them, so one
+    is kept per loop (normally exactly one per ASGI worker).
+    """
+    import httpx
+
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None or client.is_closed:
+        with _clients_lock:
+            # Forget clients whose loop has gone away (tests, async_to_sync)
+            for stale in [l for l in _clients if l.is_closed()]:
+                del _clients[stale]
+            # Same timeouts as the sync sessions (users/http.py); httpx retries failed connects only
+            connect, read = getattr(settings, 'OAUTH_HTTP_TIMEOUT', http.DEFAULT_TIMEOUT)
+            client = _clients[loop] = httpx.AsyncClient(
+                timeout=httpx.Timeout(read, connect=connect),
+                transport=httpx.AsyncHTTPTransport(retries=getattr(settings, 'OAUTH_HTTP_RETRIES', 2)),
+            )
+    return client
+
+
+def token_pair(user):
+    """Fresh JWT tokens for user"""
+    refresh = RefreshToken.for_user(user)
+    return {
+        'refresh': str(refresh),
+        'access': str(refresh.access_token),
+    }
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncAPIView(View):
+    """
+    Minimal async counterpart of APIView
+
+    Parses JSON bodies, renders dicts as JSON and turns DRF exceptions
+    (validation, authentication, a saturated hashing pool) into the same
+    responses DRF would produce.
+    """
+
+    throttle_classes = ()
+    throttle_scope = None
+
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            if self.throttle_scope:
+                await self.check_throttles(request)
+            return await super().dispatch(request, *args, **kwargs)
+        except APIException as exc:
+            return self.handle_exception(exc)
+
+    async def check_throttles(self, request):
+        """Same throttles as the sync views, run before the handler"""
+        request.data = self.parse(request)
+        waits = []
+        for throttle_class in self.throttle_classes:
+            throttle = throttle_class()
+            # A cache round-trip, not ORM work: no need to queue on the shared sync thread
+            if not await sync_to_async(throttle.allow_request, thread_sensitive=False)(request, self):
+                waits.append(throttle.wait())
+        if waits:
+            raise Throttled(max(waits))
+
+    def handle_exception(self, exc):
+        data = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+        response = self.respond(data, exc.status_code)
+        if isinstance(exc, AuthenticationFailed):
+            response['WWW-Authenticate'] = 'Bearer realm="api"'
+        if getattr(exc, 'wait', None):
+            response['Retry-After'] = str(int(exc.wait))
+        return response
+
+    def respond(self, data, status_code=status.HTTP_200_OK):
+        return HttpResponse(dumps(data), status=status_code, content_type='application/json')
+
+    def parse(self, request):
+        """Request body as a dict (empty body -> {})"""
+        if hasattr(request, 'data'):
+            return request.data
+        if not request.body:
+            return {}
+        try:
+            data = loads(request.body)
+        except ValueError as exc:
+            raise ParseError(f'JSON parse error - {exc}')
+        if not isinstance(data, dict):
+            raise ParseError('JSON parse error - expected an object')
+        return data
+
+    def validate(self, serializer_class, request):
+        serializer = serializer_class(data=self.parse(request))
+        serializer.is_valid(raise_exception=True)
+        return serializer.validated_data
+
+    async def authenticate(self, request):
+        """
+        Resolve the Bearer token to an active user
+
+        Token validation is pure CPU; only a user cache miss awaits the database.
+        """
+        auth = CachedJWTAuthentication()
+        header = auth.get_header(request)
+        raw_token = auth.get_raw_token(header) if header else None
+        if raw_token is None:
+            raise AuthenticationFailed('Authentication credentials were not provided.')
+
+        # Token classes check the revocation list; bring it up to date off the loop
+        await get_revocation_list().arefresh()
+        validated = auth.get_validated_token(raw_token)
+        user_id = token_user_id(validated)
+        user_cache = get_user_cache()
+
+        user = user_cache.get(user_id)
+        if user is None:
+            generation = user_cache.generation
+            try:
+                user = await User.objects.aget(**{jwt_settings.USER_ID_FIELD: user_id})
+            except User.DoesNotExist:
+                raise AuthenticationFailed('User not found', code='user_not_found')
+            user_cache.set(user_id, user, generation)
+
+        check_user(user, validated)
+        return user
+
+
+@query_budget(1)
+class LoginView(AsyncAPIView):
+    """
+    API endpoint for user login
+    POST /api/auth/login/
+    """
+    throttle_classes = (IPThrottle, EmailThrottle)
+    throttle_scope = 'login'
+
+    async def post(self, request):
+        data = self.validate(LoginSerializer, request)
+        email = data['email']
+        password = data['password']
+
+        user = await User.objects.filter(email=email).afirst()
+        if user is None:
+            # Same hashing cost as a wrong password so response time does not leak accounts
+            await arun_dummy_hash(password)
+        elif not (await averify_password(user, password) and user.is_active):
+            # Inactive accounts fail like a wrong password, as in EmailBackend
+            user = None
+
+        if user is None:
+            return self.respond({
+                'error': 'Invalid email or password'
+            }, status.HTTP_401_UNAUTHORIZED)
+
+        return self.respond({
+            'user': UserSerializer(user).data,
+            'tokens': token_pair(user),
+            'message': 'Login successful'
+        })
+
+
+@query_budget(2)
+class UserDetailView(AsyncAPIView):
+    """
+    API endpoint to get current user details
+    GET /api/auth/me/
+    """
+
+    async def get(self, request):
+        user = await self.authenticate(request)
+        response = not_modified(request, user)
+        if response is not None:
+            return response
+        return with_user_validators(self.respond(UserSerializer(user).data), user)
+
+
+@query_budget(3)
+class VerifyOTPView(AsyncAPIView):
+    """
+    API endpoint to verify OTP and complete registration
+    POST /api/auth/verify-otp/
+    """
+
+    async def post(self, request):
+        data = self.validate(VerifyOTPSerializer, request)
+        email = data['email']
+
+        otp_store = get_otp_store()
+        result = await otp_store.averify(EMAIL_REGISTRATION, email, data['otp'])
+
+        if not result.found:
+            return self.respond({
+                'error': 'No pending registration found for this email'
+            }, status.HTTP_404_NOT_FOUND)
+
+        if not result.success:
+            return self.respond({
+                'error': result.message
+            }, status.HTTP_400_BAD_REQUEST)
+
+        pending_reg = result.data
+        user = await User.objects.acreate(
+            email=email,
+            name=pending_reg['name'],
+            password=pending_reg['password'],  # Already hashed
+            avatar_color=pending_reg['avatar_color']
+        )
+        await otp_store.adiscard(EMAIL_REGISTRATION, email)
+
+        return self.respond({
+            'user': UserSerializer(user).data,
+            'tokens': token_pair(user),
+            'message': 'Registration completed successfully'
+        }, status.HTTP_201_CREATED)
+
+
+@query_budget(3)
+class PhoneVerifyOTPView(AsyncAPIView):
+    """
+    API endpoint to verify phone OTP and complete registration/login
+    POST /api/auth/phone/verify-otp/
+    """
+
+    async def post(self, request):
+        data = self.parse(request)
+        phone_number = str(data.get('phone_number', '')).strip()
+        otp = str(data.get('otp', '')).strip()
+
+        if not phone_number or not otp:
+            return self.respond({'error': 'Phone number and OTP are required'}, status.HTTP_400_BAD_REQUEST)
+
+        otp_store = get_otp_store()
+        result = await otp_store.averify(PHONE, phone_number, otp)
+
+        if not result.found:
+            return self.respond({'error': 'No OTP found for this phone number'}, status.HTTP_404_NOT_FOUND)
+
+        if not result.success:
+            return self.respond({'error': result.message}, status.HTTP_400_BAD_REQUEST)
+
+        phone_otp = result.data
+
+        if phone_otp['purpose'] == 'registration':
+            user = await User.objects.acreate(
+                phone_number=phone_number,
+                name=phone_otp['name'],
+                password=phone_otp['password'],
+                avatar_color=phone_otp['avatar_color'],
+                is_active=True,
+                email=f"{phone_number}@phone.trueneed.local"  # Generate email for phone users
+            )
+            message, status_code = 'Registration successful', status.HTTP_201_CREATED
+        else:  # login
+            user = await User.objects.filter(phone_number=phone_number).afirst()
+            if user is None:
+                return self.respond({'error': 'User not found'}, status.HTTP_404_NOT_FOUND)
+            message, status_code = 'Login successful', status.HTTP_200_OK
+
+        await otp_store.adiscard(PHONE, phone_number)
+
+        tokens = token_pair(user)
+        return self.respond({
+            'message': message,
+            'user': UserSerializer(user).data,
+            'access': tokens['access'],
+            'refresh': tokens['refresh']
+        }, status_code)
+
+
+@query_budget(4)
+class OAuthCallbackView(AsyncAPIView):
+    """
+    API endpoint to handle OAuth callback
+    GET /api/auth/oauth/<provider>/callback/
+    """
+
+    async def get(self, request, provider):
+        code = request.GET.get('code')
+        state = request.GET.get('state')
+
+        # Verify state for CSRF protection; taking it out of the cache in the
+        # same step makes it single-use even if the callback is replayed
+        saved_provider = await aget_and_delete(cache, f'oauth_state_{state}')
+        if not saved_provider or saved_provider != provider:
+            return HttpResponseRedirect(oauth_error_url('Invalid state parameter'))
+
+        if provider not in ('google', 'apple', 'microsoft'):
+            return self.respond({
+                'error': f'Unsupported OAuth provider: {provider}'
+            }, status.HTTP_400_BAD_REQUEST)
+
+        try:
+            if provider == 'google':
+                user_info = await self._google_get_user_info(code, request)
+            elif provider == 'microsoft':
+                user_info = await self._microsoft_get_user_info(code, request)
+            else:
+                raise NotImplementedError("Apple OAuth requires additional configuration")
+
+            # Same find, link or create path as the sync view
+            user = await sync_to_async(oauth_user)(provider, user_info)
+
+            return HttpResponseRedirect(oauth_success_url(user))
+
+        except Exception as e:
+            return HttpResponseRedirect(oauth_error_url(str(e)))
+
+    async def _exchange(self, provider, token_data):
+        endpoints = provider_endpoints(provider)
+        client = get_http_client()
+
+        with external_call('oauth'):
+            token_response = await client.post(endpoints['token'], data=token_data)
+        token_response.raise_for_status()
+        tokens = token_response.json()
+
+        # Verify the id_token locally instead of calling userinfo (off the event
+        # loop: a cold JWKS cache means a blocking fetch)
+        if tokens.get('id_token'):
+            return await sync_to_async(verify_id_token, thread_sensitive=False)(
+                tokens['id_token'], provider, endpoints['jwks'], token_data['client_id'], endpoints['issuers'],
+            )
+
+        with external_call('oauth'):
+            user_response = await client.get(endpoints['userinfo'],
+                                             headers={'Authorization': f"Bearer {tokens['access_token']}"})
+        user_response.raise_for_status()
+        return user_response.json()
+
+    async def _google_get_user_info(self, code, request):
+        redirect_uri = f"{request.scheme}://{request.get_host()}/api/auth/oauth/google/callback/"
+        return await self._exchange('google', {
+            'code': code,
+            'client_id': getattr(settings, 'GOOGLE_CLIENT_ID', ''),
+            'client_secret': getattr(settings, 'GOOGLE_CLIENT_SECRET', ''),
+            'redirect_uri': redirect_uri,
+            'grant_type': 'authorization_code',
+        })
+
+    async def _microsoft_get_user_info(self, code, request):
+        redirect_uri = f"{request.scheme}://{request.get_host()}/api/auth/oauth/microsoft/callback/"
+        return microsoft_user_info(await self._exchange('microsoft', {
+            'code': code,
+            'client_id': getattr(settings, 'MICROSOFT_CLIENT_ID', ''),
+            'client_secret': getattr(settings, 'MICROSOFT_CLIENT_SECRET', ''),
+            'redirect_uri': redirect_uri,
+            'grant_type': 'authorization_code',
+        }))
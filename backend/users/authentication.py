@@ -0,0 +1,51 @@
+"""
+JWT authentication backed by the per-process user cache
+"""
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from .user_cache import get_user_cache
+
+
+def token_user_id(validated_token):
+    """User id claim of a validated token"""
+    try:
+        return validated_token[api_settings.USER_ID_CLAIM]
+    except KeyError as e:
+        raise InvalidToken(_("Token contained no recognizable user identification")) from e
+
+
+def check_user(user, validated_token):
+    """The checks simplejwt applies after loading the user, for cache hits"""
+    if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+        raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+    if api_settings.CHECK_REVOKE_TOKEN:
+        if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+            raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that serves users from the user cache
+
+    Only a cache miss queries the users table; the row is cached for
+    USER_CACHE_TTL_SECONDS or until the user is saved or deleted.
+    """
+
+    def get_user(self, validated_token):
+        user_id = token_user_id(validated_token)
+        user_cache = get_user_cache()
+
+        user = user_cache.get(user_id)
+        if user is not None:
+            check_user(user, validated_token)
+            return user
+
+        generation = user_cache.generation
+        user = super().get_user(validated_token)
+        user_cache.set(user_id, user, generation)
+        return user
@@ -1,6 +1,8 @@
 from django.contrib.auth.backends import ModelBackend
 from django.contrib.auth import get_user_model
 
+from .hashing import HashingPoolSaturated, run_dummy_hash, verify_password
+
 User = get_user_model()
 
 
@@ -15,14 +17,29 @@ class EmailBackend(ModelBackend):
         if email is None or password is None:
             return None
         
+        try:
+            return self.authenticate_email(email, password)
+        except HashingPoolSaturated:
+            # Outside DRF (e.g. the admin login) this APIException would be a
+            # 500, so a saturated pool just fails the attempt here; LoginView
+            # calls authenticate_email() itself and answers 503
+            return None
+    
+    def authenticate_email(self, email, password):
+        """
+        Active user with this email and password, or None
+        
+        Raises:
+            HashingPoolSaturated: if the hashing pool has no free slot
+        """
         try:
             user = User.objects.get(email=email)
         except User.DoesNotExist:
             # Run the default password hasher once to reduce timing attacks
-            User().set_password(password)
+            run_dummy_hash(password)
             return None
         
-        if user.check_password(password) and self.user_can_authenticate(user):
+        if verify_password(user, password) and self.user_can_authenticate(user):
             return user
         
         return None
@@ -1,75 +1,237 @@
 """
 Email service utility - supports multiple email providers
+
+Transports are long-lived and shared across threads: Django backend connections
+(SMTP in production) are kept open in a small pool and reused between messages,
+and SendGrid calls go through one keep-alive HTTP session, so an OTP email no
+longer pays for a fresh TCP/TLS handshake.
 """
 from django.conf import settings
-from django.core.mail import send_mail as django_send_mail
-import os
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+import queue
+import smtplib
+import threading
+import time
+
 
+class SMTPConnectionPool:
+    """
+    Thread-safe pool of open Django email backend connections
 
-def send_email(to_email, subject, message):
+    Connections are opened lazily up to `size`, checked with NOOP when they have
+    been idle longer than `keepalive` seconds, and replaced transparently when the
+    server has dropped them.
+    """
+
+    def __init__(self, size=2, keepalive=60):
+        self.size = size
+        self.keepalive = keepalive
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _new_connection(self):
+        connection = get_connection(fail_silently=False)
+        connection.open()
+        return connection
+
+    def _is_alive(self, connection):
+        smtp = getattr(connection, 'connection', None)
+        if smtp is None:
+            # Non-SMTP backends (console, locmem) have nothing to keep alive
+            return not hasattr(connection, 'connection')
+        try:
+            return smtp.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    def acquire(self, timeout=30):
+        """Borrow a connection, opening a new one if the pool is not full"""
+        while True:
+            try:
+                connection, idle_since = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            if time.monotonic() - idle_since < self.keepalive or self._is_alive(connection):
+                return connection
+            self.discard(connection)
+
+        with self._lock:
+            can_create = self._created < self.size
+            if can_create:
+                self._created += 1
+        if can_create:
+            try:
+                return self._new_connection()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+
+        connection, _ = self._idle.get(timeout=timeout)
+        return connection
+
+    def release(self, connection):
+        """Return a healthy connection to the pool"""
+        self._idle.put((connection, time.monotonic()))
+
+    def discard(self, connection):
+        """Close a broken connection and free its slot"""
+        try:
+            connection.close()
+        except Exception:
+            pass
+        with self._lock:
+            self._created -= 1
+
+    def send(self, message):
+        """Send an EmailMessage, reconnecting once if the pooled connection is dead"""
+        for attempt in range(2):
+            connection = self.acquire()
+            try:
+                message.connection = connection
+                sent = connection.send_messages([message])
+            except (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, OSError):
+                self.discard(connection)
+                if attempt:
+                    raise
+                continue
+            except Exception:
+                self.discard(connection)
+                raise
+            self.release(connection)
+            return sent
+
+    def close(self):
+        """Close every idle connection"""
+        while True:
+            try:
+                connection, _ = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            self.discard(connection)
+
+
+_smtp_pool = None
+_sendgrid_session = None
+_transport_lock = threading.Lock()
+
+
+def get_smtp_pool():
+    """Return the process-wide connection pool for Django's email backend"""
+    global _smtp_pool
+
+    if _smtp_pool is None:
+        with _transport_lock:
+            if _smtp_pool is None:
+                _smtp_pool = SMTPConnectionPool(
+                    size=getattr(settings, 'EMAIL_POOL_SIZE', 2),
+                    keepalive=getattr(settings, 'EMAIL_POOL_KEEPALIVE_SECONDS', 60),
+                )
+    return _smtp_pool
+
+
+def get_sendgrid_session():
+    """Return the shared keep-alive HTTP session for the SendGrid API"""
+    global _sendgrid_session
+
+    if _sendgrid_session is None:
+        with _transport_lock:
+            if _sendgrid_session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=getattr(settings, 'EMAIL_POOL_SIZE', 2))
+                session.mount('https://', adapter)
+                session.headers['Authorization'] = f"Bearer {getattr(settings, 'SENDGRID_API_KEY', '')}"
+                _sendgrid_session = session
+    return _sendgrid_session
+
+
+def close_transports():
+    """Close pooled connections (used on settings changes and in tests)"""
+    global _smtp_pool, _sendgrid_session
+
+    with _transport_lock:
+        pool, session = _smtp_pool, _sendgrid_session
+        _smtp_pool = _sendgrid_session = None
+    if pool is not None:
+        pool.close()
+    if session is not None:
+        session.close()
+
+
+@receiver(setting_changed)
+def _reset_transports(setting, **kwargs):
+    if setting.startswith(('EMAIL_', 'SENDGRID_')):
+        close_transports()
+
+
+def send_email(to_email, subject, message, html_message=None, fail_silently=True):
     """
     Send email using configured email service
     Supports: Django email backend, SendGrid API
+
+    With fail_silently=False provider errors are raised instead of returning False
     """
     email_service = getattr(settings, 'EMAIL_SERVICE', 'django')
-    
+
     if email_service == 'sendgrid':
-        return send_via_sendgrid(to_email, subject, message)
+        send = send_via_sendgrid
     else:
         # Use Django's default email backend
-        return send_via_django(to_email, subject, message)
-
+        send = send_via_django
 
-def send_via_django(to_email, subject, message):
-    """Send email using Django's email backend"""
     try:
-        from_email = getattr(settings, 'DEFAULT_FROM_EMAIL', 'noreply@trueneed.com')
-        django_send_mail(
-            subject,
-            message,
-            from_email,
-            [to_email],
-            fail_silently=False,
-        )
-        return True
+        return send(to_email, subject, message, html_message)
     except Exception as e:
-        print(f"Django email failed: {str(e)}")
+        if not fail_silently:
+            raise
+        print(f"Email sending failed ({email_service}): {str(e)}")
         return False
 
 
-def send_via_sendgrid(to_email, subject, message):
-    """Send email using SendGrid API"""
-    try:
-        from sendgrid import SendGridAPIClient
-        from sendgrid.helpers.mail import Mail, Email, To, Content
-        
-        api_key = getattr(settings, 'SENDGRID_API_KEY', '')
-        if not api_key:
-            print("SendGrid API key not configured")
-            return False
-        
-        from_email = Email(
-            getattr(settings, 'SENDGRID_FROM_EMAIL', 'noreply@trueneed.com'),
-            getattr(settings, 'SENDGRID_FROM_NAME', 'TrueNeed')
-        )
-        to_email_obj = To(to_email)
-        content = Content("text/plain", message)
-        
-        mail = Mail(from_email, to_email_obj, subject, content)
-        
-        sg = SendGridAPIClient(api_key)
-        response = sg.client.mail.send.post(request_body=mail.get())
-        
-        if response.status_code in [200, 201, 202]:
-            print(f"SendGrid email sent successfully to {to_email}")
-            return True
-        else:
-            print(f"SendGrid failed with status: {response.status_code}")
-            return False
-            
-    except Exception as e:
-        print(f"SendGrid error: {str(e)}")
-        return False
+def send_via_django(to_email, subject, message, html_message=None):
+    """Send email using Django's email backend over a pooled connection"""
+    from_email = getattr(settings, 'DEFAULT_FROM_EMAIL', 'noreply@trueneed.com')
+    email = EmailMultiAlternatives(subject, message, from_email, [to_email])
+    if html_message:
+        email.attach_alternative(html_message, 'text/html')
+
+    return get_smtp_pool().send(email) == 1
+
+
+def send_via_sendgrid(to_email, subject, message, html_message=None):
+    """Send email using SendGrid's v3 API over the shared HTTP session"""
+    api_key = getattr(settings, 'SENDGRID_API_KEY', '')
+    if not api_key:
+        raise RuntimeError("SendGrid API key not configured")
+
+    content = [{'type': 'text/plain', 'value': message}]
+    if html_message:
+        content.append({'type': 'text/html', 'value': html_message})
+
+    payload = {
+        'personalizations': [{'to': [{'email': to_email}]}],
+        'from': {
+            'email': getattr(settings, 'SENDGRID_FROM_EMAIL', 'noreply@trueneed.com'),
+            'name': getattr(settings, 'SENDGRID_FROM_NAME', 'TrueNeed'),
+        },
+        'subject': subject,
+        'content': content,
+    }
+
+    response = get_sendgrid_session().post(
+        'https://api.sendgrid.com/v3/mail/send',
+        json=payload,
+        timeout=(5, 15),
+    )
+    if response.status_code not in [200, 201, 202]:
+        raise RuntimeError(f"SendGrid failed with status: {response.status_code}")
+    return True
 
 
 def send_via_twilio_sms(phone_number, message):
@@ -1,37 +1,135 @@
 """
 Firebase utilities for phone authentication and SMS OTP
+
+The Admin SDK (and the google-auth/cryptography stack under it) is imported
+and initialized on first use rather than at import, so process start and
+management commands don't pay for it. Verified ID tokens are cached
+in-process by token hash until they expire, so a client retrying with the same
+token costs a dictionary lookup instead of a signature check. The SDK itself
+caches Google's signing certificates (per their Cache-Control) on the app, which
+is created once per process.
 """
-import firebase_admin
-from firebase_admin import credentials, auth
 from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+import copy
+import hashlib
 import os
+import threading
+import time
+
+from .metrics import external_call
+
+_app = None
+# Monotonic time before which a failed initialization isn't retried
+_retry_at = 0.0
+_init_lock = threading.Lock()
 
-# Initialize Firebase Admin SDK (only once)
-_firebase_initialized = False
 
 def initialize_firebase():
-    """Initialize Firebase Admin SDK with service account credentials"""
-    global _firebase_initialized
+    """
+    Initialize the Firebase Admin SDK once per process; returns the app, or None if unavailable
+
+    Only success is kept for good: after a failure (e.g. the credentials
+    aren't mounted yet) the next call after FIREBASE_INIT_RETRY_SECONDS tries again.
+    """
+    global _app, _retry_at
     
-    if _firebase_initialized:
-        return
+    if _app is not None or time.monotonic() < _retry_at:
+        return _app
     
-    try:
-        cred_path = os.path.join(settings.BASE_DIR, 'firebase-credentials.json')
+    with _init_lock:
+        if _app is not None or time.monotonic() < _retry_at:
+            return _app
         
-        if not os.path.exists(cred_path):
-            print(f"⚠️  Firebase credentials not found at: {cred_path}")
+        try:
+            cred_path = os.path.join(settings.BASE_DIR, 'firebase-credentials.json')
+            
+            if not os.path.exists(cred_path):
+                print(f"⚠️  Firebase credentials not found at: {cred_path}")
+                print("📝 Phone OTP will return code in response instead of sending SMS")
+                return None
+            
+            import firebase_admin
+            from firebase_admin import credentials
+            
+            cred = credentials.Certificate(cred_path)
+            _app = firebase_admin.initialize_app(cred)
+            print("✅ Firebase Admin SDK initialized successfully")
+            
+        except Exception as e:
+            print(f"❌ Firebase initialization failed: {str(e)}")
             print("📝 Phone OTP will return code in response instead of sending SMS")
-            return
-        
-        cred = credentials.Certificate(cred_path)
-        firebase_admin.initialize_app(cred)
-        _firebase_initialized = True
-        print("✅ Firebase Admin SDK initialized successfully")
         
-    except Exception as e:
-        print(f"❌ Firebase initialization failed: {str(e)}")
-        print("📝 Phone OTP will return code in response instead of sending SMS")
+        finally:
+            if _app is None:
+                _retry_at = time.monotonic() + getattr(settings, 'FIREBASE_INIT_RETRY_SECONDS', 60)
+    
+    return _app
+
+
+class VerifiedTokenCache:
+    """Thread-safe map of ID token hash -> decoded claims, each kept until the token's exp"""
+    
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._entries = {}
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def key(id_token):
+        return hashlib.sha256(id_token.encode()).hexdigest()
+    
+    def get(self, id_token):
+        entry = self._entries.get(self.key(id_token))
+        if entry is None or entry[0] <= time.time():
+            return None
+        # Callers get their own copy of the claims
+        return copy.deepcopy(entry[1])
+    
+    def set(self, id_token, decoded):
+        exp = decoded.get('exp')
+        if self.maxsize <= 0 or not isinstance(exp, (int, float)) or exp <= time.time():
+            return
+        with self._lock:
+            if len(self._entries) >= self.maxsize:
+                now = time.time()
+                for key in [key for key, (expires, _) in self._entries.items() if expires <= now]:
+                    del self._entries[key]
+                # Still full of live tokens: drop the ones expiring soonest
+                while len(self._entries) >= self.maxsize:
+                    del self._entries[min(self._entries, key=lambda key: self._entries[key][0])]
+            self._entries[self.key(id_token)] = (exp, copy.deepcopy(decoded))
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+    
+    def __len__(self):
+        return len(self._entries)
+
+
+_token_cache = None
+_token_cache_lock = threading.Lock()
+
+
+def get_token_cache():
+    """Return the process-wide verified token cache, creating it on first use"""
+    global _token_cache
+    
+    if _token_cache is None:
+        with _token_cache_lock:
+            if _token_cache is None:
+                _token_cache = VerifiedTokenCache(getattr(settings, 'FIREBASE_TOKEN_CACHE_SIZE', 1024))
+    return _token_cache
+
+
+@receiver(setting_changed)
+def _reset_token_cache(setting, **kwargs):
+    global _token_cache
+    
+    if setting == 'FIREBASE_TOKEN_CACHE_SIZE':
+        _token_cache = None
 
 
 def send_sms_otp(phone_number, otp):
@@ -68,13 +166,23 @@ def verify_phone_token(id_token):
     Returns:
         dict: Decoded token with user info
     """
-    initialize_firebase()
+    token_cache = get_token_cache()
+    decoded_token = token_cache.get(id_token)
+    if decoded_token is not None:
+        return decoded_token
+    
+    app = initialize_firebase()
     
-    if not _firebase_initialized:
+    if app is None:
         return None
     
+    from firebase_admin import auth
+    
     try:
-        decoded_token = auth.verify_id_token(id_token)
+        with external_call('firebase'):
+            decoded_token = auth.verify_id_token(id_token, app=app)
+        # Failures are never cached; a valid token is good until its exp
+        token_cache.set(id_token, decoded_token)
         return decoded_token
     except Exception as e:
         print(f"Token verification failed: {str(e)}")
@@ -91,18 +199,16 @@ def create_custom_token(uid):
     Returns:
         str: Custom token
     """
-    initialize_firebase()
+    app = initialize_firebase()
     
-    if not _firebase_initialized:
+    if app is None:
         return None
     
+    from firebase_admin import auth
+    
     try:
-        custom_token = auth.create_custom_token(uid)
+        custom_token = auth.create_custom_token(uid, app=app)
         return custom_token.decode('utf-8')
     except Exception as e:
         print(f"Custom token creation failed: {str(e)}")
         return None
-
-
-# Initialize on module import
-initialize_firebase()
@@ -0,0 +1,187 @@
+"""
+Bounded password-hashing pool
+
+PBKDF2 is deliberately slow. Running it on whatever thread serves the request
+lets a login burst occupy every worker, so all hashing goes through one
+size-limited pool instead: at most HASHING_POOL_WORKERS hashes run at once,
+at most HASHING_POOL_QUEUE more may wait, and anything beyond that is rejected
+immediately with a 503. By default the pool admits half of the server's request
+threads (SERVER_THREADS), so cheap endpoints such as /me/ keep a thread even
+while logins pile up; a hash that waits longer than HASHING_POOL_TIMEOUT is
+answered with the same 503 instead of holding its thread.
+"""
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from django.conf import settings
+from django.contrib.auth import hashers
+from rest_framework import status
+from rest_framework.exceptions import APIException
+import asyncio
+import os
+import threading
+
+from . import metrics
+
+
+class HashingPoolSaturated(APIException):
+    """Raised when the hashing pool has no free slot, or a hash waited too long"""
+
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Server is busy, please retry shortly.'
+    default_code = 'hashing_saturated'
+    # DRF turns `wait` into a Retry-After header
+    wait = 1
+
+
+class HashingPool:
+    """Fixed-size worker pool with a bounded queue and fast rejection"""
+
+    def __init__(self, workers, queue_size, timeout=5):
+        self.workers = workers
+        self.capacity = workers + queue_size
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='hashing')
+        self._slots = threading.BoundedSemaphore(self.capacity)
+        self._lock = threading.Lock()
+        self._outstanding = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    @property
+    def queue_depth(self):
+        """Hashes waiting for a worker (excluding those running)"""
+        return max(self._outstanding - self.workers, 0)
+
+    @property
+    def in_flight(self):
+        """Hashes running or queued"""
+        return self._outstanding
+
+    def _release(self, future):
+        with self._lock:
+            self._outstanding -= 1
+        self._slots.release()
+
+    def submit(self, fn, *args):
+        """Queue fn(*args) on the pool; raises HashingPoolSaturated when full"""
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise HashingPoolSaturated()
+
+        with self._lock:
+            self._outstanding += 1
+        try:
+            future = self._executor.submit(fn, *args)
+        except Exception:
+            self._release(None)
+            raise
+        future.add_done_callback(self._release)
+        return future
+
+    def _timed_out(self):
+        with self._lock:
+            self.timed_out += 1
+        return HashingPoolSaturated()
+
+    def run(self, fn, *args):
+        """Run fn(*args) on the pool and wait for the result; raises HashingPoolSaturated on timeout"""
+        future = self.submit(fn, *args)
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            # A queued hash is dropped; a running one finishes and frees its slot
+            future.cancel()
+            raise self._timed_out()
+
+    async def arun(self, fn, *args):
+        """Run fn(*args) on the pool and await the result without blocking the event loop"""
+        future = self.submit(fn, *args)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except asyncio.TimeoutError:
+            raise self._timed_out()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_hashing_pool():
+    """Return the process-wide hashing pool, creating it on first use"""
+    global _pool
+
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                # Hashes hold their request thread, so leave at least half of
+                # the server's threads to requests that don't hash
+                capacity = max(getattr(settings, 'SERVER_THREADS', 8) // 2, 1)
+                workers = getattr(settings, 'HASHING_POOL_WORKERS', None) or min(os.cpu_count() or 2, capacity)
+                queue_size = getattr(settings, 'HASHING_POOL_QUEUE', None)
+                _pool = HashingPool(
+                    workers=workers,
+                    queue_size=max(capacity - workers, 0) if queue_size is None else queue_size,
+                    timeout=getattr(settings, 'HASHING_POOL_TIMEOUT', 5),
+                )
+    return _pool
+
+
+def _sample(attribute):
+    # Read the pool if it exists; a scrape shouldn't start its threads
+    return lambda: getattr(_pool, attribute) if _pool is not None else 0
+
+
+metrics.Sampled('hashing_pool_queue_depth', 'Password hashes waiting for a hashing worker', 'gauge',
+                _sample('queue_depth'))
+metrics.Sampled('hashing_pool_in_flight', 'Password hashes running or queued', 'gauge', _sample('in_flight'))
+metrics.Sampled('hashing_pool_rejected_total', 'Password hashes rejected because the pool was full', 'counter',
+                _sample('rejected'))
+metrics.Sampled('hashing_pool_timed_out_total', 'Password hashes given up on after HASHING_POOL_TIMEOUT', 'counter',
+                _sample('timed_out'))
+
+
+def hash_password(password):
+    """make_password() on the hashing pool"""
+    return get_hashing_pool().run(hashers.make_password, password)
+
+
+def verify_password(user, password):
+    """
+    user.check_password() on the hashing pool
+
+    Only the hash comparison runs on the pool; if the stored hash needs
+    upgrading (new iteration count) it is re-hashed and saved here.
+    """
+    outdated = []
+    valid = get_hashing_pool().run(hashers.check_password, password, user.password, outdated.append)
+
+    if valid and outdated:
+        user.password = hash_password(password)
+        user.save(update_fields=['password'])
+    return valid
+
+
+def run_dummy_hash(password):
+    """Spend one hash on an unknown account so response time does not leak existence"""
+    hash_password(password)
+
+
+async def ahash_password(password):
+    """Async hash_password()"""
+    return await get_hashing_pool().arun(hashers.make_password, password)
+
+
+async def averify_password(user, password):
+    """Async verify_password()"""
+    outdated = []
+    valid = await get_hashing_pool().arun(hashers.check_password, password, user.password, outdated.append)
+
+    if valid and outdated:
+        user.password = await ahash_password(password)
+        await user.asave(update_fields=['password'])
+    return valid
+
+
+async def arun_dummy_hash(password):
+    """Async run_dummy_hash()"""
+    await ahash_password(password)
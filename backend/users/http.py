@@ -0,0 +1,83 @@
+"""
+Shared HTTP sessions for OAuth providers
+
+Each provider gets one requests.Session per process whose keep-alive pool is
+reused by every callback, so an OAuth login no longer pays two fresh TCP+TLS
+handshakes. Every request carries OAUTH_HTTP_TIMEOUT (connect, read) unless the
+caller passes its own, so a stalled provider can't hold a worker indefinitely.
+
+Retries follow urllib3's rules: failures to connect are retried for any method
+(nothing reached the provider), while read errors and 502/503/504 responses are
+retried only for idempotent methods. The authorization-code POST is therefore
+never replayed, since codes are single-use.
+
+requests is imported with the first session, not at startup.
+"""
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+import threading
+
+# (connect, read) seconds; connect is just over a TCP retransmission window
+DEFAULT_TIMEOUT = (3.05, 10)
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def _new_session():
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    retries = getattr(settings, 'OAUTH_HTTP_RETRIES', 2)
+    adapter = HTTPAdapter(
+        pool_connections=1,
+        pool_maxsize=getattr(settings, 'OAUTH_HTTP_POOL_SIZE', 10),
+        max_retries=Retry(
+            total=retries,
+            connect=retries,
+            read=retries,
+            status=retries,
+            backoff_factor=0.2,
+            status_forcelist=(502, 503, 504),
+            # Hand the last response back to the caller (raise_for_status) once retries run out
+            raise_on_status=False,
+        ),
+    )
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def get_session(provider):
+    """Return the process-wide keep-alive session for provider, creating it on first use"""
+    session = _sessions.get(provider)
+    if session is None:
+        with _sessions_lock:
+            session = _sessions.get(provider)
+            if session is None:
+                session = _sessions[provider] = _new_session()
+    return session
+
+
+def request(provider, method, url, **kwargs):
+    """requests' Session.request on the provider's pooled session, with the default timeout"""
+    kwargs.setdefault('timeout', tuple(getattr(settings, 'OAUTH_HTTP_TIMEOUT', DEFAULT_TIMEOUT)))
+    return get_session(provider).request(method, url, **kwargs)
+
+
+def close_sessions():
+    """Close every pooled session (their connections are reopened on next use)"""
+    with _sessions_lock:
+        sessions = list(_sessions.values())
+        _sessions.clear()
+    for session in sessions:
+        session.close()
+
+
+@receiver(setting_changed)
+def _reset_sessions(setting, **kwargs):
+    if setting.startswith('OAUTH_HTTP_'):
+        close_sessions()
@@ -0,0 +1,214 @@
+"""
+Local verification of OAuth id_tokens against cached provider JWKS
+
+The token endpoint returns a signed id_token next to the access token; it
+already names the user, so checking its signature locally replaces the
+userinfo / Graph /me round-trip the callback used to make.
+
+JWKSCache keeps each provider's signing keys for the Cache-Control max-age
+of the JWKS response. Once most of that lifetime has passed, a background
+thread refetches them, so logins keep verifying against the cached keys
+instead of waiting on the provider. Keys are never used past their
+expiry: a request arriving after it fetches them synchronously. A kid
+missing from the cache (the provider rotated keys) triggers a refetch,
+at most once per JWKS_MIN_REFETCH_SECONDS so made-up kids can't hammer
+the provider.
+
+PyJWT (and cryptography behind it) is imported on first use.
+"""
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+import logging
+import threading
+import time
+
+from . import http
+from .metrics import external_call
+
+logger = logging.getLogger(__name__)
+
+# Both providers sign id_tokens with RSA; anything else (e.g. "none") is rejected
+ALGORITHMS = ('RS256',)
+
+
+def max_age(headers):
+    """Seconds a response may be cached per its Cache-Control, or None if it doesn't say"""
+    directives = [part.strip().lower() for part in headers.get('Cache-Control', '').split(',')]
+    if 'no-store' in directives or 'no-cache' in directives:
+        return 0
+    for directive in directives:
+        name, _, value = directive.partition('=')
+        if name == 'max-age' and value.strip().isdigit():
+            return int(value)
+    return None
+
+
+class InvalidIdToken(Exception):
+    pass
+
+
+class _Keys:
+    def __init__(self, keys, ttl, refresh_ratio):
+        now = time.monotonic()
+        self.keys = keys
+        self.fetched_at = now
+        self.refresh_at = now + ttl * refresh_ratio
+        self.expires_at = now + ttl
+
+
+class JWKSCache:
+    """Signing keys per JWKS URL, kept for the response's Cache-Control lifetime"""
+
+    def __init__(self, default_ttl=3600, refresh_ratio=0.8, min_refetch=60):
+        self.default_ttl = default_ttl
+        self.refresh_ratio = refresh_ratio
+        self.min_refetch = min_refetch
+        self._entries = {}
+        self._fetch_lock = threading.Lock()
+        self._refreshing = set()
+        self._refreshing_lock = threading.Lock()
+
+    def get_key(self, provider, url, kid):
+        """PyJWK for kid from the provider's JWKS at url"""
+        entry = self._entries.get(url)
+        now = time.monotonic()
+        if entry is not None and now < entry.expires_at:
+            if now >= entry.refresh_at:
+                self.refresh_in_background(provider, url)
+            key = entry.keys.get(kid)
+            if key is not None:
+                return key
+            if now - entry.fetched_at < self.min_refetch:
+                raise InvalidIdToken('Unknown signing key')
+
+        key = self.fetch(provider, url, seen=entry).keys.get(kid)
+        if key is None:
+            raise InvalidIdToken('Unknown signing key')
+        return key
+
+    def fetch(self, provider, url, seen=None):
+        """Download the JWKS (once, if several threads ask at the same time)"""
+        import jwt
+
+        with self._fetch_lock:
+            entry = self._entries.get(url)
+            if entry is not None and entry is not seen:
+                # Another thread fetched while this one waited
+                return entry
+
+            with external_call('oauth'):
+                response = http.request(provider, 'GET', url)
+            response.raise_for_status()
+
+            keys = {}
+            for jwk in response.json().get('keys', []):
+                if jwk.get('use', 'sig') != 'sig' or 'kid' not in jwk:
+                    continue
+                try:
+                    keys[jwk['kid']] = jwt.PyJWK(jwk)
+                except jwt.PyJWKError:
+                    # Key types this verifier can't use
+                    continue
+
+            ttl = max_age(response.headers)
+            if ttl is None:
+                ttl = self.default_ttl
+            # Age says how long the response already sat in a shared cache
+            ttl = max(0, ttl - int(response.headers.get('Age', 0) or 0))
+            entry = self._entries[url] = _Keys(keys, ttl, self.refresh_ratio)
+            return entry
+
+    def refresh_in_background(self, provider, url):
+        with self._refreshing_lock:
+            if url in self._refreshing:
+                return
+            self._refreshing.add(url)
+        thread = threading.Thread(target=self._refresh, args=(provider, url, self._entries.get(url)),
+                                  name='jwks-refresh', daemon=True)
+        thread.start()
+
+    def _refresh(self, provider, url, seen):
+        try:
+            self.fetch(provider, url, seen=seen)
+        except Exception:
+            # The current keys stay in use until they expire
+            logger.warning("Background JWKS refresh from %s failed", url, exc_info=True)
+        finally:
+            with self._refreshing_lock:
+                self._refreshing.discard(url)
+
+    def clear(self):
+        self._entries.clear()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_jwks_cache():
+    """Return the process-wide JWKS cache, creating it on first use"""
+    global _cache
+
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = JWKSCache(
+                    default_ttl=getattr(settings, 'JWKS_DEFAULT_TTL_SECONDS', 3600),
+                    min_refetch=getattr(settings, 'JWKS_MIN_REFETCH_SECONDS', 60),
+                )
+    return _cache
+
+
+@receiver(setting_changed)
+def _reset_cache(setting, **kwargs):
+    global _cache
+
+    if setting.startswith('JWKS_'):
+        _cache = None
+
+
+def verify_id_token(id_token, provider, jwks_url, audience, issuers):
+    """
+    Verify an id_token's signature, audience, issuer and lifetime
+
+    Args:
+        issuers: accepted iss values; '{tid}' is filled from the token's tenant
+            id claim (Microsoft's multi-tenant issuer)
+
+    Returns:
+        dict: the token's claims
+
+    Raises:
+        InvalidIdToken: if the token can't be trusted
+    """
+    import jwt
+
+    try:
+        header = jwt.get_unverified_header(id_token)
+    except jwt.PyJWTError as e:
+        raise InvalidIdToken(str(e))
+    if header.get('alg') not in ALGORITHMS:
+        raise InvalidIdToken(f"Unsupported id_token algorithm: {header.get('alg')}")
+
+    key = get_jwks_cache().get_key(provider, jwks_url, header.get('kid'))
+    try:
+        claims = jwt.decode(
+            id_token,
+            key.key,
+            algorithms=list(ALGORITHMS),
+            audience=audience,
+            leeway=getattr(settings, 'ID_TOKEN_LEEWAY_SECONDS', 60),
+            options={'require': ['exp', 'iat', 'iss', 'aud', 'sub']},
+        )
+    except jwt.PyJWTError as e:
+        raise InvalidIdToken(str(e))
+
+    accepted = {issuer.replace('{tid}', str(claims.get('tid', ''))) for issuer in issuers}
+    if claims['iss'] not in accepted:
+        raise InvalidIdToken(f"Unexpected id_token issuer: {claims['iss']}")
+    # Microsoft sends no email_verified at all, which is why views.oauth_user()
+    # matches on the provider's ids and links by email only when it's verified
+    if claims.get('email_verified') is False:
+        raise InvalidIdToken('Email address is not verified')
+    return claims
@@ -0,0 +1,191 @@
+"""
+Content-addressed image store for profile pictures
+
+Images are written once under IMAGE_STORE_ROOT as <sha256>.<ext> (fanned out
+into two-character directories) and users reference them by a short URL
+instead of carrying base64 blobs in the users table. Identical uploads share
+one file. Files are immutable, so ProfileImageView serves them with the hash
+as a strong ETag and year-long cache headers.
+"""
+from django.conf import settings
+from django.core.files.uploadhandler import StopUpload, TemporaryFileUploadHandler
+from django.urls import Resolver404, resolve, reverse
+import base64
+import binascii
+import hashlib
+import io
+import os
+import re
+import tempfile
+from pathlib import Path
+
+CONTENT_TYPES = {
+    'png': 'image/png',
+    'jpg': 'image/jpeg',
+    'gif': 'image/gif',
+    'webp': 'image/webp',
+}
+
+KEY_PATTERN = r'[0-9a-f]{64}\.(?:png|jpg|gif|webp)'
+
+_DATA_URL = re.compile(r'^data:image/[\w.+-]+;base64,(?P<data>.*)$', re.DOTALL)
+
+CHUNK_SIZE = 64 * 1024
+
+
+class InvalidImage(ValueError):
+    """Upload is not a supported image or is too large"""
+
+
+def sniff_extension(head):
+    """File extension for the image type in the first bytes, or None"""
+    if head.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'png'
+    if head.startswith(b'\xff\xd8\xff'):
+        return 'jpg'
+    if head[:6] in (b'GIF87a', b'GIF89a'):
+        return 'gif'
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'webp'
+    return None
+
+
+def store_root():
+    return Path(getattr(settings, 'IMAGE_STORE_ROOT', Path(settings.BASE_DIR) / 'media' / 'images'))
+
+
+def max_bytes():
+    return getattr(settings, 'IMAGE_MAX_BYTES', 2 * 1024 * 1024)
+
+
+def path_for(key):
+    """Filesystem path of a stored image"""
+    return store_root() / key[:2] / key
+
+
+def store_file(fileobj, limit=None):
+    """
+    Stream an image into the store
+
+    Args:
+        fileobj: Binary file-like object positioned at the start of the image
+        limit: Maximum size in bytes (defaults to IMAGE_MAX_BYTES)
+
+    Returns:
+        str: The image key (<sha256>.<ext>)
+    """
+    limit = limit or max_bytes()
+    root = store_root()
+    root.mkdir(parents=True, exist_ok=True)
+
+    digest = hashlib.sha256()
+    size = 0
+    head = b''
+    # Temp file in the store itself so the final move is an atomic rename
+    fd, tmp_path = tempfile.mkstemp(dir=root, prefix='.upload-')
+    try:
+        with os.fdopen(fd, 'wb') as tmp:
+            while True:
+                chunk = fileobj.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > limit:
+                    raise InvalidImage(f"Image must be smaller than {limit // (1024 * 1024)}MB")
+                if len(head) < 16:
+                    head += chunk[:16 - len(head)]
+                digest.update(chunk)
+                tmp.write(chunk)
+
+        ext = sniff_extension(head)
+        if ext is None:
+            raise InvalidImage("Unsupported image type (use PNG, JPEG, GIF or WebP)")
+
+        key = f'{digest.hexdigest()}.{ext}'
+        final = path_for(key)
+        if final.exists():
+            os.unlink(tmp_path)
+        else:
+            final.parent.mkdir(exist_ok=True)
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, final)
+        return key
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+class CappedUploadHandler(TemporaryFileUploadHandler):
+    """
+    Spool every uploaded file to disk (never memory) and stop reading past limit
+
+    Check `exceeded` after parsing to tell a too-large upload from a missing one.
+    """
+
+    def __init__(self, request=None, limit=None):
+        super().__init__(request)
+        self.limit = limit or max_bytes()
+        self.received = 0
+        self.exceeded = False
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > self.limit:
+            self.exceeded = True
+            raise StopUpload(connection_reset=True)
+        return super().receive_data_chunk(raw_data, start)
+
+
+def decode_data_url(value):
+    """Bytes of a base64 data: URL"""
+    match = _DATA_URL.match(value)
+    if not match:
+        raise InvalidImage("Profile image must be a base64 data URL or an http(s) URL")
+    # Reject oversized payloads before decoding them
+    if len(match.group('data')) > max_bytes() * 4 // 3 + 4:
+        raise InvalidImage(f"Image must be smaller than {max_bytes() // (1024 * 1024)}MB")
+    try:
+        return base64.b64decode(match.group('data'), validate=True)
+    except (binascii.Error, ValueError):
+        raise InvalidImage("Profile image is not valid base64")
+
+
+def image_url(key):
+    """Short URL path the image is served from"""
+    return reverse('profile-image', kwargs={'key': key})
+
+
+def public_url(value):
+    """profile_image as sent to clients (store paths become absolute URLs)"""
+    if value and value.startswith('/'):
+        return getattr(settings, 'IMAGE_BASE_URL', '') + value
+    return value
+
+
+def normalize_profile_image(value):
+    """
+    Turn a client-supplied profile_image into what the users table stores
+
+    Data URLs are decoded into the store and replaced by their short URL;
+    external http(s) URLs and existing store URLs are kept; empty clears it.
+    """
+    if not value:
+        return None
+    if not isinstance(value, str):
+        raise InvalidImage("Profile image must be a base64 data URL or an http(s) URL")
+    if value.startswith('data:'):
+        return image_url(store_file(io.BytesIO(decode_data_url(value))))
+
+    # A store URL echoed back as received (absolute) or as stored (path)
+    base_url = getattr(settings, 'IMAGE_BASE_URL', '')
+    path = value[len(base_url):] if base_url and value.startswith(base_url) else value
+    if path.startswith('/'):
+        try:
+            if resolve(path).url_name == 'profile-image':
+                return path
+        except Resolver404:
+            pass
+    elif value.startswith(('http://', 'https://')) and len(value) <= 500:
+        return value
+    raise InvalidImage("Profile image must be a base64 data URL or an http(s) URL")
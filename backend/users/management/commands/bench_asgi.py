@@ -0,0 +1,203 @@
+import asyncio
+import json
+import os
+import statistics
+import tempfile
+import threading
+import time
+import types
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import AsyncClient, Client
+from django.test.utils import override_settings
+from django.urls import path
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from users import async_views, views
+from users.models import User
+
+ENDPOINTS = ('me', 'oauth', 'login')
+PASSWORD = 'Str0ng!Pass'
+
+
+class StubProviderHandler(BaseHTTPRequestHandler):
+    """OAuth token + userinfo endpoints that answer after a fixed delay"""
+
+    latency = 0.0
+
+    def _reply(self, payload):
+        time.sleep(self.latency)
+        body = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self._reply({'access_token': 'stub-token'})
+
+    def do_GET(self):
+        self._reply({'email': 'oauth-bench@example.com', 'name': 'OAuth Bench'})
+
+    def log_message(self, *args):
+        pass
+
+
+class StubProvider(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+
+def urlconf(module):
+    """URLconf serving the benchmarked endpoints from module"""
+    urls = types.ModuleType(f'bench_urls_{module.__name__}')
+    urls.urlpatterns = [
+        path('api/auth/login/', module.LoginView.as_view()),
+        path('api/auth/me/', module.UserDetailView.as_view()),
+        path('api/auth/oauth/<str:provider>/callback/', module.OAuthCallbackView.as_view()),
+    ]
+    return urls
+
+
+class Command(BaseCommand):
+    help = 'Benchmark concurrent auth API throughput under WSGI and ASGI (sync vs native async views)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=300,
+                            help='Requests per endpoint and server mode')
+        parser.add_argument('--concurrency', type=int, default=32,
+                            help='Requests in flight at once')
+        parser.add_argument('--latency-ms', type=float, default=50,
+                            help='Simulated OAuth provider round-trip time (per call)')
+        parser.add_argument('--endpoints', default='me,oauth',
+                            help=f'Comma-separated subset of {",".join(ENDPOINTS)} '
+                                 '(login is dominated by password hashing)')
+
+    def handle(self, *args, **options):
+        endpoints = [e for e in options['endpoints'].split(',') if e]
+        unknown = set(endpoints) - set(ENDPOINTS)
+        if unknown:
+            self.stderr.write(f"Unknown endpoints: {', '.join(sorted(unknown))}")
+            return
+
+        StubProviderHandler.latency = options['latency_ms'] / 1000
+        provider = StubProvider(('127.0.0.1', 0), StubProviderHandler)
+        threading.Thread(target=provider.serve_forever, daemon=True).start()
+        base = f'http://127.0.0.1:{provider.server_address[1]}'
+
+        with tempfile.TemporaryDirectory() as tmp:
+            # Throwaway file database so the run never touches real data
+            connection.settings_dict.setdefault('TEST', {})['NAME'] = os.path.join(tmp, 'bench.sqlite3')
+            old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+            try:
+                with mock.patch.dict(views.OAUTH_ENDPOINTS['google'], {
+                    'token': f'{base}/token',
+                    'userinfo': f'{base}/userinfo',
+                }), override_settings(FRONTEND_URL='http://frontend',
+                                       ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'],
+                                       REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': {}}):
+                    self.run_all(endpoints, options)
+            finally:
+                provider.shutdown()
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def run_all(self, endpoints, options):
+        count, concurrency = options['requests'], options['concurrency']
+        user = User.objects.create_user('bench@example.com', 'Bench User', PASSWORD)
+        access = str(RefreshToken.for_user(user).access_token)
+        # Returning OAuth user, so callbacks measure the provider round trips rather than signup races
+        User.objects.create_user('oauth-bench@example.com', 'OAuth Bench', PASSWORD)
+
+        modes = [
+            ('WSGI  sync views', urlconf(views), self.run_wsgi),
+            ('ASGI  sync views', urlconf(views), self.run_asgi),
+            ('ASGI  async views', urlconf(async_views), self.run_asgi),
+        ]
+
+        self.stdout.write(f"⚡ {count} requests per run, concurrency {concurrency}, "
+                          f"OAuth provider latency {options['latency_ms']:.0f} ms")
+        self.stdout.write(f"   {'endpoint':<8} {'server':<18} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9}")
+
+        for endpoint in endpoints:
+            for label, urls, run in modes:
+                batch = self.build_requests(endpoint, count, access)
+                with override_settings(ROOT_URLCONF=urls):
+                    elapsed, latencies = run(batch, concurrency)
+                latencies.sort()
+                p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+                self.stdout.write(f"   {endpoint:<8} {label:<18} {count / elapsed:9.1f} "
+                                  f"{statistics.median(latencies) * 1000:9.2f} {p95 * 1000:9.2f}")
+
+    def build_requests(self, endpoint, count, access):
+        """List of (method, path, body, headers, check) for one run"""
+        if endpoint == 'me':
+            headers = {'Authorization': f'Bearer {access}'}
+            return [('GET', '/api/auth/me/', '', headers, lambda r: r.status_code == 200)] * count
+
+        if endpoint == 'login':
+            body = json.dumps({'email': 'bench@example.com', 'password': PASSWORD})
+            return [('POST', '/api/auth/login/', body, {}, lambda r: r.status_code == 200)] * count
+
+        batch = []
+        for i in range(count):
+            state = f'bench-{time.monotonic_ns()}-{i}'
+            cache.set(f'oauth_state_{state}', 'google', 600)
+            batch.append((
+                'GET', f'/api/auth/oauth/google/callback/?code=c{i}&state={state}', '', {},
+                lambda r: r.status_code == 302 and 'error=' not in r['Location'],
+            ))
+        return batch
+
+    def verify(self, request, response):
+        if not request[4](response):
+            detail = response.get('Location', '')
+            raise RuntimeError(f"{request[0]} {request[1]} failed with {response.status_code} {detail}")
+
+    def run_wsgi(self, batch, concurrency):
+        """Thread-per-request, like a threaded WSGI server"""
+        local = threading.local()
+
+        def call(request):
+            if not hasattr(local, 'client'):
+                local.client = Client()
+            method, url, body, headers, _ = request
+            start = time.perf_counter()
+            response = local.client.generic(method, url, body, content_type='application/json', headers=headers)
+            latency = time.perf_counter() - start
+            self.verify(request, response)
+            return latency
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            latencies = list(pool.map(call, batch))
+        return time.perf_counter() - start, latencies
+
+    def run_asgi(self, batch, concurrency):
+        """All requests on one event loop, like a single ASGI worker"""
+        async def main():
+            client = AsyncClient()
+            slots = asyncio.Semaphore(concurrency)
+
+            async def call(request):
+                method, url, body, headers, _ = request
+                async with slots:
+                    started = time.perf_counter()
+                    response = await client.generic(method, url, body, content_type='application/json',
+                                                    headers=headers)
+                    latency = time.perf_counter() - started
+                self.verify(request, response)
+                return latency
+
+            start = time.perf_counter()
+            latencies = await asyncio.gather(*(call(request) for request in batch))
+            return time.perf_counter() - start, list(latencies)
+
+        return asyncio.run(main())
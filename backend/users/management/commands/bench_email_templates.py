@@ -0,0 +1,62 @@
+import timeit
+from html import escape
+
+from django.core.management.base import BaseCommand
+
+from users import email_templates
+from users.email_templates import render_email
+
+
+def filled_parts(template, values):
+    """The template's pieces with values in place, as an f-string holds them"""
+    parts = list(template._parts)
+    for index in range(1, len(parts), 2):
+        parts[index] = values[parts[index]]
+    return parts
+
+
+class Command(BaseCommand):
+    help = ('Micro-benchmark per-request email rendering: precompiled templates vs the floor an '
+            'inline f-string can reach (one join of the finished pieces per part)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--number', type=int, default=20000,
+                            help='Renders per measurement')
+        parser.add_argument('--repeat', type=int, default=5,
+                            help='Measurements to take (best is reported)')
+
+    def handle(self, *args, **options):
+        number = options['number']
+        repeat = options['repeat']
+        context = {'name': 'Ada <Lovelace>', 'otp': '123456', 'reset_link': 'http://localhost/reset?a=1&b=2'}
+
+        for name in email_templates.EMAIL_TEMPLATES:
+            _, text, html = email_templates._COMPILED[name]
+            # An f-string compiles to a single join of its pieces, so joining
+            # pre-filled pieces is what the old inline f-strings cost at best
+            text_parts = filled_parts(text, context)
+            html_parts = filled_parts(html, context)
+            raw_values = [context[field] for field in html.fields]
+
+            def floor():
+                return ''.join(text_parts), ''.join(html_parts)
+
+            def floor_escaped():
+                # The same, plus escaping each HTML value once (timing only)
+                [escape(value) for value in raw_values]
+                return ''.join(text_parts), ''.join(html_parts)
+
+            results = {
+                'f-string floor': min(timeit.repeat(floor, number=number, repeat=repeat)),
+                'floor + escape': min(timeit.repeat(floor_escaped, number=number, repeat=repeat)),
+                'precompiled': min(timeit.repeat(lambda: render_email(name, **context), number=number, repeat=repeat)),
+            }
+
+            self.stdout.write(f"\n📧 {name}")
+            baseline = results['f-string floor']
+            for label, total in results.items():
+                per_call_us = total / number * 1e6
+                self.stdout.write(f"   {label:<16} {per_call_us:8.2f} µs/render  ({total / baseline:4.2f}x floor)")
+        self.stdout.write("\nThe floor doesn't HTML-escape values (the old inline f-strings didn't either); "
+                          "precompiled escapes them and fills its slots in Python, a fixed cost per value "
+                          "that doesn't grow with the template")
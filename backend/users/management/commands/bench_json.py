@@ -0,0 +1,123 @@
+import contextlib
+import json
+import os
+import tempfile
+import time
+from unittest import mock
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from django.test.utils import override_settings
+from rest_framework import serializers
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.views import APIView
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from users import renderers, views
+from users.image_store import public_url
+from users.models import User
+from users.renderers import ORJSONParser, ORJSONRenderer
+
+PASSWORD = 'Str0ng!Pass'
+
+
+class LegacyUserSerializer(serializers.ModelSerializer):
+    """UserSerializer as it was before the hand-written version"""
+
+    profile_image = serializers.SerializerMethodField()
+    profile_thumbnails = serializers.SerializerMethodField()
+
+    class Meta:
+        model = User
+        fields = ['id', 'email', 'name', 'date_joined', 'oauth_provider', 'avatar_color', 'profile_image',
+                  'profile_thumbnails']
+        read_only_fields = ['id', 'date_joined']
+
+    def get_profile_image(self, obj):
+        return public_url(obj.profile_image)
+
+    def get_profile_thumbnails(self, obj):
+        if not obj.profile_thumbnails:
+            return None
+        return {size: public_url(path) for size, path in obj.profile_thumbnails.items()}
+
+
+class Command(BaseCommand):
+    help = 'Measure per-request CPU of login and /me/ with stock DRF JSON + ModelSerializer vs orjson + lean serializer'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000,
+                            help='Requests per endpoint and variant')
+
+    def handle(self, *args, **options):
+        if not renderers.ORJSON_AVAILABLE:
+            self.stderr.write("⚠️  orjson is not installed; the fast variant would fall back to stdlib JSON")
+
+        with tempfile.TemporaryDirectory() as tmp:
+            # Throwaway file database so the run never touches real data
+            connection.settings_dict.setdefault('TEST', {})['NAME'] = os.path.join(tmp, 'bench.sqlite3')
+            old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+            try:
+                # A cheap hasher keeps login about the request path rather than PBKDF2,
+                # and one client logging in thousands of times must not be throttled
+                with override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+                                       ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'],
+                                       REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': {}}):
+                    self.run_all(options['requests'])
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def run_all(self, count):
+        user = User.objects.create_user('bench@example.com', 'Bench User', PASSWORD)
+        User.objects.filter(pk=user.pk).update(
+            avatar_color='#10b981',
+            profile_image='/api/auth/images/' + '0' * 64 + '.webp/',
+            profile_thumbnails={'512': '/api/auth/images/' + '0' * 64 + '.webp/',
+                                '128': '/api/auth/images/' + '1' * 64 + '.webp/'},
+        )
+        access = str(RefreshToken.for_user(user).access_token)
+        login_body = json.dumps({'email': 'bench@example.com', 'password': PASSWORD})
+
+        variants = [
+            ('stock DRF JSON + ModelSerializer', JSONRenderer, JSONParser, LegacyUserSerializer),
+            ('orjson + lean serializer', ORJSONRenderer, ORJSONParser, views.UserSerializer),
+        ]
+        endpoints = [
+            ('me', lambda client: client.get('/api/auth/me/', headers={'Authorization': f'Bearer {access}'})),
+            ('login', lambda client: client.post('/api/auth/login/', login_body, content_type='application/json')),
+        ]
+
+        self.stdout.write(f"⚡ {count} requests per run (CPU time of this process, all threads)")
+        self.stdout.write(f"   {'endpoint':<8} {'variant':<34} {'µs/request':>11}")
+
+        for endpoint, call in endpoints:
+            baseline = None
+            for label, renderer, parser, serializer in variants:
+                # The views' progress prints go nowhere (they cost the same in both variants)
+                with mock.patch.object(APIView, 'renderer_classes', [renderer]), \
+                        mock.patch.object(APIView, 'parser_classes', [parser]), \
+                        mock.patch.object(views, 'UserSerializer', serializer), \
+                        open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                    per_request = self.measure(call, count)
+                baseline = baseline or per_request
+                self.stdout.write(f"   {endpoint:<8} {label:<34} {per_request * 1e6:11.1f}"
+                                  f"  ({baseline / per_request:.2f}x)")
+
+    def measure(self, call, count):
+        client = Client()
+        for _ in range(min(50, count)):
+            self.verify(call(client))
+
+        start = time.process_time()
+        for _ in range(count):
+            response = call(client)
+        elapsed = time.process_time() - start
+        self.verify(response)
+        return elapsed / count
+
+    def verify(self, response):
+        if response.status_code != 200:
+            raise RuntimeError(f"Request failed with {response.status_code}: {response.content[:200]!r}")
@@ -0,0 +1,197 @@
+import json
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from django.core.management.base import BaseCommand
+
+from users import http
+from users.id_tokens import verify_id_token
+
+
+class StubOAuthServer(ThreadingHTTPServer):
+    """
+    Local OAuth provider: POST /token, GET /userinfo, GET /jwks, GET /unavailable (503)
+
+    handshake_ms delays every new connection (standing in for TCP+TLS setup to
+    a real provider) and latency_ms every request; ?sleep=<seconds> stalls one.
+    When id_token is set the token response carries it, and /jwks serves jwks
+    with a max-age of jwks_max_age. Connections and requests are counted (paths
+    in order) so callers can see reuse.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, handshake_ms=0, latency_ms=0, email='stub@example.com'):
+        self.handshake_ms = handshake_ms
+        self.latency_ms = latency_ms
+        self.email = email
+        self.id_token = None
+        self.jwks = {'keys': []}
+        self.jwks_max_age = 3600
+        self.connections = 0
+        self.requests = 0
+        self.paths = []
+        self.lock = threading.Lock()
+        super().__init__(('127.0.0.1', 0), StubOAuthHandler)
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+
+    def url(self, path):
+        return f'http://127.0.0.1:{self.server_address[1]}{path}'
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class StubOAuthHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out as separate writes; don't let Nagle hold the body back
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+        time.sleep(self.server.handshake_ms / 1000)
+
+    def log_message(self, format, *args):
+        pass
+
+    def reply(self, status_code, data, headers=()):
+        body = json.dumps(data).encode()
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'application/json')
+        for name, value in headers:
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def handle_request(self):
+        url = urlsplit(self.path)
+        with self.server.lock:
+            self.server.requests += 1
+            self.server.paths.append(url.path)
+        # Drain the body so the connection can carry the next request
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+
+        sleep = float(parse_qs(url.query).get('sleep', ['0'])[0])
+        time.sleep(sleep + self.server.latency_ms / 1000)
+
+        if self.command == 'POST' and url.path == '/token':
+            tokens = {'access_token': 'stub-access-token', 'token_type': 'Bearer'}
+            if self.server.id_token:
+                tokens['id_token'] = self.server.id_token
+            self.reply(200, tokens)
+        elif self.command == 'GET' and url.path == '/jwks':
+            self.reply(200, self.server.jwks, [('Cache-Control', f'public, max-age={self.server.jwks_max_age}')])
+        elif self.command == 'GET' and url.path == '/userinfo':
+            if self.headers.get('Authorization') != 'Bearer stub-access-token':
+                self.reply(401, {'error': 'invalid_token'})
+            else:
+                self.reply(200, {'id': '1076915035', 'email': self.server.email, 'verified_email': True,
+                                 'name': 'Stub User'})
+        elif url.path == '/unavailable':
+            self.reply(503, {'error': 'unavailable'})
+        else:
+            self.reply(404, {'error': 'not_found'})
+
+    do_GET = do_POST = handle_request
+
+
+class FakeIssuer:
+    """RSA signing key that publishes a JWKS and mints Google-style id_tokens"""
+
+    issuer = 'https://accounts.google.com'
+
+    def __init__(self, kid='stub-key'):
+        from cryptography.hazmat.primitives.asymmetric import rsa
+
+        self.kid = kid
+        self.private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+    def jwk(self):
+        from jwt.algorithms import RSAAlgorithm
+
+        jwk = json.loads(RSAAlgorithm.to_jwk(self.private_key.public_key()))
+        jwk.update(kid=self.kid, use='sig', alg='RS256')
+        return jwk
+
+    def id_token(self, audience, email='stub@example.com', **claims):
+        import jwt
+
+        now = int(time.time())
+        payload = {
+            'iss': self.issuer, 'aud': audience, 'sub': '10769150350006150715113082367', 'iat': now,
+            'exp': now + 3600, 'email': email, 'email_verified': True, 'name': 'Stub User', **claims,
+        }
+        return jwt.encode(payload, self.private_key, algorithm='RS256', headers={'kid': self.kid})
+
+
+class Command(BaseCommand):
+    help = ('Time the OAuth callback\'s provider calls against a local stub: token exchange + userinfo with a '
+            'fresh connection per call, on the pooled keep-alive session, and with the id_token verified locally')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--logins', type=int, default=50,
+                            help='Token exchanges (one POST + one GET each) per variant')
+        parser.add_argument('--handshake-ms', type=float, default=40,
+                            help='Simulated connection setup (TCP + TLS to the provider)')
+        parser.add_argument('--latency-ms', type=float, default=5,
+                            help='Simulated provider processing time per request')
+
+    def handle(self, *args, **options):
+        import requests
+
+        server = StubOAuthServer(options['handshake_ms'], options['latency_ms'])
+        token_url, userinfo_url, jwks_url = server.url('/token'), server.url('/userinfo'), server.url('/jwks')
+        issuer = FakeIssuer()
+        server.jwks = {'keys': [issuer.jwk()]}
+        id_token = issuer.id_token('bench-client')
+
+        def fresh():
+            token = requests.post(token_url, data={'code': 'x'}).json()['access_token']
+            requests.get(userinfo_url, headers={'Authorization': f'Bearer {token}'}).json()
+
+        def pooled():
+            token = http.request('bench', 'POST', token_url, data={'code': 'x'}).json()['access_token']
+            http.request('bench', 'GET', userinfo_url, headers={'Authorization': f'Bearer {token}'}).json()
+
+        def local_id_token():
+            tokens = http.request('bench', 'POST', token_url, data={'code': 'x'}).json()
+            verify_id_token(tokens['id_token'], 'bench', jwks_url, 'bench-client', (FakeIssuer.issuer,))
+
+        self.stdout.write(f"🔑 {options['logins']} logins, {options['handshake_ms']:.0f} ms connection setup, "
+                          f"{options['latency_ms']:.0f} ms per request")
+        self.stdout.write(f"   {'client':<26} {'p50 ms':>8} {'p99 ms':>8} {'connections':>12}")
+        try:
+            variants = (
+                ('requests.post/get', fresh),
+                ('pooled session', pooled),
+                ('pooled + local id_token', local_id_token),
+            )
+            for label, login in variants:
+                # Only the last variant is handed an id_token to verify
+                server.id_token = id_token if login is local_id_token else None
+                server.connections = 0
+                timings = []
+                for _ in range(options['logins']):
+                    start = time.perf_counter()
+                    login()
+                    timings.append(time.perf_counter() - start)
+                self.stdout.write(f"   {label:<26} {statistics.median(timings) * 1000:8.2f} "
+                                  f"{p99(timings) * 1000:8.2f} {server.connections:12d}")
+        finally:
+            http.close_sessions()
+            server.stop()
+
+
+def p99(timings):
+    if len(timings) < 2:
+        return timings[0]
+    return statistics.quantiles(timings, n=100)[98]
@@ -0,0 +1,49 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from users import sms_utils
+
+
+class Command(BaseCommand):
+    help = 'Benchmark SMS OTP dispatch throughput against the local stub provider'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=200,
+                            help='Number of OTP messages to send')
+        parser.add_argument('--latency-ms', type=float, default=150,
+                            help='Simulated provider round-trip time')
+        parser.add_argument('--workers', type=int, default=8,
+                            help='SMS worker pool size for the async run')
+
+    def handle(self, *args, **options):
+        count = options['messages']
+        stub = {
+            'SMS_BACKEND': 'users.sms_utils.StubBackend',
+            'SMS_STUB_LATENCY_MS': options['latency_ms'],
+            'SMS_WORKERS': options['workers'],
+        }
+
+        with override_settings(**stub):
+            sms_utils.StubBackend.outbox.clear()
+
+            start = time.perf_counter()
+            for i in range(count):
+                sms_utils.send_sms_otp(f'+1555{i:07d}', '123456')
+            blocking = time.perf_counter() - start
+
+            sms_utils.StubBackend.outbox.clear()
+            executor = sms_utils.get_executor()
+            start = time.perf_counter()
+            for i in range(count):
+                sms_utils.dispatch_sms_otp(f'+1555{i:07d}', '123456')
+            caller = time.perf_counter() - start
+            executor.shutdown(wait=True)
+            drained = time.perf_counter() - start
+            sms_utils._executor = None
+
+        self.stdout.write(f"📱 {count} OTPs, {options['latency_ms']:.0f} ms provider latency")
+        self.stdout.write(f"   blocking send     {blocking / count * 1000:8.2f} ms/request  {count / blocking:8.1f} msg/s")
+        self.stdout.write(f"   async dispatch    {caller / count * 1000:8.2f} ms/request  {count / drained:8.1f} msg/s "
+                          f"({options['workers']} workers)")
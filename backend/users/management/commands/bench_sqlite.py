@@ -0,0 +1,126 @@
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connections, transaction
+from django.utils import timezone
+
+from users.models import User
+
+USERS = 200
+
+
+class Command(BaseCommand):
+    help = ('Benchmark concurrent /me/-style reads against login-style writes on stock SQLite '
+            '(rollback journal, connection per request) vs the configured database')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seconds', type=float, default=5,
+                            help='Duration of each run')
+        parser.add_argument('--readers', type=int, default=8,
+                            help='Threads fetching users, like /me/')
+        parser.add_argument('--writers', type=int, default=2,
+                            help='Threads updating last_login in a transaction, like login')
+
+    def handle(self, *args, **options):
+        configured = settings.DATABASES['default']
+        if 'sqlite' not in configured['ENGINE']:
+            self.stderr.write(f"DATABASES['default'] uses {configured['ENGINE']}; nothing to compare")
+            return
+
+        variants = [
+            ('stock sqlite3', {'ENGINE': 'django.db.backends.sqlite3'}),
+            (f"{configured['ENGINE']} (configured)", {
+                key: configured[key] for key in ('ENGINE', 'CONN_MAX_AGE', 'CONN_HEALTH_CHECKS', 'OPTIONS')
+                if key in configured
+            }),
+        ]
+
+        self.stdout.write(f"⚡ {options['seconds']:.0f}s per run, {options['readers']} readers, "
+                          f"{options['writers']} writers")
+        self.stdout.write(f"   {'database':<32} {'reads/s':>9} {'writes/s':>9} {'read p99 ms':>12} "
+                          f"{'write p99 ms':>13} {'locked':>7}")
+
+        with tempfile.TemporaryDirectory() as tmp:
+            for index, (label, database) in enumerate(variants):
+                # A fresh throwaway file per variant: WAL mode persists in the file
+                alias = f'bench_sqlite_{index}'
+                connections.settings[alias] = connections.configure_settings({
+                    'default': {**database, 'NAME': os.path.join(tmp, f'{alias}.sqlite3')},
+                })['default']
+                try:
+                    self.setup(alias)
+                    reads, writes, locked = self.run(alias, options)
+                finally:
+                    connections[alias].close()
+                    del connections.settings[alias]
+
+                seconds = options['seconds']
+                self.stdout.write(f"   {label:<32} {len(reads) / seconds:9.0f} {len(writes) / seconds:9.0f} "
+                                  f"{p99(reads) * 1000:12.2f} {p99(writes) * 1000:13.2f} {locked:7d}")
+
+    def setup(self, alias):
+        call_command('migrate', database=alias, verbosity=0)
+        User.objects.using(alias).bulk_create([
+            User(email=f'bench{i}@example.com', name=f'Bench {i}', password='!') for i in range(USERS)
+        ])
+        self.user_ids = list(User.objects.using(alias).values_list('pk', flat=True))
+
+    def run(self, alias, options):
+        deadline = time.monotonic() + options['seconds']
+        reads, writes = [], []
+        locked = [0]
+        lock = threading.Lock()
+
+        def request(operation, timings, offset):
+            """Loop one request shape, opening/closing connections like request_started/finished"""
+            db = connections[alias]
+            local, i = [], offset
+            try:
+                while time.monotonic() < deadline:
+                    db.close_if_unusable_or_obsolete()
+                    user_id = self.user_ids[i % len(self.user_ids)]
+                    i += 7
+                    start = time.perf_counter()
+                    try:
+                        operation(user_id)
+                    except OperationalError:
+                        with lock:
+                            locked[0] += 1
+                        continue
+                    finally:
+                        db.close_if_unusable_or_obsolete()
+                    local.append(time.perf_counter() - start)
+            finally:
+                db.close()
+            with lock:
+                timings.extend(local)
+
+        def read(user_id):
+            User.objects.using(alias).get(pk=user_id)
+
+        def write(user_id):
+            with transaction.atomic(using=alias):
+                user = User.objects.using(alias).get(pk=user_id)
+                User.objects.using(alias).filter(pk=user.pk).update(last_login=timezone.now())
+
+        threads = [threading.Thread(target=request, args=(read, reads, i)) for i in range(options['readers'])]
+        threads += [threading.Thread(target=request, args=(write, writes, i)) for i in range(options['writers'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return reads, writes, locked[0]
+
+
+def p99(latencies):
+    if not latencies:
+        return 0.0
+    if len(latencies) < 2:
+        return latencies[0]
+    return statistics.quantiles(latencies, n=100)[98]
@@ -0,0 +1,86 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Optional provider SDKs (and heavy helpers) that must only load on first use
+LAZY_MODULES = ('firebase_admin', 'google.auth', 'twilio', 'httpx', 'PIL', 'cryptography')
+
+# Run in a fresh interpreter: what a new worker does before serving its first request
+BOOT = """
+import json, sys, time
+start = time.perf_counter()
+import django
+django.setup()
+from django.urls import get_resolver
+get_resolver().url_patterns
+seconds = time.perf_counter() - start
+print(json.dumps({'seconds': seconds, 'modules': sorted(sys.modules)}))
+"""
+
+
+class Command(BaseCommand):
+    help = ('Measure cold start (django.setup() plus URL resolution) in fresh interpreters with -X importtime, '
+            'list the costliest packages, and fail over the budget or if an optional SDK loads at boot')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5,
+                            help='Fresh interpreters to start; the median is checked against the budget')
+        parser.add_argument('--budget-ms', type=float, default=400,
+                            help='Maximum median cold start in milliseconds')
+        parser.add_argument('--top', type=int, default=10,
+                            help='Packages to list by import time')
+
+    def handle(self, *args, **options):
+        timings, package_us, eager = [], defaultdict(int), set()
+        for _ in range(options['runs']):
+            seconds, modules, imports = self.boot()
+            timings.append(seconds)
+            eager.update(name for name in LAZY_MODULES if name in modules)
+            for name, self_us in imports:
+                package_us[name.split('.')[0]] += self_us
+
+        median_ms = statistics.median(timings) * 1000
+        self.stdout.write(f"⚡ Cold start over {options['runs']} run(s): median {median_ms:.0f} ms, "
+                          f"min {min(timings) * 1000:.0f} ms (budget {options['budget_ms']:.0f} ms)")
+        self.stdout.write(f"   {'package':<28} {'import ms':>10}")
+        ranked = sorted(package_us.items(), key=lambda item: item[1], reverse=True)
+        for package, total_us in ranked[:options['top']]:
+            self.stdout.write(f"   {package:<28} {total_us / options['runs'] / 1000:10.1f}")
+
+        failures = []
+        if eager:
+            failures.append(f"imported at startup (should load on first use): {', '.join(sorted(eager))}")
+        if median_ms > options['budget_ms']:
+            failures.append(f"cold start {median_ms:.0f} ms exceeds the {options['budget_ms']:.0f} ms budget")
+        if failures:
+            raise CommandError('; '.join(failures))
+        self.stdout.write("✅ Within the startup budget")
+
+    def boot(self):
+        """Start one interpreter; returns (seconds, module names, [(module, self µs)])"""
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': os.environ.get('DJANGO_SETTINGS_MODULE', 'config.settings')}
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', BOOT],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+        )
+        if result.returncode:
+            raise CommandError(f"Startup failed:\n{result.stderr[-2000:]}")
+
+        # Views may print while importing; the report is the last line
+        report = json.loads(result.stdout.strip().splitlines()[-1])
+
+        imports = []
+        for line in result.stderr.splitlines():
+            # "import time: self [us] | cumulative | imported package"
+            if not line.startswith('import time:'):
+                continue
+            self_us, _, name = line[len('import time:'):].split('|')
+            if self_us.strip().isdigit():
+                imports.append((name.strip(), int(self_us)))
+        return report['seconds'], set(report['modules']), imports
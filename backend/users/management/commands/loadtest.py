@@ -0,0 +1,272 @@
+import contextlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import Client
+from django.test.utils import override_settings
+
+from users.models import EmailOutbox, User
+
+PASSWORD = 'L0adTest!Pass'
+DOMAIN = 'loadtest.example.com'
+
+# Endpoints in flow order, with the status each must return
+FLOW = (
+    ('register', 200),
+    ('verify-otp', 201),
+    ('login', 200),
+    ('me', 200),
+    ('refresh', 200),
+    ('logout', 200),
+)
+
+_OTP = re.compile(r'\b(\d{6})\b')
+
+
+class InProcessSession:
+    """Django test client: the full middleware/view stack without a socket"""
+
+    def __init__(self, base_url=None):
+        self.client = Client()
+
+    def request(self, method, path, data=None, token=None):
+        headers = {'Authorization': f'Bearer {token}'} if token else {}
+        body = json.dumps(data) if data is not None else ''
+        response = self.client.generic(method, path, body, content_type='application/json', headers=headers)
+        return response.status_code, response.content
+
+    def close(self):
+        pass
+
+
+class HTTPSession:
+    """Keep-alive HTTP client against a running server"""
+
+    def __init__(self, base_url):
+        import httpx
+
+        self.client = httpx.Client(base_url=base_url, timeout=30)
+
+    def request(self, method, path, data=None, token=None):
+        headers = {'Authorization': f'Bearer {token}'} if token else {}
+        response = self.client.request(method, path, json=data, headers=headers)
+        return response.status_code, response.content
+
+    def close(self):
+        self.client.close()
+
+
+class FlowFailed(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ('Load-test the email auth flow (register -> verify-otp -> login -> me -> refresh -> logout) '
+            'with concurrent virtual users, report per-endpoint throughput and p50/p95/p99, and compare '
+            'against a saved baseline')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=50,
+                            help='Virtual users; each runs the whole flow once')
+        parser.add_argument('--concurrency', type=int, default=8,
+                            help='Virtual users running at once')
+        parser.add_argument('--url',
+                            help='Drive a running server (e.g. http://127.0.0.1:8000) instead of running '
+                                 'in-process. It must use this project\'s database, since OTPs are read '
+                                 'from the email outbox, and run with THROTTLING=False')
+        parser.add_argument('--baseline', default=str(Path(settings.BASE_DIR) / 'loadtest_baseline.json'),
+                            help='Baseline file to compare against (or write with --save-baseline)')
+        parser.add_argument('--save-baseline', action='store_true',
+                            help='Record this run as the baseline instead of comparing')
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help='Allowed regression before failing, as a fraction (0.25 = 25%%)')
+        parser.add_argument('--min-delta-ms', type=float, default=25.0,
+                            help='Ignore latency increases smaller than this (scheduling noise on fast endpoints)')
+
+    def handle(self, *args, **options):
+        config = {
+            'mode': 'http' if options['url'] else 'in-process',
+            'users': options['users'],
+            'concurrency': options['concurrency'],
+        }
+
+        if options['url']:
+            results, elapsed = self.run_flows(HTTPSession, options)
+        else:
+            results, elapsed = self.run_in_process(options)
+
+        report = self.report(results, elapsed, options['users'])
+        errors = sum(endpoint['errors'] for endpoint in report.values())
+
+        baseline_path = Path(options['baseline'])
+        if options['save_baseline']:
+            if errors:
+                raise CommandError(f"{errors} request(s) failed; not saving a baseline")
+            baseline_path.write_text(json.dumps({'config': config, 'endpoints': report}, indent=2) + '\n')
+            self.stdout.write(f"💾 Baseline saved to {baseline_path}")
+        elif baseline_path.exists():
+            self.compare(report, config, json.loads(baseline_path.read_text()), options['tolerance'],
+                         options['min_delta_ms'])
+        else:
+            self.stdout.write(f"No baseline at {baseline_path}; record one with --save-baseline")
+
+        if errors:
+            raise CommandError(f"{errors} request(s) failed")
+
+    def run_in_process(self, options):
+        with tempfile.TemporaryDirectory() as tmp:
+            # Throwaway file database so the run never touches real data
+            connection.settings_dict.setdefault('TEST', {})['NAME'] = os.path.join(tmp, 'loadtest.sqlite3')
+            old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+            try:
+                # Stub transports: mail stays in memory, SMS goes to the stub backend
+                with override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+                                       SMS_BACKEND='users.sms_utils.StubBackend',
+                                       ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'],
+                                       REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': {}}):
+                    return self.run_flows(InProcessSession, options)
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def run_flows(self, session_class, options):
+        run_id = uuid.uuid4().hex[:8]
+        results = {name: [] for name, _ in FLOW}
+        failures = []
+        lock = threading.Lock()
+        local = threading.local()
+
+        sessions = []
+
+        def virtual_user(index):
+            if not hasattr(local, 'session'):
+                local.session = session_class(options['url'])
+                with lock:
+                    sessions.append(local.session)
+            timings = {}
+            try:
+                self.flow(local.session, f'vu-{run_id}-{index}@{DOMAIN}', timings)
+            except FlowFailed as e:
+                with lock:
+                    failures.append(str(e))
+            finally:
+                connections.close_all()
+            with lock:
+                for name, timing in timings.items():
+                    results[name].append(timing)
+
+        start = time.perf_counter()
+        try:
+            # The views' progress prints go nowhere
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull), \
+                    ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+                list(pool.map(virtual_user, range(options['users'])))
+        finally:
+            elapsed = time.perf_counter() - start
+            for session in sessions:
+                session.close()
+            if options['url']:
+                self.clean_up(run_id)
+
+        for failure in failures[:5]:
+            self.stderr.write(f"   ❌ {failure}")
+        return results, elapsed
+
+    def flow(self, session, email, timings):
+        """Run one virtual user through the flow, recording (seconds, ok) per endpoint"""
+
+        def call(name, method, path, data=None, token=None):
+            started = time.perf_counter()
+            status_code, content = session.request(method, path, data, token)
+            expected = dict(FLOW)[name]
+            timings[name] = (time.perf_counter() - started, status_code == expected)
+            if status_code != expected:
+                raise FlowFailed(f"{name} for {email}: expected {expected}, got {status_code} {content[:120]!r}")
+            return json.loads(content) if content else {}
+
+        call('register', 'POST', '/api/auth/register/', {
+            'email': email, 'name': 'Load Test', 'password': PASSWORD, 'password2': PASSWORD,
+        })
+        body = call('verify-otp', 'POST', '/api/auth/verify-otp/', {'email': email, 'otp': self.read_otp(email)})
+        body = call('login', 'POST', '/api/auth/login/', {'email': email, 'password': PASSWORD})
+        access, refresh = body['tokens']['access'], body['tokens']['refresh']
+        call('me', 'GET', '/api/auth/me/', token=access)
+        access = call('refresh', 'POST', '/api/auth/token/refresh/', {'refresh': refresh})['access']
+        call('logout', 'POST', '/api/auth/logout/', {'refresh_token': refresh}, token=access)
+
+    def read_otp(self, email, timeout=10):
+        """OTP from the newest queued email to email (the outbox row exists once register commits)"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            body = EmailOutbox.objects.filter(to_email=email).order_by('-pk').values_list('body', flat=True).first()
+            match = _OTP.search(body or '')
+            if match:
+                return match.group(1)
+            time.sleep(0.05)
+        raise FlowFailed(f"no OTP email for {email} after {timeout}s")
+
+    def clean_up(self, run_id):
+        """Remove the users and emails a run against a shared database created"""
+        prefix = f'vu-{run_id}-'
+        User.objects.filter(email__startswith=prefix, email__endswith=DOMAIN).delete()
+        EmailOutbox.objects.filter(to_email__startswith=prefix, to_email__endswith=DOMAIN).delete()
+
+    def report(self, results, elapsed, users):
+        self.stdout.write(f"⚡ {users} virtual users in {elapsed:.2f}s ({users / elapsed:.1f} flows/s)")
+        self.stdout.write(f"   {'endpoint':<12} {'ok':>5} {'errors':>7} {'req/s':>8} "
+                          f"{'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+        report = {}
+        for name, _ in FLOW:
+            timings = results[name]
+            latencies = sorted(seconds for seconds, ok in timings if ok)
+            entry = {
+                'ok': len(latencies),
+                'errors': sum(1 for _, ok in timings if not ok),
+                'rps': len(latencies) / elapsed,
+                'p50_ms': percentile(latencies, 50) * 1000,
+                'p95_ms': percentile(latencies, 95) * 1000,
+                'p99_ms': percentile(latencies, 99) * 1000,
+            }
+            report[name] = entry
+            self.stdout.write(f"   {name:<12} {entry['ok']:5d} {entry['errors']:7d} {entry['rps']:8.1f} "
+                              f"{entry['p50_ms']:9.2f} {entry['p95_ms']:9.2f} {entry['p99_ms']:9.2f}")
+        return report
+
+    def compare(self, report, config, baseline, tolerance, min_delta_ms):
+        if baseline.get('config') != config:
+            raise CommandError(f"Baseline was recorded with {baseline.get('config')}, this run is {config}; "
+                               f"rerun with the same options or record a new baseline")
+
+        regressions = []
+        for name, entry in report.items():
+            before = baseline['endpoints'].get(name)
+            if not before:
+                continue
+            for metric in ('p50_ms', 'p95_ms', 'p99_ms'):
+                limit = max(before[metric] * (1 + tolerance), before[metric] + min_delta_ms)
+                if entry[metric] > limit:
+                    regressions.append(f"{name} {metric}: {before[metric]:.2f} -> {entry[metric]:.2f}")
+            if entry['rps'] < before['rps'] * (1 - tolerance):
+                regressions.append(f"{name} req/s: {before['rps']:.1f} -> {entry['rps']:.1f}")
+
+        if regressions:
+            for regression in regressions:
+                self.stderr.write(f"   📉 {regression}")
+            raise CommandError(f"{len(regressions)} regression(s) beyond {tolerance:.0%} of the baseline")
+        self.stdout.write(f"✅ Within {tolerance:.0%} of the baseline")
+
+
+def percentile(latencies, pct):
+    """Nearest-rank percentile of sorted latencies"""
+    if not latencies:
+        return 0.0
+    return latencies[min(len(latencies) - 1, int(len(latencies) * pct / 100))]
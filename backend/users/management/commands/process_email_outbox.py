@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from users.outbox import process_due
+
+
+class Command(BaseCommand):
+    help = 'Deliver queued outbox emails that are due (retries, and anything a worker missed)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help='Maximum emails to deliver per pass')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep polling instead of exiting after one pass')
+        parser.add_argument('--interval', type=float, default=5.0,
+                            help='Seconds to sleep between passes when --loop is set')
+
+    def handle(self, *args, **options):
+        while True:
+            results = process_due(batch_size=options['batch_size'])
+            if results:
+                summary = ', '.join(f"{status}: {count}" for status, count in sorted(results.items()))
+                self.stdout.write(f"📬 Outbox pass complete ({summary})")
+
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
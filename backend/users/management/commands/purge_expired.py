@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from users.retention import purge_expired
+
+
+class Command(BaseCommand):
+    help = 'Delete expired OTPs, stale pending registrations and old outbox emails in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Rows deleted per transaction')
+        parser.add_argument('--pause', type=float, default=0.0,
+                            help='Seconds to sleep between batches (lets other writers in)')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Report what would be reclaimed without deleting')
+
+    def handle(self, *args, **options):
+        report = purge_expired(
+            batch_size=options['batch_size'],
+            pause=options['pause'],
+            dry_run=options['dry_run'],
+        )
+
+        verb = 'Would reclaim' if options['dry_run'] else 'Reclaimed'
+        total_rows = total_bytes = 0
+        for label, result in report.items():
+            total_rows += result['rows']
+            total_bytes += result['bytes']
+            self.stdout.write(f"   {label:<24} {result['rows']:>8} rows  {result['bytes'] / 1024:>10.1f} KiB")
+        self.stdout.write(self.style.SUCCESS(
+            f"🧹 {verb} {total_rows} rows, {total_bytes / 1024:.1f} KiB"
+        ))
@@ -0,0 +1,225 @@
+"""
+In-process request metrics in Prometheus text format
+
+Every thread records into its own shard (a plain dict only that thread
+writes), so observing a value takes no lock. A scrape merges the shards;
+shards of threads that have exited are folded into a retired total so short
+lived threads don't pile up. Figures are per process: Prometheus scrapes each
+worker (or sums the series) as usual.
+
+MetricsMiddleware records request latency, DB query counts and DB time per
+URL name (async requests through request_queries(), which follows their
+queries onto sync_to_async threads); external_call() times email, SMS, Firebase and OAuth calls wherever
+they happen (request threads or background workers). Sampled metrics (e.g.
+the hashing pool's queue) read state their owner already keeps on each scrape.
+"""
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+import threading
+import time
+
+# Seconds; tuned for API calls (fast reads up to slow password hashing)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 50, 100)
+
+_local = threading.local()
+_shards = []
+_shards_lock = threading.Lock()
+_retired = {}
+
+
+def _shard():
+    shard = getattr(_local, 'shard', None)
+    if shard is None:
+        shard = _local.shard = {}
+        with _shards_lock:
+            _shards.append((threading.current_thread(), shard))
+    return shard
+
+
+def _merge_into(total, shard):
+    # list() copies the items in one step, so a writer adding a series can't break the loop
+    for key, cell in list(shard.items()):
+        merged = total.get(key)
+        if merged is None:
+            total[key] = list(cell)
+        else:
+            for i, value in enumerate(cell):
+                merged[i] += value
+
+
+def snapshot():
+    """Merged {(metric, labels): cell} across all threads"""
+    with _shards_lock:
+        for entry in [entry for entry in _shards if not entry[0].is_alive()]:
+            _merge_into(_retired, entry[1])
+            _shards.remove(entry)
+        shards = [shard for _, shard in _shards]
+        total = {}
+        _merge_into(total, _retired)
+    for shard in shards:
+        _merge_into(total, shard)
+    return total
+
+
+class Histogram:
+    """Prometheus histogram; a cell is [per-bucket counts..., +Inf count, sum]"""
+
+    def __init__(self, name, documentation, labelnames, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        REGISTRY.append(self)
+
+    def observe(self, value, *labels):
+        shard = _shard()
+        key = (self, labels)
+        cell = shard.get(key)
+        if cell is None:
+            cell = shard[key] = [0] * (len(self.buckets) + 1) + [0.0]
+        cell[bisect_left(self.buckets, value)] += 1
+        cell[-1] += value
+
+    def render(self, cells):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        for labels, cell in sorted(cells.items()):
+            pairs = [f'{name}={_quote(value)}' for name, value in zip(self.labelnames, labels)]
+            cumulative = 0
+            for bound, count in zip((*map(_number, self.buckets), '+Inf'), cell):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{_labels(pairs + [f"le={_quote(bound)}"])} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels(pairs)} {_number(cell[-1])}')
+            lines.append(f'{self.name}_count{_labels(pairs)} {cumulative}')
+        return lines
+
+
+class Sampled:
+    """Unlabelled gauge or counter whose value is read from read() at scrape time"""
+
+    def __init__(self, name, documentation, kind, read):
+        self.name = name
+        self.documentation = documentation
+        self.kind = kind
+        self.read = read
+        REGISTRY.append(self)
+
+    def render(self, cells):
+        return [
+            f'# HELP {self.name} {self.documentation}',
+            f'# TYPE {self.name} {self.kind}',
+            f'{self.name} {_number(self.read())}',
+        ]
+
+
+def _labels(pairs):
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _quote(value):
+    return '"' + _escape(value) + '"'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+REGISTRY = []
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', 'Request latency by URL name, method and status',
+    ('view', 'method', 'status'),
+)
+REQUEST_QUERIES = Histogram(
+    'http_request_db_queries', 'Database queries per request by URL name',
+    ('view',), buckets=QUERY_COUNT_BUCKETS,
+)
+REQUEST_DB_TIME = Histogram(
+    'http_request_db_duration_seconds', 'Time spent in database queries per request by URL name',
+    ('view',),
+)
+EXTERNAL_CALLS = Histogram(
+    'external_call_duration_seconds', 'Calls to email, SMS, Firebase and OAuth providers',
+    ('service', 'outcome'),
+)
+
+
+def render():
+    """All metrics in Prometheus text exposition format"""
+    cells = snapshot()
+    lines = []
+    for metric in REGISTRY:
+        lines += metric.render({labels: cell for (m, labels), cell in cells.items() if m is metric})
+    return '\n'.join(lines) + '\n'
+
+
+@contextmanager
+def external_call(service):
+    """Time a provider call as external_call_duration_seconds{service=...}"""
+    start = time.perf_counter()
+    outcome = 'error'
+    try:
+        yield
+        outcome = 'ok'
+    finally:
+        EXTERNAL_CALLS.observe(time.perf_counter() - start, service, outcome)
+
+
+class QueryTimer:
+    """connection.execute_wrapper() that counts and times queries (and keeps their SQL, without params)"""
+
+    max_statements = 50
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.statements = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - start
+            if len(self.statements) < self.max_statements:
+                self.statements.append(sql)
+
+
+_request_timer = ContextVar('request_query_timer', default=None)
+
+
+def _time_query(execute, sql, params, many, context):
+    timer = _request_timer.get()
+    if timer is None:
+        return execute(sql, params, many, context)
+    return timer(execute, sql, params, many, context)
+
+
+def install_query_timer(connection, **kwargs):
+    """connection_created receiver: report the connection's queries to the current async request"""
+    if _time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_time_query)
+
+
+@contextmanager
+def request_queries():
+    """
+    QueryTimer for the queries of an async request
+
+    The async ORM runs queries on sync_to_async threads, each with its own
+    connection, so instead of wrapping one connection the timer travels in a
+    context variable (copied into those threads) that every connection's
+    wrapper reports to.
+    """
+    timer = QueryTimer()
+    token = _request_timer.set(timer)
+    try:
+        yield timer
+    finally:
+        _request_timer.reset(token)
@@ -0,0 +1,65 @@
+"""
+Request instrumentation middleware
+"""
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.db import connection
+import time
+
+from .metrics import REQUEST_DB_TIME, REQUEST_LATENCY, REQUEST_QUERIES, QueryTimer, request_queries
+from .query_budget import check_budget
+
+
+def view_label(request):
+    """URL name of the matched route (never the raw path, which would explode the series count)"""
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match is not None else 'unmatched'
+
+
+class MetricsMiddleware:
+    """
+    Record latency, DB query count and DB time for every request, and check
+    the view's query budget (see users/query_budget.py)
+
+    Listed first in MIDDLEWARE so the figures cover the whole stack. Under
+    ASGI the views run their queries on sync_to_async threads, so they are
+    counted through metrics.request_queries() rather than this thread's
+    connection.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        timer = QueryTimer()
+        start = time.perf_counter()
+        with connection.execute_wrapper(timer):
+            response = self.get_response(request)
+        elapsed = time.perf_counter() - start
+
+        view = view_label(request)
+        REQUEST_LATENCY.observe(elapsed, view, request.method, str(response.status_code))
+        REQUEST_QUERIES.observe(timer.count, view)
+        REQUEST_DB_TIME.observe(timer.seconds, view)
+        check_budget(request, view, timer)
+        return response
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        with request_queries() as timer:
+            response = await self.get_response(request)
+        elapsed = time.perf_counter() - start
+
+        view = view_label(request)
+        REQUEST_LATENCY.observe(elapsed, view, request.method, str(response.status_code))
+        REQUEST_QUERIES.observe(timer.count, view)
+        REQUEST_DB_TIME.observe(timer.seconds, view)
+        check_budget(request, view, timer)
+        return response
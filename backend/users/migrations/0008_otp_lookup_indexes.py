@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0007_retention_indexes"),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name="pendingregistration",
+            options={
+                "verbose_name": "Pending Registration",
+                "verbose_name_plural": "Pending Registrations",
+            },
+        ),
+        migrations.AlterModelOptions(
+            name="phoneotp",
+            options={"verbose_name": "Phone OTP", "verbose_name_plural": "Phone OTPs"},
+        ),
+        migrations.AlterModelOptions(
+            name="user",
+            options={"verbose_name": "User", "verbose_name_plural": "Users"},
+        ),
+        migrations.AlterField(
+            model_name="phoneotp",
+            name="phone_number",
+            field=models.CharField(max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name="phoneotp",
+            index=models.Index(
+                fields=["phone_number", "created_at"], name="phone_otps_lookup_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,78 @@
+import base64
+import binascii
+import hashlib
+import os
+import re
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+from django.db import migrations
+
+# The image store's layout and URL as of this migration, frozen here so later
+# changes to users.image_store or the URLconf can't change what it does
+DATA_URL = re.compile(r"^data:image/[\w.+-]+;base64,(?P<data>.*)$", re.DOTALL)
+IMAGE_URL = "/api/auth/images/{key}/"
+
+
+def sniff_extension(head):
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if head.startswith(b"\xff\xd8\xff"):
+        return "jpg"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return "gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    return None
+
+
+def store_data_url(value):
+    """Write a base64 data: URL's image into the store; returns its URL, or None if it isn't a usable image"""
+    limit = getattr(settings, "IMAGE_MAX_BYTES", 2 * 1024 * 1024)
+    match = DATA_URL.match(value)
+    if not match or len(match.group("data")) > limit * 4 // 3 + 4:
+        return None
+    try:
+        data = base64.b64decode(match.group("data"), validate=True)
+    except (binascii.Error, ValueError):
+        return None
+    ext = sniff_extension(data[:16])
+    if ext is None or len(data) > limit:
+        return None
+
+    key = f"{hashlib.sha256(data).hexdigest()}.{ext}"
+    root = Path(getattr(settings, "IMAGE_STORE_ROOT", Path(settings.BASE_DIR) / "media" / "images"))
+    final = root / key[:2] / key
+    if not final.exists():
+        final.parent.mkdir(parents=True, exist_ok=True)
+        # Write next to the final path so the move is an atomic rename
+        fd, tmp_path = tempfile.mkstemp(dir=final.parent, prefix=".upload-")
+        with os.fdopen(fd, "wb") as tmp:
+            tmp.write(data)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, final)
+    return IMAGE_URL.format(key=key)
+
+
+def store_inline_images(apps, schema_editor):
+    """Move base64 profile images into the image store, keeping only their URL"""
+    db_alias = schema_editor.connection.alias
+    for model_name in ("User", "PendingRegistration"):
+        model = apps.get_model("users", model_name)
+        rows = model.objects.using(db_alias).filter(profile_image__startswith="data:")
+        for pk, value in rows.values_list("pk", "profile_image").iterator():
+            # Undecodable or oversized blobs could never be displayed anyway
+            url = store_data_url(value)
+            model.objects.using(db_alias).filter(pk=pk).update(profile_image=url)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0009_revoked_tokens"),
+    ]
+
+    operations = [
+        migrations.RunPython(store_inline_images, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0010_store_profile_images"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="user",
+            name="profile_thumbnails",
+            field=models.JSONField(
+                blank=True,
+                help_text="Thumbnail size (px) -> image store path, set by avatar uploads",
+                null=True,
+            ),
+        ),
+    ]
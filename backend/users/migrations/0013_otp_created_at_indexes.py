@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0012_user_version"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="pendingregistration",
+            name="otp_created_at",
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+        migrations.AlterField(
+            model_name="phoneotp",
+            name="otp_created_at",
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+        # Retention filters on otp_created_at now; the OTP lookups use the
+        # email and (phone_number, created_at) indexes
+        migrations.AlterField(
+            model_name="pendingregistration",
+            name="created_at",
+            field=models.DateTimeField(auto_now_add=True),
+        ),
+        migrations.AlterField(
+            model_name="phoneotp",
+            name="created_at",
+            field=models.DateTimeField(auto_now_add=True),
+        ),
+    ]
@@ -1,9 +1,12 @@
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
 from django.db import models
 from django.utils import timezone
+import copy
 import random
 import string
 
+from .user_cache import invalidate_user
+
 
 class UserManager(BaseUserManager):
     """Custom user manager for email-based authentication"""
@@ -90,6 +93,20 @@ class User(AbstractBaseUser, PermissionsMixin):
         blank=True,
         help_text='URL or path to profile image'
     )
+    profile_thumbnails = models.JSONField(
+        null=True,
+        blank=True,
+        help_text='Thumbnail size (px) -> image store path, set by avatar uploads'
+    )
+    
+    # Bumped by saves that change the user's representation; used as its ETag
+    version = models.PositiveIntegerField(default=1)
+    
+    # The fields UserSerializer renders: saving anything else (last_login, a
+    # password rehash, admin-only flags) keeps the version and so the ETag
+    ETAG_FIELDS = frozenset({
+        'email', 'name', 'date_joined', 'oauth_provider', 'avatar_color', 'profile_image', 'profile_thumbnails',
+    })
     
     objects = UserManager()
     
@@ -100,7 +117,10 @@ class User(AbstractBaseUser, PermissionsMixin):
         db_table = 'users'
         verbose_name = 'User'
         verbose_name_plural = 'Users'
-        ordering = ['-date_joined']
+        constraints = [
+            # One account per provider identity; also indexes the OAuth login lookup
+            models.UniqueConstraint(fields=['oauth_provider', 'oauth_id'], name='users_oauth_identity'),
+        ]
     
     def __str__(self):
         return self.email
@@ -110,6 +130,94 @@ class User(AbstractBaseUser, PermissionsMixin):
     
     def get_short_name(self):
         return self.name.split()[0] if self.name else self.email
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._etag_values = instance._etag_snapshot()
+        return instance
+    
+    def _etag_snapshot(self):
+        # Copies, so in-place edits of profile_thumbnails still count as changes
+        return {name: copy.copy(self.__dict__[name]) for name in self.ETAG_FIELDS if name in self.__dict__}
+    
+    def _etag_changed(self):
+        loaded = getattr(self, '_etag_values', None)
+        if loaded is None:
+            return True
+        return any(
+            name not in loaded or loaded[name] != self.__dict__[name]
+            for name in self.ETAG_FIELDS if name in self.__dict__
+        )
+    
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if self._state.adding or kwargs.get('force_insert'):
+            self.version = (self.version or 0) + 1
+            bump = False
+        elif update_fields is not None:
+            # An empty update_fields stays a no-op, as in Django
+            bump = not self.ETAG_FIELDS.isdisjoint(update_fields)
+            if bump:
+                kwargs['update_fields'] = {*update_fields, 'version'}
+        else:
+            bump = self._etag_changed()
+        
+        if bump:
+            self.version += 1
+        self._bumping = bump
+        try:
+            super().save(*args, **kwargs)
+        finally:
+            self._bumping = False
+        self._etag_values = self._etag_snapshot()
+    
+    def _do_update(self, base_qs, using, pk_val, values, update_fields, forced_update):
+        if not getattr(self, '_bumping', False):
+            return super()._do_update(base_qs, using, pk_val, values, update_fields, forced_update)
+        
+        # Written only over the version this instance read, so the new one is
+        # known without reading it back
+        if getattr(self, '_etag_values', None) is not None:
+            current = base_qs.filter(version=self.version - 1)
+            if super()._do_update(current, using, pk_val, values, update_fields, forced_update):
+                return True
+        
+        # request.user may be a stale copy from the user cache: bump in the
+        # database instead, so two writers never share a version (and ETag)
+        values = [
+            (field, model, models.F('version') + 1 if field.attname == 'version' else value)
+            for field, model, value in values
+        ]
+        if not super()._do_update(base_qs, using, pk_val, values, update_fields, forced_update):
+            return False
+        self.refresh_from_db(fields=['version'])
+        return True
+    
+    def save_if_version(self, versions, update_fields):
+        """
+        Write update_fields only if the row is still at one of versions
+        
+        Check and write are one conditional UPDATE, so of two concurrent
+        writers holding the same version only one succeeds.
+        
+        Returns:
+            bool: False if the row has moved on (nothing is written)
+        """
+        rows = User.objects.filter(pk=self.pk, version__in=versions)
+        if not update_fields:
+            return rows.exists()
+        values = {name: getattr(self, name) for name in update_fields}
+        if not rows.update(version=models.F('version') + 1, **values):
+            return False
+        
+        # QuerySet.update() skips post_save
+        invalidate_user(self.pk)
+        if len(versions) == 1:
+            self.version = versions[0] + 1
+        else:
+            self.refresh_from_db(fields=['version'])
+        return True
 
 
 class PendingRegistration(models.Model):
@@ -122,7 +230,7 @@ class PendingRegistration(models.Model):
     profile_image = models.TextField(null=True, blank=True)  # Base64 encoded image
     
     otp = models.CharField(max_length=6)
-    otp_created_at = models.DateTimeField(auto_now_add=True)
+    otp_created_at = models.DateTimeField(auto_now_add=True, db_index=True)
     otp_attempts = models.IntegerField(default=0)
     
     created_at = models.DateTimeField(auto_now_add=True)
@@ -131,7 +239,6 @@ class PendingRegistration(models.Model):
         db_table = 'pending_registrations'
         verbose_name = 'Pending Registration'
         verbose_name_plural = 'Pending Registrations'
-        ordering = ['-created_at']
     
     def __str__(self):
         return f"{self.email} - OTP: {self.otp}"
@@ -162,8 +269,9 @@ class PendingRegistration(models.Model):
         if self.otp == otp:
             return True, "OTP verified successfully"
         
+        # Count the wrong guess with a single-column atomic update
+        type(self).objects.filter(pk=self.pk).update(otp_attempts=models.F('otp_attempts') + 1)
         self.otp_attempts += 1
-        self.save()
         
         remaining = 5 - self.otp_attempts
         if remaining > 0:
@@ -175,13 +283,13 @@ class PendingRegistration(models.Model):
 class PhoneOTP(models.Model):
     """Model to store phone OTP codes for registration/login"""
     
-    phone_number = models.CharField(max_length=20, db_index=True)
+    phone_number = models.CharField(max_length=20)
     name = models.CharField(max_length=255, null=True, blank=True)
     password = models.CharField(max_length=255, null=True, blank=True)  # Hashed, for registration
     avatar_color = models.CharField(max_length=7, null=True, blank=True)
     
     otp = models.CharField(max_length=6)
-    otp_created_at = models.DateTimeField(auto_now_add=True)
+    otp_created_at = models.DateTimeField(auto_now_add=True, db_index=True)
     otp_attempts = models.IntegerField(default=0)
     
     purpose = models.CharField(
@@ -199,7 +307,10 @@ class PhoneOTP(models.Model):
         db_table = 'phone_otps'
         verbose_name = 'Phone OTP'
         verbose_name_plural = 'Phone OTPs'
-        ordering = ['-created_at']
+        indexes = [
+            # Latest OTP for a number: WHERE phone_number = ? ORDER BY created_at DESC
+            models.Index(fields=['phone_number', 'created_at'], name='phone_otps_lookup_idx'),
+        ]
     
     def __str__(self):
         return f"{self.phone_number} - {self.purpose} - OTP: {self.otp}"
@@ -230,11 +341,72 @@ class PhoneOTP(models.Model):
         if self.otp == otp:
             return True, "OTP verified successfully"
         
+        # Count the wrong guess with a single-column atomic update
+        type(self).objects.filter(pk=self.pk).update(otp_attempts=models.F('otp_attempts') + 1)
         self.otp_attempts += 1
-        self.save()
         
         remaining = 5 - self.otp_attempts
         if remaining > 0:
             return False, f"Invalid OTP. {remaining} attempts remaining."
         else:
             return False, "Invalid OTP. Account locked. Please request a new OTP."
+
+
+class EmailOutbox(models.Model):
+    """Model to queue outgoing emails so they are sent after the request commits"""
+    
+    STATUS_PENDING = 'pending'
+    STATUS_SENDING = 'sending'
+    STATUS_SENT = 'sent'
+    STATUS_DEAD = 'dead'
+    
+    to_email = models.EmailField(max_length=255)
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    html_body = models.TextField(null=True, blank=True)
+    
+    status = models.CharField(
+        max_length=10,
+        choices=[
+            (STATUS_PENDING, 'Pending'),
+            (STATUS_SENDING, 'Sending'),
+            (STATUS_SENT, 'Sent'),
+            (STATUS_DEAD, 'Dead letter'),
+        ],
+        default=STATUS_PENDING
+    )
+    attempts = models.IntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(null=True, blank=True)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        db_table = 'email_outbox'
+        verbose_name = 'Outbox Email'
+        verbose_name_plural = 'Email Outbox'
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='email_outbox_due_idx'),
+            models.Index(fields=['status', 'created_at'], name='email_outbox_retention_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.to_email} - {self.subject} ({self.status})"
+
+
+class RevokedToken(models.Model):
+    """Revoked JWT ids, kept until the token would have expired anyway"""
+    
+    jti = models.CharField(max_length=64, primary_key=True)
+    expires_at = models.DateTimeField(db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    
+    class Meta:
+        db_table = 'revoked_tokens'
+        verbose_name = 'Revoked Token'
+        verbose_name_plural = 'Revoked Tokens'
+    
+    def __str__(self):
+        return f"{self.jti} (expires {self.expires_at})"
@@ -0,0 +1,211 @@
+"""
+OTP store - keeps pending OTP codes and their registration/login payload
+
+The default CacheOTPStore keeps everything in the Django cache: records expire
+natively via the cache TTL and wrong guesses are counted with an atomic
+cache.incr(), so OTP traffic never touches the database writer lock.
+DatabaseOTPStore keeps the previous PendingRegistration / PhoneOTP tables and
+is selected with OTP_STORE = 'database'.
+"""
+from asgiref.sync import sync_to_async
+from collections import namedtuple
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+import random
+import string
+import time
+
+# Kinds of OTP the store keeps
+EMAIL_REGISTRATION = 'email'
+PHONE = 'phone'
+
+MAX_OTP_ATTEMPTS = 5
+
+VerifyResult = namedtuple('VerifyResult', ['found', 'success', 'message', 'data'])
+
+
+def generate_otp():
+    """Generate a random 6-digit OTP"""
+    return ''.join(random.choices(string.digits, k=6))
+
+
+def otp_lifetime():
+    """Seconds an OTP code stays valid"""
+    return getattr(settings, 'OTP_EXPIRY_SECONDS', 600)
+
+
+def attempt_message(attempts):
+    """Error message after a wrong guess, given the attempts used so far"""
+    remaining = MAX_OTP_ATTEMPTS - attempts
+    if remaining > 0:
+        return f"Invalid OTP. {remaining} attempts remaining."
+    return "Invalid OTP. Account locked. Please request a new OTP."
+
+
+LOCKED_MESSAGE = "Too many failed attempts. Please request a new OTP."
+EXPIRED_MESSAGE = "OTP has expired. Please request a new one."
+VERIFIED_MESSAGE = "OTP verified successfully"
+
+
+class BaseOTPStore:
+    """Interface shared by the OTP stores"""
+
+    def issue(self, kind, key, data):
+        """Replace any pending OTP for key with a new one carrying data; returns the OTP"""
+        raise NotImplementedError
+
+    def reissue(self, kind, key):
+        """
+        Generate a new OTP for an existing record, resetting attempts and expiry
+
+        Returns:
+            tuple or None: (otp, data), or None if nothing is pending for key
+        """
+        raise NotImplementedError
+
+    def verify(self, kind, key, otp):
+        """Check a guess; returns a VerifyResult"""
+        raise NotImplementedError
+
+    def discard(self, kind, key):
+        """Forget the pending OTP for key"""
+        raise NotImplementedError
+
+    # Async views go through these; the sync store runs on the same thread as
+    # Django's async ORM so the database fallback stays safe
+    async def averify(self, kind, key, otp):
+        return await sync_to_async(self.verify)(kind, key, otp)
+
+    async def adiscard(self, kind, key):
+        return await sync_to_async(self.discard)(kind, key)
+
+
+class CacheOTPStore(BaseOTPStore):
+    """
+    OTP records in the Django cache
+
+    Each record lives under otp:<kind>:<key> with its attempt counter in a
+    sibling key. The record outlives the OTP itself (OTP_RECORD_TTL_SECONDS)
+    so a user can still request a new code after the current one expires.
+    """
+
+    def __init__(self, cache_backend=None):
+        self.cache = cache_backend or cache
+
+    def _keys(self, kind, key):
+        record_key = f'otp:{kind}:{key}'
+        return record_key, f'{record_key}:attempts'
+
+    def _ttl(self):
+        return max(getattr(settings, 'OTP_RECORD_TTL_SECONDS', 3600), otp_lifetime())
+
+    def _store(self, kind, key, data):
+        record_key, attempts_key = self._keys(kind, key)
+        otp = generate_otp()
+        ttl = self._ttl()
+        self.cache.set_many({
+            record_key: {'otp': otp, 'issued_at': time.time(), 'data': data},
+            attempts_key: 0,
+        }, timeout=ttl)
+        return otp
+
+    def issue(self, kind, key, data):
+        return self._store(kind, key, data)
+
+    def reissue(self, kind, key):
+        record = self.cache.get(self._keys(kind, key)[0])
+        if record is None:
+            return None
+        return self._store(kind, key, record['data']), record['data']
+
+    def verify(self, kind, key, otp):
+        record_key, attempts_key = self._keys(kind, key)
+        record = self.cache.get(record_key)
+        if record is None:
+            return VerifyResult(False, False, None, None)
+
+        # Every guess consumes an attempt up front, so concurrent guesses can
+        # never exceed MAX_OTP_ATTEMPTS in total
+        try:
+            attempts = self.cache.incr(attempts_key)
+        except ValueError:
+            # Counter evicted or expired independently of the record
+            return VerifyResult(True, False, EXPIRED_MESSAGE, record['data'])
+
+        if attempts > MAX_OTP_ATTEMPTS:
+            return VerifyResult(True, False, LOCKED_MESSAGE, record['data'])
+
+        if time.time() - record['issued_at'] >= otp_lifetime():
+            return VerifyResult(True, False, EXPIRED_MESSAGE, record['data'])
+
+        if record['otp'] == otp:
+            return VerifyResult(True, True, VERIFIED_MESSAGE, record['data'])
+
+        return VerifyResult(True, False, attempt_message(attempts), record['data'])
+
+    def discard(self, kind, key):
+        self.cache.delete_many(self._keys(kind, key))
+
+
+class DatabaseOTPStore(BaseOTPStore):
+    """OTP records in the PendingRegistration / PhoneOTP tables (fallback)"""
+
+    def _model(self, kind):
+        from .models import PendingRegistration, PhoneOTP
+        return PendingRegistration if kind == EMAIL_REGISTRATION else PhoneOTP
+
+    def _lookup(self, kind):
+        return 'email' if kind == EMAIL_REGISTRATION else 'phone_number'
+
+    def _data(self, kind, row):
+        if kind == EMAIL_REGISTRATION:
+            fields = ['name', 'password', 'avatar_color']
+        else:
+            fields = ['name', 'password', 'avatar_color', 'purpose']
+        return {field: getattr(row, field) for field in fields}
+
+    def _latest(self, kind, key):
+        model = self._model(kind)
+        return model.objects.filter(**{self._lookup(kind): key}).order_by('-created_at').first()
+
+    def issue(self, kind, key, data):
+        model = self._model(kind)
+        model.objects.filter(**{self._lookup(kind): key}).delete()
+        otp = generate_otp()
+        model.objects.create(otp=otp, **{self._lookup(kind): key}, **data)
+        return otp
+
+    def reissue(self, kind, key):
+        row = self._latest(kind, key)
+        if row is None:
+            return None
+        otp = generate_otp()
+        type(row).objects.filter(pk=row.pk).update(
+            otp=otp,
+            otp_attempts=0,
+            otp_created_at=timezone.now(),
+        )
+        return otp, self._data(kind, row)
+
+    def verify(self, kind, key, otp):
+        row = self._latest(kind, key)
+        if row is None:
+            return VerifyResult(False, False, None, None)
+        success, message = row.verify_otp(otp)
+        return VerifyResult(True, success, message, self._data(kind, row))
+
+    def discard(self, kind, key):
+        self._model(kind).objects.filter(**{self._lookup(kind): key}).delete()
+
+
+_STORES = {
+    'cache': CacheOTPStore,
+    'database': DatabaseOTPStore,
+}
+
+
+def get_otp_store():
+    """Return the OTP store selected by the OTP_STORE setting"""
+    return _STORES[getattr(settings, 'OTP_STORE', 'cache')]()
+
@@ -0,0 +1,212 @@
+"""
+Email outbox - queues outgoing mail in the database and delivers it after commit
+
+Views call enqueue_email() instead of sending inline, so the HTTP response never
+waits on the mail provider. Rows are handed to an in-process worker pool once the
+surrounding transaction commits; failures are retried with exponential backoff
+and end up in the dead-letter state after EMAIL_OUTBOX_MAX_ATTEMPTS.
+The process_email_outbox management command drains anything the pool missed
+(process restarts, scheduled retries).
+"""
+import logging
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .email_service import send_email
+from .metrics import external_call
+from .models import EmailOutbox
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def get_executor():
+    """Return the process-wide outbox worker pool, creating it on first use"""
+    global _executor
+
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=_setting('EMAIL_OUTBOX_WORKERS', 2),
+                    thread_name_prefix='email-outbox',
+                )
+    return _executor
+
+
+def enqueue_email(to_email, subject, message, html_message=None):
+    """
+    Queue an email for delivery once the current transaction commits
+
+    Args:
+        to_email: Recipient address
+        subject: Email subject
+        message: Plain text body
+        html_message: Optional HTML alternative
+
+    Returns:
+        EmailOutbox: The queued row
+    """
+    entry = EmailOutbox.objects.create(
+        to_email=to_email,
+        subject=subject,
+        body=message,
+        html_body=html_message,
+    )
+    transaction.on_commit(lambda: dispatch(entry.pk))
+    return entry
+
+
+def dispatch(pk):
+    """Hand a queued email to the worker pool (or deliver inline when async is disabled)"""
+    if _setting('EMAIL_OUTBOX_ASYNC', True):
+        get_executor().submit(_run_delivery, pk)
+    else:
+        deliver(pk)
+
+
+def _run_delivery(pk):
+    try:
+        deliver(pk)
+    except Exception:
+        logger.exception("Outbox delivery crashed for email %s", pk)
+    finally:
+        close_old_connections()
+
+
+def backoff_delay(attempts):
+    """Seconds to wait before the next attempt (exponential with jitter, capped)"""
+    base = _setting('EMAIL_OUTBOX_BACKOFF_SECONDS', 5)
+    cap = _setting('EMAIL_OUTBOX_MAX_BACKOFF_SECONDS', 600)
+    delay = min(cap, base * (2 ** max(attempts - 1, 0)))
+    return delay * random.uniform(0.8, 1.2)
+
+
+def claim(pk):
+    """
+    Atomically move a due email from pending to sending
+
+    Returns:
+        EmailOutbox or None: The claimed row, or None if another worker owns it
+    """
+    now = timezone.now()
+    claimed = EmailOutbox.objects.filter(
+        pk=pk,
+        status=EmailOutbox.STATUS_PENDING,
+        next_attempt_at__lte=now,
+    ).update(
+        status=EmailOutbox.STATUS_SENDING,
+        attempts=F('attempts') + 1,
+        locked_at=now,
+    )
+    if not claimed:
+        return None
+    return EmailOutbox.objects.get(pk=pk)
+
+
+def deliver(pk):
+    """
+    Send one queued email, recording success, a scheduled retry or a dead letter
+
+    Returns:
+        str or None: The resulting status, or None if the email was not claimable
+    """
+    entry = claim(pk)
+    if entry is None:
+        return None
+
+    try:
+        with external_call('email'):
+            send_email(
+                entry.to_email,
+                entry.subject,
+                entry.body,
+                html_message=entry.html_body,
+                fail_silently=False,
+            )
+    except Exception as e:
+        return _record_failure(entry, e)
+
+    EmailOutbox.objects.filter(pk=entry.pk).update(
+        status=EmailOutbox.STATUS_SENT,
+        sent_at=timezone.now(),
+        locked_at=None,
+        last_error=None,
+    )
+    return EmailOutbox.STATUS_SENT
+
+
+def _record_failure(entry, error):
+    max_attempts = _setting('EMAIL_OUTBOX_MAX_ATTEMPTS', 5)
+
+    if entry.attempts >= max_attempts:
+        logger.error("Email %s to %s moved to dead letter: %s", entry.pk, entry.to_email, error)
+        EmailOutbox.objects.filter(pk=entry.pk).update(
+            status=EmailOutbox.STATUS_DEAD,
+            locked_at=None,
+            last_error=str(error),
+        )
+        return EmailOutbox.STATUS_DEAD
+
+    delay = backoff_delay(entry.attempts)
+    logger.warning("Email %s to %s failed (attempt %s), retrying in %.0fs: %s",
+                   entry.pk, entry.to_email, entry.attempts, delay, error)
+    EmailOutbox.objects.filter(pk=entry.pk).update(
+        status=EmailOutbox.STATUS_PENDING,
+        next_attempt_at=timezone.now() + timedelta(seconds=delay),
+        locked_at=None,
+        last_error=str(error),
+    )
+
+    if _setting('EMAIL_OUTBOX_ASYNC', True):
+        timer = threading.Timer(delay, dispatch, args=(entry.pk,))
+        timer.daemon = True
+        timer.start()
+    return EmailOutbox.STATUS_PENDING
+
+
+def release_stale_locks():
+    """Return emails stuck in sending (worker died mid-send) to the pending queue"""
+    timeout = _setting('EMAIL_OUTBOX_LOCK_TIMEOUT_SECONDS', 300)
+    cutoff = timezone.now() - timedelta(seconds=timeout)
+    return EmailOutbox.objects.filter(
+        status=EmailOutbox.STATUS_SENDING,
+        locked_at__lt=cutoff,
+    ).update(status=EmailOutbox.STATUS_PENDING, locked_at=None)
+
+
+def process_due(batch_size=100):
+    """
+    Deliver every pending email whose retry time has passed
+
+    Returns:
+        dict: Count of emails per resulting status
+    """
+    release_stale_locks()
+
+    due = list(
+        EmailOutbox.objects.filter(
+            status=EmailOutbox.STATUS_PENDING,
+            next_attempt_at__lte=timezone.now(),
+        ).order_by('next_attempt_at').values_list('pk', flat=True)[:batch_size]
+    )
+
+    results = {}
+    for pk in due:
+        outcome = deliver(pk)
+        if outcome:
+            results[outcome] = results.get(outcome, 0) + 1
+    return results
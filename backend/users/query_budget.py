@@ -0,0 +1,62 @@
+"""
+Per-endpoint query budgets
+
+A view declares the most queries one request may run:
+
+    @query_budget(1)
+    class LoginView(APIView):
+        ...
+
+MetricsMiddleware already counts every request's queries; when a budgeted
+view goes over, the SQL it ran (statements only - parameters can hold
+password hashes and OTPs) is logged as a warning. With QUERY_BUDGETS_STRICT
+(on for every test, see users.tests.TestCase) the request raises
+QueryBudgetExceeded instead, so the test that made it fails and a redundant
+query can't sneak in.
+
+Async views (users/async_views.py) carry the same budgets; the middleware
+follows their queries onto the sync_to_async threads that run them.
+"""
+from django.conf import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def query_budget(max_queries):
+    """Class or function view decorator declaring its per-request query budget"""
+
+    def decorator(view):
+        view.query_budget = max_queries
+        return view
+
+    return decorator
+
+
+def budget_for(request):
+    """Budget of the view that handled request, or None"""
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return None
+    # Set on the view function (e.g. a wrapped third-party as_view()) or on the class
+    budget = getattr(match.func, 'query_budget', None)
+    if budget is None:
+        budget = getattr(getattr(match.func, 'view_class', None), 'query_budget', None)
+    return budget
+
+
+def check_budget(request, view, timer):
+    """Log (or raise, in strict mode) if the request ran more queries than its view allows"""
+    budget = budget_for(request)
+    if budget is None or timer.count <= budget:
+        return
+
+    message = (f"{view} ran {timer.count} queries, budget is {budget}:\n"
+               + '\n'.join(f'  {sql}' for sql in timer.statements))
+    if getattr(settings, 'QUERY_BUDGETS_STRICT', False):
+        raise QueryBudgetExceeded(message)
+    logger.warning(message)
@@ -0,0 +1,169 @@
+"""
+Retention - purges expired OTP rows, stale pending registrations, old outbox mail
+and revocations of tokens that have since expired
+
+Rows are deleted in small primary-key batches walked along the index each
+policy filters on, each batch in its own short transaction, so the SQLite
+writer lock is never held for long. The purge_expired management command runs
+one pass; an optional in-process scheduler (RETENTION_INTERVAL_SECONDS) runs it
+periodically.
+"""
+from datetime import timedelta
+from django.conf import settings
+from django.core.signals import request_started
+from django.db import close_old_connections, transaction
+from django.db.models import Sum
+from django.db.models.functions import Coalesce, Length
+from django.utils import timezone
+import logging
+import random
+import threading
+import time
+
+from .models import EmailOutbox, PendingRegistration, PhoneOTP, RevokedToken
+
+logger = logging.getLogger(__name__)
+
+
+def retention_policies():
+    """
+    Returns:
+        list: (label, queryset of expired rows oldest first, text columns counted as reclaimed bytes)
+    """
+    now = timezone.now()
+    otp_cutoff = now - timedelta(seconds=getattr(settings, 'OTP_RECORD_TTL_SECONDS', 3600))
+    outbox_cutoff = now - timedelta(days=getattr(settings, 'EMAIL_OUTBOX_RETENTION_DAYS', 7))
+
+    return [
+        (
+            'pending_registrations',
+            # A resend reissues the OTP on the same row, so age counts from the latest code
+            PendingRegistration.objects.filter(otp_created_at__lt=otp_cutoff).order_by('otp_created_at'),
+            ['email', 'name', 'password', 'profile_image'],
+        ),
+        (
+            'phone_otps',
+            PhoneOTP.objects.filter(otp_created_at__lt=otp_cutoff).order_by('otp_created_at'),
+            ['phone_number', 'name', 'password'],
+        ),
+        (
+            'email_outbox',
+            EmailOutbox.objects.filter(
+                status__in=[EmailOutbox.STATUS_SENT, EmailOutbox.STATUS_DEAD],
+                created_at__lt=outbox_cutoff,
+            ).order_by('created_at'),
+            ['to_email', 'subject', 'body', 'html_body', 'last_error'],
+        ),
+        (
+            'revoked_tokens',
+            RevokedToken.objects.filter(expires_at__lt=now).order_by('expires_at'),
+            ['jti'],
+        ),
+    ]
+
+
+def _payload_bytes(queryset, columns):
+    size = Coalesce(Length(columns[0]), 0)
+    for column in columns[1:]:
+        size = size + Coalesce(Length(column), 0)
+    return queryset.aggregate(size=Sum(size))['size'] or 0
+
+
+def measure_queryset(queryset, columns):
+    """
+    Returns:
+        tuple: (rows, bytes) a purge would reclaim, without deleting anything
+    """
+    return queryset.count(), _payload_bytes(queryset, columns)
+
+
+def purge_queryset(queryset, columns, batch_size=500, pause=0.0):
+    """
+    Delete every row in queryset, in its order, batch_size rows per transaction
+
+    Returns:
+        tuple: (rows, bytes) reclaimed (bytes counts the text payload columns)
+    """
+    model = queryset.model
+    rows = reclaimed = 0
+
+    while True:
+        pks = list(queryset.values_list('pk', flat=True)[:batch_size])
+        if not pks:
+            break
+
+        batch = model.objects.filter(pk__in=pks)
+        with transaction.atomic():
+            reclaimed += _payload_bytes(batch, columns)
+            rows += batch.delete()[0]
+
+        if len(pks) < batch_size:
+            break
+        if pause:
+            time.sleep(pause)
+
+    return rows, reclaimed
+
+
+def purge_expired(batch_size=500, pause=0.0, dry_run=False):
+    """
+    Run every retention policy once
+
+    Returns:
+        dict: label -> {'rows': int, 'bytes': int}
+    """
+    report = {}
+    for label, queryset, columns in retention_policies():
+        if dry_run:
+            rows, reclaimed = measure_queryset(queryset, columns)
+        else:
+            rows, reclaimed = purge_queryset(queryset, columns, batch_size=batch_size, pause=pause)
+        report[label] = {'rows': rows, 'bytes': reclaimed}
+    return report
+
+
+class RetentionScheduler(threading.Thread):
+    """Daemon thread that runs purge_expired() every `interval` seconds (with jitter)"""
+
+    def __init__(self, interval, batch_size=500):
+        super().__init__(name='retention-scheduler', daemon=True)
+        self.interval = interval
+        self.batch_size = batch_size
+        self.stopped = threading.Event()
+
+    def run(self):
+        # Spread workers out so they do not all purge at the same moment
+        while not self.stopped.wait(self.interval * random.uniform(0.9, 1.1)):
+            try:
+                report = purge_expired(batch_size=self.batch_size, pause=0.05)
+                purged = {label: r for label, r in report.items() if r['rows']}
+                if purged:
+                    logger.info("Retention purge: %s", purged)
+            except Exception:
+                logger.exception("Retention purge failed")
+            finally:
+                close_old_connections()
+
+    def stop(self):
+        self.stopped.set()
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def start_scheduler(**kwargs):
+    """Start the in-process scheduler once (connected to request_started)"""
+    global _scheduler
+
+    interval = getattr(settings, 'RETENTION_INTERVAL_SECONDS', 0)
+    if not interval or _scheduler is not None:
+        return
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = RetentionScheduler(
+                interval,
+                batch_size=getattr(settings, 'RETENTION_BATCH_SIZE', 500),
+            )
+            _scheduler.start()
+    request_started.disconnect(dispatch_uid='users.retention')
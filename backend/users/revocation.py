@@ -0,0 +1,138 @@
+"""
+Token revocation keyed by jti
+
+Revoked token ids are written to the revoked_tokens table and mirrored in an
+in-memory map of jti -> expiry, so checking a token is a dict lookup. Each
+process pulls revocations made by other processes with one small indexed query
+at most every REVOCATION_SYNC_SECONDS, and drops entries once the token would
+have expired anyway (the retention purge does the same for the table).
+"""
+from asgiref.sync import sync_to_async
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils import timezone
+from rest_framework_simplejwt.settings import api_settings
+import asyncio
+import threading
+import time
+
+from .models import RevokedToken
+
+# Re-read revocations this far behind the last sync, so rows from transactions
+# that committed late are not missed
+SYNC_OVERLAP = timedelta(seconds=30)
+
+
+class RevocationList:
+    """In-memory set of revoked jtis (with their expiry) synced from RevokedToken"""
+
+    def __init__(self, sync_interval=5):
+        self.sync_interval = sync_interval
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._synced_at = None
+        self._next_sync = 0.0
+
+    def add(self, jti, exp):
+        """Mark jti revoked until exp (a UNIX timestamp)"""
+        with self._lock:
+            self._entries[jti] = exp
+
+    def is_revoked(self, jti):
+        if time.monotonic() >= self._next_sync:
+            self.sync()
+        exp = self._entries.get(jti)
+        return exp is not None and exp > time.time()
+
+    def sync(self):
+        """Load revocations written since the last sync and prune expired entries"""
+        if _in_event_loop():
+            # The ORM is off limits here; async callers await arefresh() first
+            return
+        # One thread syncs; the others keep answering from the current entries
+        # (except before the first load, which everyone waits for)
+        if not self._sync_lock.acquire(blocking=self._synced_at is None):
+            return
+        try:
+            if time.monotonic() < self._next_sync:
+                return
+
+            started = timezone.now()
+            if self._synced_at is None:
+                rows = RevokedToken.objects.filter(expires_at__gt=started)
+            else:
+                rows = RevokedToken.objects.filter(created_at__gte=self._synced_at - SYNC_OVERLAP)
+            loaded = list(rows.values_list('jti', 'expires_at'))
+
+            now = time.time()
+            with self._lock:
+                for jti, expires_at in loaded:
+                    self._entries[jti] = expires_at.timestamp()
+                for jti in [jti for jti, exp in self._entries.items() if exp <= now]:
+                    del self._entries[jti]
+
+            self._synced_at = started
+            self._next_sync = time.monotonic() + self.sync_interval
+        finally:
+            self._sync_lock.release()
+
+    async def arefresh(self):
+        """sync() from async code, when one is due"""
+        if time.monotonic() >= self._next_sync:
+            await sync_to_async(self.sync)()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def _in_event_loop():
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+_list = None
+_list_lock = threading.Lock()
+
+
+def get_revocation_list():
+    """Return the process-wide revocation list, creating it on first use"""
+    global _list
+
+    if _list is None:
+        with _list_lock:
+            if _list is None:
+                _list = RevocationList(getattr(settings, 'REVOCATION_SYNC_SECONDS', 5))
+    return _list
+
+
+def is_revoked(token):
+    """True if a validated simplejwt token has been revoked"""
+    jti = token.payload.get(api_settings.JTI_CLAIM)
+    return jti is not None and get_revocation_list().is_revoked(jti)
+
+
+def revoke(*tokens):
+    """Revoke validated simplejwt tokens until they expire (one INSERT for all of them)"""
+    entries = {token[api_settings.JTI_CLAIM]: token['exp'] for token in tokens}
+    # Already-revoked jtis are skipped by the database rather than looked up first
+    RevokedToken.objects.bulk_create([
+        RevokedToken(jti=jti, expires_at=datetime.fromtimestamp(exp, tz=dt_timezone.utc))
+        for jti, exp in entries.items()
+    ], ignore_conflicts=True)
+    revocation_list = get_revocation_list()
+    for jti, exp in entries.items():
+        revocation_list.add(jti, exp)
+
+
+@receiver(setting_changed)
+def _reset_list(setting, **kwargs):
+    global _list
+
+    if setting == 'REVOCATION_SYNC_SECONDS':
+        _list = None
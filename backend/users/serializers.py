@@ -2,18 +2,42 @@ from rest_framework import serializers
 from django.contrib.auth import get_user_model
 from django.contrib.auth.password_validation import validate_password
 from rest_framework.validators import UniqueValidator
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer as BaseTokenRefreshSerializer
 import re
 
+from .image_store import public_url
+from .tokens import RevocableRefreshToken
+
 User = get_user_model()
 
 
-class UserSerializer(serializers.ModelSerializer):
-    """Serializer for user details"""
+class UserSerializer(serializers.BaseSerializer):
+    """
+    Serializer for user details (read-only)
     
-    class Meta:
-        model = User
-        fields = ['id', 'email', 'name', 'date_joined', 'oauth_provider', 'avatar_color', 'profile_image']
-        read_only_fields = ['id', 'date_joined']
+    Built by hand rather than as a ModelSerializer: this runs on every login
+    and /me/ response, and ModelSerializer rebuilds its fields from the model
+    for each instance.
+    """
+    
+    date_joined = serializers.DateTimeField(read_only=True)
+    
+    def to_representation(self, obj):
+        return {
+            'id': obj.id,
+            'email': obj.email,
+            'name': obj.name,
+            'date_joined': self.date_joined.to_representation(obj.date_joined),
+            'oauth_provider': obj.oauth_provider,
+            'avatar_color': obj.avatar_color,
+            'profile_image': public_url(obj.profile_image),
+            'profile_thumbnails': self.get_profile_thumbnails(obj),
+        }
+    
+    def get_profile_thumbnails(self, obj):
+        if not obj.profile_thumbnails:
+            return None
+        return {size: public_url(path) for size, path in obj.profile_thumbnails.items()}
 
 
 class RegisterSerializer(serializers.ModelSerializer):
@@ -163,3 +187,9 @@ class ResendOTPSerializer(serializers.Serializer):
     """Serializer for resending OTP"""
     
     email = serializers.EmailField(required=True)
+
+
+class TokenRefreshSerializer(BaseTokenRefreshSerializer):
+    """Refresh serializer that rejects revoked refresh tokens"""
+    
+    token_class = RevocableRefreshToken
@@ -0,0 +1,21 @@
+"""
+Signal receivers keeping the user cache in step with the users table
+
+Profile updates, password resets, account deletion and admin edits all go
+through Model.save() / delete(), so these receivers cover every view that
+changes a user. QuerySet.update() skips signals; call invalidate_user()
+after using it on users.
+"""
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .user_cache import invalidate_user
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=User, dispatch_uid='users.user_cache.save')
+@receiver(post_delete, sender=User, dispatch_uid='users.user_cache.delete')
+def invalidate_cached_user(sender, instance, **kwargs):
+    invalidate_user(instance.pk)
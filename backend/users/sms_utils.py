@@ -1,45 +1,31 @@
 """
 SMS utilities using Twilio for phone OTP
 Twilio is recommended over Firebase for sending SMS
+
+Providers are pluggable through the SMS_BACKEND setting (a dotted path, like
+EMAIL_BACKEND). The Twilio client is created once per process and reused, and
+dispatch_sms_otp() hands sending to a small worker pool so phone endpoints
+respond without waiting on the provider.
 """
+from concurrent.futures import ThreadPoolExecutor
 from django.conf import settings
-import os
+from django.db import transaction
+from django.utils.module_loading import import_string
+import importlib.util
+import logging
+import threading
+import time
 
-# Try to import Twilio (optional dependency)
-try:
-    from twilio.rest import Client
-    TWILIO_AVAILABLE = True
-except ImportError:
-    TWILIO_AVAILABLE = False
-    print("⚠️  Twilio not installed. Run: pip install twilio")
+from .metrics import external_call
 
+logger = logging.getLogger(__name__)
 
-def send_sms_otp(phone_number, otp):
-    """
-    Send SMS OTP using Twilio
-    
-    Args:
-        phone_number: Phone number with country code (e.g., +1234567890)
-        otp: The OTP code to send
-        
-    Returns:
-        tuple: (success: bool, message: str)
-    """
-    # Check if Twilio is configured
-    account_sid = getattr(settings, 'TWILIO_ACCOUNT_SID', None)
-    auth_token = getattr(settings, 'TWILIO_AUTH_TOKEN', None)
-    from_number = getattr(settings, 'TWILIO_PHONE_NUMBER', None)
-    
-    if not TWILIO_AVAILABLE:
-        return False, f"Twilio not installed. OTP: {otp}"
-    
-    if not all([account_sid, auth_token, from_number]):
-        return False, f"Twilio not configured. OTP: {otp}"
-    
-    try:
-        client = Client(account_sid, auth_token)
-        
-        message_body = f"""
+# Twilio is optional and only imported when the first client is created, so
+# processes that never send SMS don't load it
+TWILIO_AVAILABLE = importlib.util.find_spec('twilio') is not None
+
+
+OTP_MESSAGE = """
 🛡️ TrueNeed Verification
 
 Your verification code is: {otp}
@@ -48,27 +34,179 @@ This code will expire in 10 minutes.
 
 If you didn't request this, please ignore.
 """.strip()
-        
-        message = client.messages.create(
-            body=message_body,
-            from_=from_number,
+
+
+class BaseSMSBackend:
+    """Interface for SMS providers"""
+
+    def is_configured(self):
+        """
+        Returns:
+            tuple: (configured: bool, reason: str)
+        """
+        return True, ''
+
+    def send(self, phone_number, body):
+        """Send one message and return a provider message id"""
+        raise NotImplementedError
+
+
+class TwilioBackend(BaseSMSBackend):
+    """Send SMS through Twilio with a process-wide, reused client"""
+
+    _client = None
+    _client_key = None
+    _lock = threading.Lock()
+
+    def is_configured(self):
+        if not TWILIO_AVAILABLE:
+            return False, "Twilio not installed. Run: pip install twilio"
+        if not all([
+            getattr(settings, 'TWILIO_ACCOUNT_SID', None),
+            getattr(settings, 'TWILIO_AUTH_TOKEN', None),
+            getattr(settings, 'TWILIO_PHONE_NUMBER', None),
+        ]):
+            return False, "Twilio not configured"
+        return True, ''
+
+    @classmethod
+    def get_client(cls):
+        """Return the shared Twilio client (it keeps one HTTP session for all calls)"""
+        key = (settings.TWILIO_ACCOUNT_SID, settings.TWILIO_AUTH_TOKEN)
+        if cls._client is None or cls._client_key != key:
+            with cls._lock:
+                if cls._client is None or cls._client_key != key:
+                    from twilio.rest import Client
+
+                    cls._client = Client(*key)
+                    cls._client_key = key
+        return cls._client
+
+    def send(self, phone_number, body):
+        message = self.get_client().messages.create(
+            body=body,
+            from_=settings.TWILIO_PHONE_NUMBER,
             to=phone_number
         )
-        
-        return True, f"SMS sent successfully (SID: {message.sid})"
-        
+        return message.sid
+
+
+class ConsoleBackend(BaseSMSBackend):
+    """Print messages to stdout (development)"""
+
+    def send(self, phone_number, body):
+        print(f"📱 SMS to {phone_number}:\n{body}", flush=True)
+        return 'console'
+
+
+class StubBackend(BaseSMSBackend):
+    """
+    Local stand-in provider for tests and benchmarks
+
+    Messages are appended to StubBackend.outbox; SMS_STUB_LATENCY_MS simulates
+    the provider's round-trip time.
+    """
+
+    outbox = []
+    _lock = threading.Lock()
+
+    def send(self, phone_number, body):
+        latency = getattr(settings, 'SMS_STUB_LATENCY_MS', 0)
+        if latency:
+            time.sleep(latency / 1000)
+        with self._lock:
+            self.outbox.append((phone_number, body))
+            return f'stub-{len(self.outbox)}'
+
+
+_backend = None
+_backend_path = None
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_sms_backend():
+    """Return the configured SMS backend instance"""
+    global _backend, _backend_path
+
+    path = getattr(settings, 'SMS_BACKEND', 'users.sms_utils.TwilioBackend')
+    if _backend is None or _backend_path != path:
+        _backend = import_string(path)()
+        _backend_path = path
+    return _backend
+
+
+def get_executor():
+    """Return the process-wide SMS worker pool, creating it on first use"""
+    global _executor
+
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'SMS_WORKERS', 4),
+                    thread_name_prefix='sms',
+                )
+    return _executor
+
+
+def send_sms_otp(phone_number, otp):
+    """
+    Send SMS OTP using the configured backend (blocking)
+
+    Args:
+        phone_number: Phone number with country code (e.g., +1234567890)
+        otp: The OTP code to send
+
+    Returns:
+        tuple: (success: bool, message: str)
+    """
+    backend = get_sms_backend()
+    configured, reason = backend.is_configured()
+    if not configured:
+        return False, f"{reason}. OTP: {otp}"
+
+    try:
+        with external_call('sms'):
+            sid = backend.send(phone_number, OTP_MESSAGE.format(otp=otp))
+        return True, f"SMS sent successfully (SID: {sid})"
+
     except Exception as e:
         return False, f"SMS sending failed: {str(e)}. OTP: {otp}"
 
 
+def _send_in_background(phone_number, otp):
+    success, message = send_sms_otp(phone_number, otp)
+    if not success:
+        logger.error("SMS to %s failed: %s", phone_number, message.split('. OTP:')[0])
+
+
+def dispatch_sms_otp(phone_number, otp):
+    """
+    Queue an SMS OTP on the worker pool once the current transaction commits
+
+    Configuration problems are reported immediately (so development setups can
+    still surface the OTP); provider errors are only logged.
+
+    Returns:
+        tuple: (queued: bool, message: str)
+    """
+    configured, reason = get_sms_backend().is_configured()
+    if not configured:
+        return False, f"{reason}. OTP: {otp}"
+
+    transaction.on_commit(lambda: get_executor().submit(_send_in_background, phone_number, otp))
+    return True, "SMS queued for delivery"
+
+
 def verify_phone_number(phone_number, otp):
     """
     Verify phone OTP code
-    
+
     Args:
         phone_number: Phone number to verify
         otp: OTP code entered by user
-        
+
     Returns:
         tuple: (success: bool, message: str)
     """
@@ -1,3 +1,1942 @@
-from django.test import TestCase
+import atexit
+import base64
+import importlib
+import io
+import os
+import shutil
+import socketserver
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+import httpx
+from PIL import Image
+
+from django.conf import settings
+from django.contrib.auth import authenticate
+from django.core import mail
+from django.core.cache import cache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase as DjangoTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import include, path, reverse
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import AuthenticationFailed, ErrorDetail
+from rest_framework.renderers import JSONRenderer
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from config.cache import get_and_delete, sqlite as sqlite_cache
+from config.cache.redis import RedisCache
+from config.cache.sqlite import SQLiteCache
+
+from .models import EmailOutbox, PendingRegistration, PhoneOTP, RevokedToken, User
+from . import (
+    async_views, email_service, firebase_utils, hashing, http, id_tokens, image_store, metrics, outbox,
+    query_budget, renderers, retention, revocation, sms_utils, throttling, thumbnails, user_cache, views
+)
+from .email_templates import EMAIL_TEMPLATES, render_email
+from .management.commands.bench_oauth import FakeIssuer, StubOAuthServer
+from .otp_store import EMAIL_REGISTRATION, PHONE, CacheOTPStore, DatabaseOTPStore
+from .serializers import UserSerializer
+
+
+# Throwaway shared cache, so tests never touch the cache.sqlite3 of a dev or prod setup
+TEST_CACHE_DIR = tempfile.mkdtemp(prefix='trueneed-test-cache-')
+atexit.register(shutil.rmtree, TEST_CACHE_DIR, ignore_errors=True)
+
+
+@override_settings(
+    QUERY_BUDGETS_STRICT=True,
+    CACHES={
+        'default': {
+            'BACKEND': 'config.cache.sqlite.SQLiteCache',
+            'LOCATION': os.path.join(TEST_CACHE_DIR, 'cache.sqlite3'),
+            'OPTIONS': {'MAX_ENTRIES': 100000},
+        }
+    },
+)
+class TestCase(DjangoTestCase):
+    """Base for every test here: settings tests need whichever runner starts them"""
+
+
+@override_settings(EMAIL_OUTBOX_ASYNC=False)
+class EmailOutboxTests(TestCase):
+    """Outbox queues mail in the request and delivers it after commit"""
+
+    def setUp(self):
+        cache.clear()
+
+    def register(self, email='outbox@example.com'):
+        return self.client.post(reverse('register'), {
+            'email': email,
+            'name': 'Outbox User',
+            'password': 'Str0ng!Pass',
+            'password2': 'Str0ng!Pass',
+        }, content_type='application/json')
+
+    def test_register_queues_email_and_sends_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            response = self.register()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('otp', response.json())
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(len(callbacks), 1)
+
+        for callback in callbacks:
+            callback()
+
+        entry = EmailOutbox.objects.get()
+        self.assertEqual(entry.status, EmailOutbox.STATUS_SENT)
+        self.assertEqual(len(mail.outbox), 1)
+        pending = cache.get('otp:email:outbox@example.com')
+        self.assertIn(pending['otp'], mail.outbox[0].body)
+
+    def test_failed_delivery_is_retried_with_backoff(self):
+        entry = EmailOutbox.objects.create(to_email='a@example.com', subject='Hi', body='Body')
+
+        with mock.patch('users.outbox.send_email', side_effect=OSError('smtp down')):
+            self.assertEqual(outbox.deliver(entry.pk), EmailOutbox.STATUS_PENDING)
+
+        entry.refresh_from_db()
+        self.assertEqual(entry.attempts, 1)
+        self.assertEqual(entry.last_error, 'smtp down')
+        self.assertGreater(entry.next_attempt_at, timezone.now())
+        # Not due yet, so a second delivery attempt is refused
+        self.assertIsNone(outbox.deliver(entry.pk))
+
+    @override_settings(EMAIL_OUTBOX_MAX_ATTEMPTS=2)
+    def test_exhausted_retries_move_to_dead_letter(self):
+        entry = EmailOutbox.objects.create(to_email='a@example.com', subject='Hi', body='Body')
+
+        with mock.patch('users.outbox.send_email', side_effect=OSError('smtp down')):
+            outbox.deliver(entry.pk)
+            EmailOutbox.objects.filter(pk=entry.pk).update(next_attempt_at=timezone.now())
+            self.assertEqual(outbox.deliver(entry.pk), EmailOutbox.STATUS_DEAD)
+
+        entry.refresh_from_db()
+        self.assertEqual(entry.status, EmailOutbox.STATUS_DEAD)
+        self.assertEqual(entry.attempts, 2)
+
+    def test_process_due_releases_stale_locks(self):
+        entry = EmailOutbox.objects.create(
+            to_email='a@example.com',
+            subject='Hi',
+            body='Body',
+            status=EmailOutbox.STATUS_SENDING,
+            locked_at=timezone.now() - timedelta(hours=1),
+        )
+
+        self.assertEqual(outbox.process_due(), {EmailOutbox.STATUS_SENT: 1})
+        entry.refresh_from_db()
+        self.assertEqual(entry.status, EmailOutbox.STATUS_SENT)
+        self.assertEqual(len(mail.outbox), 1)
+
+
+class EmailTemplateTests(TestCase):
+    """Precompiled email templates render every placeholder"""
+
+    def test_templates_leave_no_placeholders(self):
+        context = {'name': 'Ada', 'otp': '123456', 'reset_link': 'http://localhost/reset'}
+        for template_name in EMAIL_TEMPLATES:
+            subject, text, html = render_email(template_name, **context)
+            self.assertTrue(subject)
+            self.assertNotIn('{{', text)
+            self.assertNotIn('{{', html)
+            self.assertIn('TrueNeed Team', html)
+
+    def test_html_part_escapes_values(self):
+        _, text, html = render_email('otp', name='<b>Ada</b>', otp='123456')
+
+        self.assertIn('Hi <b>Ada</b>,', text)
+        self.assertIn('&lt;b&gt;Ada&lt;/b&gt;', html)
+        self.assertNotIn('<b>Ada</b>', html)
+        self.assertIn('123456', html)
+
+
+class FakeSMTPServer(socketserver.ThreadingTCPServer):
+    """Minimal local SMTP server that counts connections and messages"""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, drop_after_message=False):
+        self.connections = 0
+        self.messages = []
+        self.drop_after_message = drop_after_message
+        super().__init__(('127.0.0.1', 0), FakeSMTPHandler)
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class FakeSMTPHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(line.encode() + b'\r\n')
+
+    def handle(self):
+        self.server.connections += 1
+        self.reply('220 fake.smtp ready')
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode().strip().upper()
+            if command.startswith(('EHLO', 'HELO')):
+                self.reply('250 fake.smtp')
+            elif command == 'DATA':
+                self.reply('354 end with <CRLF>.<CRLF>')
+                data = []
+                while True:
+                    chunk = self.rfile.readline()
+                    if chunk in (b'.\r\n', b''):
+                        break
+                    data.append(chunk)
+                self.server.messages.append(b''.join(data))
+                self.reply('250 queued')
+                if self.server.drop_after_message:
+                    return
+            elif command == 'QUIT':
+                self.reply('221 bye')
+                return
+            else:
+                self.reply('250 ok')
+
+
+class EmailTransportPoolTests(TestCase):
+    """Django email backend connections are pooled and reused"""
+
+    def setUp(self):
+        self.server = FakeSMTPServer()
+        self.addCleanup(self.server.stop)
+        self.settings_override = override_settings(
+            EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend',
+            EMAIL_HOST='127.0.0.1',
+            EMAIL_PORT=self.server.port,
+            EMAIL_USE_TLS=False,
+            EMAIL_HOST_USER='',
+            EMAIL_HOST_PASSWORD='',
+            EMAIL_POOL_SIZE=2,
+        )
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+
+    def test_connection_is_reused_across_messages(self):
+        for i in range(5):
+            self.assertTrue(email_service.send_email(f'user{i}@example.com', 'Hi', 'Body', '<p>Body</p>'))
+
+        self.assertEqual(len(self.server.messages), 5)
+        self.assertEqual(self.server.connections, 1)
+
+    def test_concurrent_senders_share_bounded_pool(self):
+        threads = [
+            threading.Thread(target=email_service.send_email, args=(f'user{i}@example.com', 'Hi', 'Body'))
+            for i in range(10)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(self.server.messages), 10)
+        self.assertLessEqual(self.server.connections, 2)
+
+    def test_reconnects_after_server_drops_connection(self):
+        self.server.drop_after_message = True
+
+        for i in range(3):
+            self.assertTrue(email_service.send_email(f'user{i}@example.com', 'Hi', 'Body', fail_silently=False))
+
+        self.assertEqual(len(self.server.messages), 3)
+        self.assertEqual(self.server.connections, 3)
+
+
+@override_settings(SMS_BACKEND='users.sms_utils.StubBackend')
+class SMSDispatchTests(TestCase):
+    """Phone endpoints queue SMS on the worker pool instead of blocking"""
+
+    def setUp(self):
+        cache.clear()
+        sms_utils.StubBackend.outbox.clear()
+
+    def test_phone_register_dispatches_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('phone-register'), {
+                'phone_number': '+15550000001',
+                'name': 'Phone User',
+                'password': 'Str0ng!Pass',
+                'password2': 'Str0ng!Pass',
+            }, content_type='application/json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('otp', response.json())
+
+        sms_utils.get_executor().shutdown(wait=True)
+        sms_utils._executor = None
+        self.assertEqual(len(sms_utils.StubBackend.outbox), 1)
+        self.assertEqual(sms_utils.StubBackend.outbox[0][0], '+15550000001')
+
+    @override_settings(SMS_BACKEND='users.sms_utils.TwilioBackend', TWILIO_ACCOUNT_SID='')
+    def test_unconfigured_provider_returns_otp_for_development(self):
+        response = self.client.post(reverse('phone-register'), {
+            'phone_number': '+15550000002',
+            'name': 'Phone User',
+            'password': 'Str0ng!Pass',
+            'password2': 'Str0ng!Pass',
+        }, content_type='application/json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('otp', response.json())
+
+    @override_settings(TWILIO_ACCOUNT_SID='AC123', TWILIO_AUTH_TOKEN='token', TWILIO_PHONE_NUMBER='+15550000000')
+    def test_twilio_client_is_created_once(self):
+        client_class = mock.Mock()
+        client_class.return_value.messages.create.return_value.sid = 'SM1'
+
+        # twilio is imported on first use; stand in for the installed package
+        fake_twilio = {'twilio': mock.Mock(), 'twilio.rest': mock.Mock(Client=client_class)}
+        with mock.patch.object(sms_utils, 'TWILIO_AVAILABLE', True), \
+                mock.patch.dict(sys.modules, fake_twilio), \
+                mock.patch.object(sms_utils.TwilioBackend, '_client', None):
+            backend = sms_utils.TwilioBackend()
+            for _ in range(3):
+                backend.send('+15550000003', 'hi')
+
+        client_class.assert_called_once_with('AC123', 'token')
+        self.assertEqual(client_class.return_value.messages.create.call_count, 3)
+
+
+class OTPStoreContract:
+    """Behaviour shared by every OTP store"""
+
+    store_class = None
+
+    def setUp(self):
+        cache.clear()
+        self.store = self.store_class()
+        self.data = {'name': 'Ada', 'password': 'hashed', 'avatar_color': None}
+
+    def test_correct_otp_verifies(self):
+        otp = self.store.issue(EMAIL_REGISTRATION, 'ada@example.com', self.data)
+
+        result = self.store.verify(EMAIL_REGISTRATION, 'ada@example.com', otp)
+
+        self.assertTrue(result.found)
+        self.assertTrue(result.success)
+        self.assertEqual(result.data['name'], 'Ada')
+
+    def test_unknown_key_is_not_found(self):
+        result = self.store.verify(EMAIL_REGISTRATION, 'nobody@example.com', '123456')
+        self.assertFalse(result.found)
+
+    def test_wrong_guesses_lock_after_five_attempts(self):
+        otp = self.store.issue(EMAIL_REGISTRATION, 'ada@example.com', self.data)
+        wrong = '000000' if otp != '000000' else '111111'
+
+        messages = [self.store.verify(EMAIL_REGISTRATION, 'ada@example.com', wrong).message for _ in range(5)]
+
+        self.assertEqual(messages[0], 'Invalid OTP. 4 attempts remaining.')
+        self.assertEqual(messages[-1], 'Invalid OTP. Account locked. Please request a new OTP.')
+        locked = self.store.verify(EMAIL_REGISTRATION, 'ada@example.com', otp)
+        self.assertFalse(locked.success)
+        self.assertEqual(locked.message, 'Too many failed attempts. Please request a new OTP.')
+
+    def test_reissue_resets_attempts(self):
+        self.store.issue(PHONE, '+15550000001', {**self.data, 'purpose': 'login'})
+        for _ in range(5):
+            self.store.verify(PHONE, '+15550000001', 'xxxxxx')
+
+        otp, data = self.store.reissue(PHONE, '+15550000001')
+
+        self.assertEqual(data['purpose'], 'login')
+        self.assertTrue(self.store.verify(PHONE, '+15550000001', otp).success)
+
+    def test_discard_forgets_record(self):
+        self.store.issue(EMAIL_REGISTRATION, 'ada@example.com', self.data)
+        self.store.discard(EMAIL_REGISTRATION, 'ada@example.com')
+
+        self.assertIsNone(self.store.reissue(EMAIL_REGISTRATION, 'ada@example.com'))
+
+
+class CacheOTPStoreTests(OTPStoreContract, TestCase):
+    store_class = CacheOTPStore
+
+    def test_otp_traffic_issues_no_queries(self):
+        with self.assertNumQueries(0):
+            otp = self.store.issue(EMAIL_REGISTRATION, 'ada@example.com', self.data)
+            self.store.verify(EMAIL_REGISTRATION, 'ada@example.com', 'xxxxxx')
+            self.store.verify(EMAIL_REGISTRATION, 'ada@example.com', otp)
+
+    def test_expired_otp_is_rejected(self):
+        otp = self.store.issue(EMAIL_REGISTRATION, 'ada@example.com', self.data)
+
+        with override_settings(OTP_EXPIRY_SECONDS=0):
+            result = self.store.verify(EMAIL_REGISTRATION, 'ada@example.com', otp)
+
+        self.assertEqual(result.message, 'OTP has expired. Please request a new one.')
+
+    def test_concurrent_guesses_never_exceed_attempt_limit(self):
+        otp = self.store.issue(EMAIL_REGISTRATION, 'ada@example.com', self.data)
+        results = []
+
+        def guess():
+            results.append(self.store.verify(EMAIL_REGISTRATION, 'ada@example.com', 'xxxxxx').message)
+
+        threads = [threading.Thread(target=guess) for _ in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sum(m.startswith('Invalid OTP') for m in results), 5)
+        self.assertFalse(self.store.verify(EMAIL_REGISTRATION, 'ada@example.com', otp).success)
+
+
+class DatabaseOTPStoreTests(OTPStoreContract, TestCase):
+    store_class = DatabaseOTPStore
+
+    def test_records_live_in_fallback_tables(self):
+        self.store.issue(EMAIL_REGISTRATION, 'ada@example.com', self.data)
+        self.store.issue(PHONE, '+15550000001', {**self.data, 'purpose': 'registration'})
+
+        self.assertTrue(PendingRegistration.objects.filter(email='ada@example.com').exists())
+        self.assertTrue(PhoneOTP.objects.filter(phone_number='+15550000001').exists())
+
+
+class OTPRegistrationFlowTests(TestCase):
+    """Register and verify through the API with the cache-backed store"""
+
+    def setUp(self):
+        cache.clear()
+
+    def test_register_then_verify_creates_user(self):
+        self.client.post(reverse('register'), {
+            'email': 'flow@example.com',
+            'name': 'Flow User',
+            'password': 'Str0ng!Pass',
+            'password2': 'Str0ng!Pass',
+        }, content_type='application/json')
+        otp = cache.get('otp:email:flow@example.com')['otp']
+
+        response = self.client.post(reverse('verify-otp'), {
+            'email': 'flow@example.com',
+            'otp': otp,
+        }, content_type='application/json')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(User.objects.filter(email='flow@example.com').exists())
+        self.assertFalse(PendingRegistration.objects.exists())
+        self.assertIsNone(cache.get('otp:email:flow@example.com'))
+
+
+class RetentionTests(TestCase):
+    """Expired OTP rows are purged in batches with a size report"""
+
+    def setUp(self):
+        old = timezone.now() - timedelta(days=30)
+        for i in range(5):
+            PendingRegistration.objects.create(
+                email=f'old{i}@example.com', name='Old', password='x', otp='123456', profile_image='A' * 1000,
+            )
+        PendingRegistration.objects.update(created_at=old, otp_created_at=old)
+        PendingRegistration.objects.create(email='fresh@example.com', name='Fresh', password='x', otp='123456')
+        PhoneOTP.objects.create(phone_number='+15550000001', otp='123456')
+        PhoneOTP.objects.update(created_at=old, otp_created_at=old)
+        EmailOutbox.objects.create(to_email='a@example.com', subject='s', body='b', status=EmailOutbox.STATUS_SENT)
+        EmailOutbox.objects.create(to_email='b@example.com', subject='s', body='b')
+        EmailOutbox.objects.update(created_at=old)
+
+    def test_purge_deletes_only_expired_rows(self):
+        report = retention.purge_expired(batch_size=2)
+
+        self.assertEqual(report['pending_registrations']['rows'], 5)
+        self.assertGreaterEqual(report['pending_registrations']['bytes'], 5000)
+        self.assertEqual(report['phone_otps']['rows'], 1)
+        self.assertEqual(report['email_outbox']['rows'], 1)
+        self.assertEqual(list(PendingRegistration.objects.values_list('email', flat=True)), ['fresh@example.com'])
+        # Pending outbox mail is never purged
+        self.assertEqual(EmailOutbox.objects.get().status, EmailOutbox.STATUS_PENDING)
+
+    def test_dry_run_reports_without_deleting(self):
+        report = retention.purge_expired(dry_run=True)
+
+        self.assertEqual(report['pending_registrations']['rows'], 5)
+        self.assertEqual(PendingRegistration.objects.count(), 6)
+
+    def test_reissued_otp_keeps_its_record(self):
+        # A resend keeps the original row, so its age counts from the new code
+        DatabaseOTPStore().reissue(EMAIL_REGISTRATION, 'old0@example.com')
+        DatabaseOTPStore().reissue(PHONE, '+15550000001')
+
+        report = retention.purge_expired()
+
+        self.assertEqual(report['pending_registrations']['rows'], 4)
+        self.assertEqual(report['phone_otps']['rows'], 0)
+        self.assertTrue(PendingRegistration.objects.filter(email='old0@example.com').exists())
+
+
+@override_settings(OTP_STORE='database', EMAIL_OUTBOX_ASYNC=False, SMS_BACKEND='users.sms_utils.StubBackend')
+class QueryPlanTests(TestCase):
+    """Every query issued by the auth endpoints must be served by an index"""
+
+    # Tables small enough (or queried rarely enough) that a scan is acceptable
+    ALLOWED_SCANS = {'django_content_type', 'django_migrations'}
+
+    def plans(self, queries):
+        plans = []
+        with connection.cursor() as cursor:
+            for query in queries:
+                sql = query['sql']
+                if not sql.lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE')):
+                    continue
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                plans.append((sql, [row[-1] for row in cursor.fetchall()]))
+        return plans
+
+    def assertIndexed(self, method, url, data=None, **extra):
+        with CaptureQueriesContext(connection) as ctx:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = getattr(self.client, method)(url, data, content_type='application/json', **extra)
+        self.assertLess(response.status_code, 500)
+
+        for sql, details in self.plans(ctx.captured_queries):
+            for detail in details:
+                if any(t in detail for t in self.ALLOWED_SCANS):
+                    continue
+                if detail.startswith('SCAN') or 'TEMP B-TREE' in detail:
+                    self.fail(f"Unindexed plan '{detail}' for {url}:\n{sql}")
+        return response
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('plan@example.com', 'Plan User', 'Str0ng!Pass', phone_number='+15550000009')
+
+    def auth_header(self):
+        response = self.client.post(reverse('login'), {'email': 'plan@example.com', 'password': 'Str0ng!Pass'},
+                                    content_type='application/json')
+        return {'HTTP_AUTHORIZATION': f"Bearer {response.json()['tokens']['access']}"}
+
+    def test_email_registration_endpoints(self):
+        payload = {'email': 'new@example.com', 'name': 'New', 'password': 'Str0ng!Pass', 'password2': 'Str0ng!Pass'}
+        self.assertIndexed('post', reverse('register'), payload)
+        self.assertIndexed('post', reverse('resend-otp'), {'email': 'new@example.com'})
+        self.assertIndexed('post', reverse('verify-otp'), {'email': 'new@example.com', 'otp': '000000'})
+        otp = PendingRegistration.objects.get(email='new@example.com').otp
+        self.assertIndexed('post', reverse('verify-otp'), {'email': 'new@example.com', 'otp': otp})
+
+    def test_phone_endpoints(self):
+        self.assertIndexed('post', reverse('phone-login'), {'phone_number': '+15550000009'})
+        self.assertIndexed('post', reverse('phone-verify-otp'), {'phone_number': '+15550000009', 'otp': '000000'})
+        payload = {'phone_number': '+15550000010', 'name': 'New', 'password': 'x', 'password2': 'x'}
+        self.assertIndexed('post', reverse('phone-register'), payload)
+        otp = PhoneOTP.objects.get(phone_number='+15550000010').otp
+        self.assertIndexed('post', reverse('phone-verify-otp'), {'phone_number': '+15550000010', 'otp': otp})
+
+    def test_session_endpoints(self):
+        self.assertIndexed('post', reverse('login'), {'email': 'plan@example.com', 'password': 'Str0ng!Pass'})
+        headers = self.auth_header()
+        self.assertIndexed('get', reverse('user-detail'), **headers)
+        self.assertIndexed('patch', reverse('update-profile'), {'avatar_color': '#10b981'}, **headers)
+        self.assertIndexed('post', reverse('forgot-password'), {'email': 'plan@example.com'})
+        self.assertIndexed('delete', reverse('delete-account'), **headers)
+
+
+class HashingPoolTests(TestCase):
+    """Password hashing runs on a bounded pool that sheds load when full"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('hash@example.com', 'Hash User', 'Str0ng!Pass')
+        self.pool = hashing.HashingPool(workers=1, queue_size=1, timeout=5)
+        patcher = mock.patch.object(hashing, '_pool', self.pool)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def saturate(self):
+        release = threading.Event()
+        threads = [threading.Thread(target=self.pool.run, args=(release.wait,)) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        while self.pool.in_flight < 2:
+            pass
+        self.addCleanup(lambda: [release.set(), *(t.join() for t in threads)])
+        return release
+
+    def test_login_verifies_password_through_pool(self):
+        response = self.client.post(reverse('login'), {'email': 'hash@example.com', 'password': 'Str0ng!Pass'},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.pool.in_flight, 0)
+
+    def test_saturated_pool_rejects_login_but_serves_me(self):
+        token = str(RefreshToken.for_user(self.user).access_token)
+        self.saturate()
+        self.assertEqual(self.pool.queue_depth, 1)
+
+        response = self.client.post(reverse('login'), {'email': 'hash@example.com', 'password': 'Str0ng!Pass'},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertEqual(self.pool.rejected, 1)
+
+        response = self.client.get(reverse('user-detail'), HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.assertEqual(response.status_code, 200)
+
+    def test_slow_hash_answers_503_and_frees_the_thread(self):
+        token = str(RefreshToken.for_user(self.user).access_token)
+        self.pool.timeout = 0.05
+        release = threading.Event()
+        self.addCleanup(release.set)
+        self.pool.submit(release.wait)
+
+        # The login's hash queues behind the stuck one and is given up on
+        response = self.client.post(reverse('login'), {'email': 'hash@example.com', 'password': 'Str0ng!Pass'},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(self.pool.timed_out, 1)
+        self.assertIsNone(authenticate(username='hash@example.com', password='Str0ng!Pass'))
+
+        response = self.client.get(reverse('user-detail'), HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.assertEqual(response.status_code, 200)
+        # The abandoned hash gave its queue slot back
+        self.assertEqual(self.pool.in_flight, 1)
+
+    @override_settings(SERVER_THREADS=8, HASHING_POOL_WORKERS=None, HASHING_POOL_QUEUE=None)
+    def test_default_pool_leaves_request_threads_free(self):
+        with mock.patch.object(hashing, '_pool', None):
+            pool = hashing.get_hashing_pool()
+        self.addCleanup(pool._executor.shutdown)
+        self.assertEqual(pool.capacity, 4)
+        self.assertLessEqual(pool.workers, 4)
+
+    def test_saturated_pool_fails_django_login_without_error(self):
+        self.saturate()
+
+        # The admin login goes through django.contrib.auth.authenticate()
+        response = self.client.post('/admin/login/', {'username': 'hash@example.com', 'password': 'Str0ng!Pass'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(authenticate(username='hash@example.com', password='Str0ng!Pass'))
+        self.assertEqual(self.pool.rejected, 2)
+
+    def test_pool_state_is_exported_as_metrics(self):
+        self.saturate()
+        self.client.post(reverse('login'), {'email': 'hash@example.com', 'password': 'Str0ng!Pass'},
+                         content_type='application/json')
+
+        lines = self.client.get('/metrics').content.decode().splitlines()
+        self.assertIn('# TYPE hashing_pool_queue_depth gauge', lines)
+        self.assertIn('hashing_pool_queue_depth 1', lines)
+        self.assertIn('hashing_pool_in_flight 2', lines)
+        self.assertIn('# TYPE hashing_pool_rejected_total counter', lines)
+        self.assertIn('hashing_pool_rejected_total 1', lines)
+
+    def test_unknown_email_costs_a_single_hash(self):
+        with mock.patch.object(hashing.hashers, 'make_password', wraps=hashing.hashers.make_password) as make:
+            response = self.client.post(reverse('login'), {'email': 'nobody@example.com', 'password': 'Str0ng!Pass'},
+                                        content_type='application/json')
+
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(make.call_count, 1)
+
+
+class UserCacheTests(TestCase):
+    """Authenticated requests are served from the user cache until the user changes"""
+
+    def setUp(self):
+        user_cache.get_user_cache().clear()
+        self.user = User.objects.create_user('cache@example.com', 'Cache User', 'Str0ng!Pass')
+        self.auth = {'HTTP_AUTHORIZATION': f'Bearer {RefreshToken.for_user(self.user).access_token}'}
+
+    def me(self):
+        return self.client.get(reverse('user-detail'), **self.auth)
+
+    def test_repeat_requests_skip_the_database(self):
+        self.assertEqual(self.me().status_code, 200)
+        with self.assertNumQueries(0):
+            response = self.me()
+        self.assertEqual(response.json()['email'], 'cache@example.com')
+
+    def test_profile_update_invalidates(self):
+        self.me()
+        response = self.client.patch(reverse('update-profile'), {'name': 'Renamed'},
+                                     content_type='application/json', **self.auth)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.me().json()['name'], 'Renamed')
+
+    def test_admin_style_edit_invalidates(self):
+        self.me()
+        user = User.objects.get(pk=self.user.pk)
+        user.is_active = False
+        user.save()
+        self.assertEqual(self.me().status_code, 401)
+
+    def test_deleted_account_is_rejected(self):
+        self.me()
+        response = self.client.delete(reverse('delete-account'), **self.auth)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.me().status_code, 401)
+
+    def test_cached_instance_is_not_shared(self):
+        cache_ = user_cache.UserCache(maxsize=4, ttl=60)
+        cache_.set(self.user.pk, self.user)
+        first = cache_.get(self.user.pk)
+        first.name = 'Mutated'
+        self.assertEqual(cache_.get(self.user.pk).name, 'Cache User')
+
+    def test_lru_bound_and_ttl(self):
+        cache_ = user_cache.UserCache(maxsize=2, ttl=60)
+        for pk in (1, 2, 3):
+            cache_.set(pk, self.user)
+        self.assertIsNone(cache_.get(1))
+        self.assertIsNotNone(cache_.get(3))
+
+        with mock.patch.object(user_cache.time, 'monotonic', return_value=user_cache.time.monotonic() + 61):
+            self.assertIsNone(cache_.get(3))
+        self.assertEqual(len(cache_), 1)
+
+    def test_lookup_racing_an_invalidation_is_not_cached(self):
+        cache_ = user_cache.UserCache(maxsize=4, ttl=60)
+        generation = cache_.generation
+        cache_.invalidate(self.user.pk)
+        cache_.set(self.user.pk, self.user, generation)
+        self.assertIsNone(cache_.get(self.user.pk))
+
+
+@override_settings(REVOCATION_SYNC_SECONDS=60)
+class TokenRevocationTests(TestCase):
+    """Logout revokes tokens by jti; checks are in-memory lookups"""
+
+    def setUp(self):
+        user_cache.get_user_cache().clear()
+        patcher = mock.patch.object(revocation, '_list', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.user = User.objects.create_user('revoke@example.com', 'Revoke User', 'Str0ng!Pass')
+        self.refresh = RefreshToken.for_user(self.user)
+        self.access = str(self.refresh.access_token)
+
+    def auth(self, token=None):
+        return {'HTTP_AUTHORIZATION': f'Bearer {token or self.access}'}
+
+    def test_logout_revokes_refresh_and_access_tokens(self):
+        response = self.client.post(reverse('logout'), {'refresh_token': str(self.refresh)},
+                                    content_type='application/json', **self.auth())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(RevokedToken.objects.count(), 2)
+
+        response = self.client.post(reverse('token_refresh'), {'refresh': str(self.refresh)},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(self.client.get(reverse('user-detail'), **self.auth()).status_code, 401)
+
+    def test_refresh_still_works_for_other_tokens(self):
+        other = RefreshToken.for_user(self.user)
+        self.client.post(reverse('logout'), {'refresh_token': str(self.refresh)},
+                         content_type='application/json', **self.auth())
+
+        response = self.client.post(reverse('token_refresh'), {'refresh': str(other)},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        new_access = response.json()['access']
+        self.assertEqual(self.client.get(reverse('user-detail'), **self.auth(new_access)).status_code, 200)
+
+    def test_revoking_several_tokens_is_one_insert(self):
+        access = self.refresh.access_token
+        with self.assertNumQueries(1):
+            revocation.revoke(self.refresh, access)
+        # Revoking again (e.g. a repeated logout) is a no-op, not an IntegrityError
+        revocation.revoke(access)
+
+        self.assertEqual(RevokedToken.objects.count(), 2)
+        self.assertTrue(revocation.is_revoked(access))
+
+    def test_checks_do_not_query_the_database(self):
+        revocations = revocation.get_revocation_list()
+        revocations.sync()
+        with self.assertNumQueries(0):
+            for _ in range(100):
+                self.assertFalse(revocations.is_revoked('unknown-jti'))
+
+    def test_sync_picks_up_other_processes_and_prunes_expired(self):
+        revocations = revocation.get_revocation_list()
+        revocations.sync()
+        now = timezone.now()
+        RevokedToken.objects.create(jti='elsewhere', expires_at=now + timedelta(hours=1))
+        revocations.add('stale', (now - timedelta(seconds=1)).timestamp())
+
+        revocations._next_sync = 0
+        self.assertTrue(revocations.is_revoked('elsewhere'))
+        self.assertFalse(revocations.is_revoked('stale'))
+        self.assertEqual(len(revocations), 1)
+
+    def test_expired_revocations_are_purged(self):
+        now = timezone.now()
+        RevokedToken.objects.create(jti='old', expires_at=now - timedelta(hours=1))
+        RevokedToken.objects.create(jti='live', expires_at=now + timedelta(hours=1))
+
+        report = retention.purge_expired()
+
+        self.assertEqual(report['revoked_tokens']['rows'], 1)
+        self.assertEqual(list(RevokedToken.objects.values_list('jti', flat=True)), ['live'])
+
+
+class ImageStoreTests(TestCase):
+    """Profile images are stored once by hash and served with cache validators"""
+
+    PNG = b'\x89PNG\r\n\x1a\n' + os.urandom(150_000)
+
+    def setUp(self):
+        user_cache.get_user_cache().clear()
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        settings = override_settings(IMAGE_STORE_ROOT=root, IMAGE_BASE_URL='http://api')
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.root = root
+
+        self.user = User.objects.create_user('image@example.com', 'Image User', 'Str0ng!Pass')
+        self.auth = {'HTTP_AUTHORIZATION': f'Bearer {RefreshToken.for_user(self.user).access_token}'}
+
+    def data_url(self, data=None):
+        return 'data:image/png;base64,' + base64.b64encode(data or self.PNG).decode()
+
+    def upload(self, value):
+        return self.client.patch(reverse('update-profile'), {'profile_image': value},
+                                 content_type='application/json', **self.auth)
+
+    def stored_files(self):
+        return [name for _, _, names in os.walk(self.root) for name in names]
+
+    def test_upload_is_stored_once_and_referenced_by_url(self):
+        response = self.upload(self.data_url())
+        self.assertEqual(response.status_code, 200)
+
+        url = response.json()['user']['profile_image']
+        key = image_store.hashlib.sha256(self.PNG).hexdigest() + '.png'
+        self.assertEqual(url, f'http://api/api/auth/images/{key}/')
+        self.assertEqual(User.objects.get(pk=self.user.pk).profile_image, f'/api/auth/images/{key}/')
+
+        # Same content again (or echoed back URL) reuses the file
+        self.upload(self.data_url())
+        self.upload(url)
+        self.assertEqual(self.stored_files(), [key])
+
+    def test_me_payload_no_longer_carries_the_image(self):
+        inline = len(self.data_url())
+        self.upload(self.data_url())
+        response = self.client.get(reverse('user-detail'), **self.auth)
+        self.assertLess(len(response.content) * 100, inline)
+
+    def test_image_is_served_with_strong_etag_and_immutable_caching(self):
+        url = self.upload(self.data_url()).json()['user']['profile_image'][len('http://api'):]
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertEqual(b''.join(response.streaming_content), self.PNG)
+        self.assertEqual(response['ETag'], f'"{image_store.hashlib.sha256(self.PNG).hexdigest()}"')
+        self.assertIn('immutable', response['Cache-Control'])
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertIn('max-age=31536000', response['Cache-Control'])
+
+    def test_missing_image_is_not_cached(self):
+        response = self.client.get(reverse('profile-image', kwargs={'key': '0' * 64 + '.png'}))
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(response.has_header('ETag'))
+
+    def test_rejects_non_images_and_oversized_uploads(self):
+        self.assertEqual(self.upload(self.data_url(b'<svg onload=alert(1)>')).status_code, 400)
+        with override_settings(IMAGE_MAX_BYTES=1024):
+            self.assertEqual(self.upload(self.data_url()).status_code, 400)
+        self.assertEqual(self.upload('javascript:alert(1)').status_code, 400)
+        self.assertEqual(self.stored_files(), [])
+
+    def test_migration_moves_inline_images_into_the_store(self):
+        User.objects.filter(pk=self.user.pk).update(profile_image=self.data_url())
+        PendingRegistration.objects.create(email='inline@example.com', name='Inline', password='x', otp='123456',
+                                           profile_image='data:image/png;base64,not-base64')
+        migration = importlib.import_module('users.migrations.0010_store_profile_images')
+
+        from django.apps import apps
+        migration.store_inline_images(apps, connection.schema_editor())
+
+        # The migration's frozen layout matches what the live store serves
+        url = User.objects.get(pk=self.user.pk).profile_image
+        key = image_store.hashlib.sha256(self.PNG).hexdigest() + '.png'
+        self.assertEqual(url, image_store.image_url(key))
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertEqual(len(self.stored_files()), 1)
+        self.assertIsNone(PendingRegistration.objects.get(email='inline@example.com').profile_image)
+
+
+class AvatarUploadTests(TestCase):
+    """Multipart avatar uploads are spooled, resized in worker processes and stored"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # One real spawn worker shared by the class; starting one is slow
+        cls.pool = thumbnails.ThumbnailPool(workers=1, queue_size=1)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.pool._executor.shutdown()
+        super().tearDownClass()
+
+    def setUp(self):
+        user_cache.get_user_cache().clear()
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        settings = override_settings(IMAGE_STORE_ROOT=root, IMAGE_BASE_URL='http://api', AVATAR_SIZES=(256, 64))
+        settings.enable()
+        self.addCleanup(settings.disable)
+        patcher = mock.patch.object(thumbnails, '_pool', self.pool)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.user = User.objects.create_user('avatar@example.com', 'Avatar User', 'Str0ng!Pass')
+        self.auth = {'HTTP_AUTHORIZATION': f'Bearer {RefreshToken.for_user(self.user).access_token}'}
+
+    def jpeg(self, size=(1200, 600)):
+        out = io.BytesIO()
+        Image.new('RGB', size, (200, 40, 90)).save(out, 'JPEG')
+        return out.getvalue()
+
+    def upload(self, data, name='photo.jpg'):
+        return self.client.post(reverse('avatar-upload'), {'image': SimpleUploadedFile(name, data)}, **self.auth)
+
+    def stalled_pool(self, future, timeout=30):
+        pool = thumbnails.ThumbnailPool(workers=1, queue_size=0, timeout=timeout)
+        pool._executor = mock.Mock(submit=mock.Mock(return_value=future))
+        patcher = mock.patch.object(thumbnails, '_pool', pool)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return pool
+
+    def test_invalid_content_length_is_rejected(self):
+        response = self.client.post(reverse('avatar-upload'), {'image': SimpleUploadedFile('a.jpg', self.jpeg())},
+                                    CONTENT_LENGTH='lots', **self.auth)
+        self.assertEqual(response.status_code, 400)
+
+    def test_slow_render_answers_503(self):
+        self.stalled_pool(Future(), timeout=0.01)
+        response = self.upload(self.jpeg())
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Retry-After', response)
+
+    def test_broken_pool_answers_503_and_is_replaced(self):
+        future = Future()
+        future.set_exception(BrokenProcessPool())
+        pool = self.stalled_pool(future)
+
+        self.assertEqual(self.upload(self.jpeg()).status_code, 503)
+        self.assertTrue(pool.broken)
+        replacement = thumbnails.get_thumbnail_pool()
+        self.addCleanup(replacement._executor.shutdown)
+        self.assertIsNot(replacement, pool)
+
+    def test_upload_is_resized_into_thumbnails(self):
+        response = self.upload(self.jpeg())
+        self.assertEqual(response.status_code, 200)
+
+        user = User.objects.get(pk=self.user.pk)
+        self.assertEqual(set(user.profile_thumbnails), {'256', '64'})
+        self.assertEqual(user.profile_image, user.profile_thumbnails['256'])
+        self.assertEqual(response.json()['user']['profile_thumbnails']['64'], 'http://api' + user.profile_thumbnails['64'])
+
+        for size, url in user.profile_thumbnails.items():
+            served = self.client.get(url)
+            self.assertEqual(served['Content-Type'], 'image/webp')
+            with Image.open(io.BytesIO(b''.join(served.streaming_content))) as image:
+                self.assertEqual(image.size, (int(size), int(size) // 2))
+
+    def test_oversized_upload_is_rejected(self):
+        with override_settings(AVATAR_MAX_UPLOAD_BYTES=1024):
+            response = self.upload(self.jpeg())
+        self.assertEqual(response.status_code, 413)
+        self.assertIsNone(User.objects.get(pk=self.user.pk).profile_thumbnails)
+
+    def test_rejects_non_images_and_missing_files(self):
+        self.assertEqual(self.upload(b'<svg onload=alert(1)>', 'x.svg').status_code, 400)
+        response = self.client.post(reverse('avatar-upload'), {}, **self.auth)
+        self.assertEqual(response.status_code, 400)
+
+    def test_saturated_pool_is_503(self):
+        with mock.patch.object(self.pool, '_slots', threading.BoundedSemaphore(1)) as slots:
+            slots.acquire()
+            response = self.upload(self.jpeg())
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '2')
+
+    def test_json_image_update_drops_thumbnails(self):
+        self.upload(self.jpeg())
+        self.client.patch(reverse('update-profile'), {'profile_image': None},
+                          content_type='application/json', **self.auth)
+        self.assertIsNone(User.objects.get(pk=self.user.pk).profile_thumbnails)
+
+
+class ProfileConcurrencyTests(TestCase):
+    """/me/ revalidates by row version and /profile/ honours If-Match"""
+
+    def setUp(self):
+        user_cache.get_user_cache().clear()
+        self.user = User.objects.create_user('etag@example.com', 'Etag User', 'Str0ng!Pass')
+        self.auth = {'HTTP_AUTHORIZATION': f'Bearer {RefreshToken.for_user(self.user).access_token}'}
+
+    def me(self, **headers):
+        return self.client.get(reverse('user-detail'), **self.auth, **headers)
+
+    def patch(self, data, **headers):
+        return self.client.patch(reverse('update-profile'), data, content_type='application/json',
+                                 **self.auth, **headers)
+
+    def test_me_revalidates_with_etag(self):
+        response = self.me()
+        etag = response['ETag']
+        self.assertIn('no-cache', response['Cache-Control'])
+        self.assertIn('Authorization', response['Vary'])
+
+        with self.assertNumQueries(0):
+            response = self.me(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+        response = self.patch({'avatar_color': '#10b981'})
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(self.me(HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        self.assertEqual(self.me(HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    def test_patch_writes_only_changed_columns(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.patch({'avatar_color': '#10b981'})
+        update = [q['sql'] for q in queries if q['sql'].startswith('UPDATE')]
+        self.assertEqual(len(update), 1)
+        self.assertIn('"avatar_color"', update[0])
+        self.assertNotIn('"name"', update[0])
+
+    def test_if_match_rejects_stale_writes(self):
+        etag = self.me()['ETag']
+
+        first = self.patch({'name': 'First'}, HTTP_IF_MATCH=etag)
+        self.assertEqual(first.status_code, 200)
+        second = self.patch({'name': 'Second'}, HTTP_IF_MATCH=etag)
+        self.assertEqual(second.status_code, 412)
+        self.assertEqual(User.objects.get(pk=self.user.pk).name, 'First')
+
+        # The ETag from the successful write is current, as is *
+        self.assertEqual(self.patch({'name': 'Third'}, HTTP_IF_MATCH=first['ETag']).status_code, 200)
+        self.assertEqual(self.patch({'name': 'Fourth'}, HTTP_IF_MATCH='*').status_code, 200)
+        self.assertEqual(self.patch({'name': 'Fifth'}, HTTP_IF_MATCH='"999.1"').status_code, 412)
+
+    def test_saves_outside_the_representation_keep_the_etag(self):
+        etag = self.me()['ETag']
+        user = User.objects.get(pk=self.user.pk)
+        with self.assertNumQueries(1):
+            user.last_login = timezone.now()
+            user.save(update_fields=['last_login'])
+        with self.assertNumQueries(1):
+            user.is_staff = True
+            user.save()
+        with self.assertNumQueries(0):
+            user.save(update_fields=[])
+
+        self.assertEqual(self.me(HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.patch({'name': 'Renamed'}, HTTP_IF_MATCH=etag).status_code, 200)
+
+    def test_representation_change_bumps_without_rereading(self):
+        user = User.objects.get(pk=self.user.pk)
+        with self.assertNumQueries(1):
+            user.profile_thumbnails = {'64': 'ab/thumb.webp'}
+            user.save()
+        with self.assertNumQueries(1):
+            user.profile_thumbnails['128'] = 'cd/thumb.webp'
+            user.save()
+
+        self.assertEqual(user.version, self.user.version + 2)
+        self.assertEqual(User.objects.get(pk=self.user.pk).version, user.version)
+
+    def test_saves_from_stale_copies_get_distinct_etags(self):
+        # Two processes holding the same cached user write different columns
+        first = User.objects.get(pk=self.user.pk)
+        stale = User.objects.get(pk=self.user.pk)
+        first.name = 'First'
+        first.save(update_fields=['name'])
+        stale.avatar_color = '#10b981'
+        stale.save(update_fields=['avatar_color'])
+
+        self.assertNotEqual(views.user_etag(first), views.user_etag(stale))
+        self.assertEqual(views.user_etag(stale), views.user_etag(User.objects.get(pk=self.user.pk)))
+
+    def test_conditional_write_refreshes_cached_user(self):
+        self.me()
+        self.patch({'name': 'Renamed'}, HTTP_IF_MATCH=self.me()['ETag'])
+        self.assertEqual(self.me().json()['name'], 'Renamed')
+
+
+class FastJSONTests(TestCase):
+    """orjson renderer/parser and the hand-written UserSerializer match stock DRF output"""
+
+    def setUp(self):
+        user_cache.get_user_cache().clear()
+        self.user = User.objects.create_user('json@example.com', 'Jsön User', 'Str0ng!Pass')
+        self.user.avatar_color = '#10b981'
+        self.user.profile_thumbnails = {'128': '/api/auth/images/' + '0' * 64 + '.webp/'}
+        self.user.save()
+
+    def test_renderer_output_matches_drf(self):
+        data = {
+            'user': UserSerializer(self.user).data,
+            'detail': ErrorDetail(_('Token is revoked'), code='token_not_valid'),
+            'amount': Decimal('1.50'),
+        }
+        self.assertEqual(renderers.ORJSONRenderer().render(data), JSONRenderer().render(data))
+        with mock.patch.object(renderers, 'ORJSON_AVAILABLE', False):
+            self.assertEqual(renderers.ORJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_parser_rejects_malformed_json(self):
+        response = self.client.post(reverse('login'), '{"email": ', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('JSON parse error', response.json()['detail'])
+
+    def test_user_serializer_matches_model_serializer(self):
+        from .management.commands.bench_json import LegacyUserSerializer
+
+        user = User.objects.get(pk=self.user.pk)
+        self.assertEqual(UserSerializer(user).data, LegacyUserSerializer(user).data)
+
+
+@override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': {
+    'login_ip': '5/min',
+    'login_email': '3/min',
+    'phone_register_ip': '20/hour',
+    'phone_register_phone': '2/hour',
+}})
+class ThrottleTests(TestCase):
+    """OTP and login endpoints shed abusive clients before hashing or sending"""
+
+    def setUp(self):
+        cache.clear()
+        User.objects.create_user('throttle@example.com', 'Throttle User', 'Str0ng!Pass')
+
+    def login(self, email='throttle@example.com', **extra):
+        return self.client.post(reverse('login'), {'email': email, 'password': 'wrong'},
+                                content_type='application/json', **extra)
+
+    def test_login_is_limited_per_email_before_authenticating(self):
+        for _ in range(3):
+            self.assertEqual(self.login().status_code, 401)
+
+        with mock.patch.object(views.EmailBackend, 'authenticate_email') as authenticate:
+            response = self.login()
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response['Retry-After']), 0)
+        authenticate.assert_not_called()
+
+        # Same address in another case is the same client; others are unaffected
+        self.assertEqual(self.login('THROTTLE@example.com').status_code, 429)
+        self.assertEqual(self.login('other@example.com', REMOTE_ADDR='10.0.0.3').status_code, 401)
+
+    def test_login_is_limited_per_ip(self):
+        for i in range(5):
+            self.assertEqual(self.login(f'user{i}@example.com').status_code, 401)
+        self.assertEqual(self.login('user5@example.com').status_code, 429)
+        self.assertEqual(self.login('user5@example.com', REMOTE_ADDR='10.0.0.2').status_code, 401)
+
+    def test_spoofed_forwarded_for_does_not_reset_ip_limit(self):
+        for i in range(5):
+            self.assertEqual(self.login(f'user{i}@example.com', HTTP_X_FORWARDED_FOR=f'203.0.113.{i}').status_code,
+                             401)
+        response = self.login('user5@example.com', HTTP_X_FORWARDED_FOR='203.0.113.99')
+        self.assertEqual(response.status_code, 429)
+
+    def test_phone_register_is_limited_before_sending_sms(self):
+        payload = {'phone_number': '+15550001111', 'name': 'Phone', 'password': 'Str0ng!Pass',
+                   'password2': 'Str0ng!Pass'}
+        with mock.patch('users.views.dispatch_sms_otp', return_value=(True, 'queued')) as dispatch:
+            for _ in range(2):
+                response = self.client.post(reverse('phone-register'), payload, content_type='application/json')
+                self.assertEqual(response.status_code, 200)
+            response = self.client.post(reverse('phone-register'), payload, content_type='application/json')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(dispatch.call_count, 2)
+
+    def test_window_slides_instead_of_resetting(self):
+        throttle = throttling.EmailThrottle()
+        view = mock.Mock(throttle_scope='login')
+        request = mock.Mock(data={'email': 'slide@example.com'})
+
+        # Window of 60s: fill it just before the boundary
+        with mock.patch.object(throttle, 'timer', return_value=59.0):
+            self.assertEqual([throttle.allow_request(request, view) for _ in range(4)], [True] * 3 + [False])
+        # Just after the boundary the previous window still counts almost fully...
+        with mock.patch.object(throttle, 'timer', return_value=61.0):
+            self.assertFalse(throttle.allow_request(request, view))
+            self.assertGreater(throttle.wait(), 0)
+        # ...and has decayed enough by the end of the next window
+        with mock.patch.object(throttle, 'timer', return_value=119.0):
+            self.assertTrue(throttle.allow_request(request, view))
+
+    async def test_async_login_is_throttled(self):
+        with override_settings(ROOT_URLCONF=__name__):
+            for _ in range(3):
+                await self.async_client.post('/api/auth/login/', {'email': 'throttle@example.com', 'password': 'x'},
+                                             content_type='application/json')
+            response = await self.async_client.post('/api/auth/login/', {
+                'email': 'throttle@example.com', 'password': 'x',
+            }, content_type='application/json')
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+
+
+class MetricsTests(TestCase):
+    """Per-view histograms and provider timings exposed in Prometheus format"""
+
+    def setUp(self):
+        cache.clear()
+        user_cache.get_user_cache().clear()
+        self.user = User.objects.create_user('metrics@example.com', 'Metrics User', 'Str0ng!Pass')
+        self.auth = {'HTTP_AUTHORIZATION': f'Bearer {RefreshToken.for_user(self.user).access_token}'}
+
+    def sample(self, line_prefix):
+        """Value of the series starting with line_prefix in a fresh scrape (0 if absent)"""
+        body = self.client.get('/metrics').content.decode()
+        for line in body.splitlines():
+            if line.startswith(line_prefix + ' '):
+                return float(line.rsplit(' ', 1)[1])
+        return 0
+
+    def test_requests_are_recorded_per_view_and_status(self):
+        series = 'http_request_duration_seconds_count{view="user-detail",method="GET",status="200"}'
+        before = self.sample(series)
+        for _ in range(3):
+            self.client.get(reverse('user-detail'), **self.auth)
+        self.client.get(reverse('user-detail'))
+        self.assertEqual(self.sample(series), before + 3)
+        self.assertGreater(
+            self.sample('http_request_duration_seconds_count{view="user-detail",method="GET",status="401"}'), 0)
+
+        # Unknown paths share one series instead of one per URL
+        self.client.get('/no/such/path/')
+        self.assertGreater(
+            self.sample('http_request_duration_seconds_count{view="unmatched",method="GET",status="404"}'), 0)
+
+    def test_db_queries_are_counted_per_request(self):
+        count = 'http_request_db_queries_count{view="update-profile"}'
+        total = 'http_request_db_queries_sum{view="update-profile"}'
+        seconds = 'http_request_db_duration_seconds_sum{view="update-profile"}'
+        before = [self.sample(series) for series in (count, total, seconds)]
+        self.client.patch(reverse('update-profile'), {'name': 'Renamed'}, content_type='application/json',
+                          **self.auth)
+        self.assertEqual(self.sample(count), before[0] + 1)
+        # At least the user lookup and the UPDATE
+        self.assertGreaterEqual(self.sample(total), before[1] + 2)
+        self.assertGreater(self.sample(seconds), before[2])
+
+    def test_external_calls_are_timed_by_outcome(self):
+        ok = 'external_call_duration_seconds_count{service="sms",outcome="ok"}'
+        error = 'external_call_duration_seconds_count{service="sms",outcome="error"}'
+        before_ok, before_error = self.sample(ok), self.sample(error)
+
+        with override_settings(SMS_BACKEND='users.sms_utils.StubBackend'):
+            sms_utils.send_sms_otp('+15550002222', '123456')
+            with mock.patch.object(sms_utils.StubBackend, 'send', side_effect=RuntimeError('down')):
+                sms_utils.send_sms_otp('+15550002222', '123456')
+
+        self.assertEqual(self.sample(ok), before_ok + 1)
+        self.assertEqual(self.sample(error), before_error + 1)
+
+    def test_observations_from_finished_threads_are_kept(self):
+        series = 'external_call_duration_seconds_count{service="test",outcome="ok"}'
+        before = self.sample(series)
+
+        def work():
+            with metrics.external_call('test'):
+                pass
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(self.sample(series), before + 4)
+        self.assertTrue(all(thread.is_alive() for thread, _ in metrics._shards))
+        self.assertEqual(self.sample(series), before + 4)
+
+    def test_histogram_buckets_are_cumulative(self):
+        lines = metrics.REQUEST_QUERIES.render({('v',): [1, 0, 2, 0, 0, 0, 0, 0, 0, 0, 1, 30.0]})
+        self.assertIn('http_request_db_queries_bucket{view="v",le="0"} 1', lines)
+        self.assertIn('http_request_db_queries_bucket{view="v",le="2"} 3', lines)
+        self.assertIn('http_request_db_queries_bucket{view="v",le="+Inf"} 4', lines)
+        self.assertIn('http_request_db_queries_sum{view="v"} 30.0', lines)
+        self.assertIn('http_request_db_queries_count{view="v"} 4', lines)
+
+    @override_settings(METRICS_TOKEN='scrape-secret')
+    def test_token_protects_endpoint(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape-secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+
+
+class QueryBudgetTests(TestCase):
+    """@query_budget fails tests on extra queries and logs them in production"""
+
+    def setUp(self):
+        cache.clear()
+        user_cache.get_user_cache().clear()
+        User.objects.create_user('budget@example.com', 'Budget User', 'Str0ng!Pass')
+
+    def login(self):
+        return self.client.post(reverse('login'), {'email': 'budget@example.com', 'password': 'Str0ng!Pass'},
+                                content_type='application/json')
+
+    def test_strict_mode_fails_the_request(self):
+        self.assertTrue(settings.QUERY_BUDGETS_STRICT)
+        self.assertEqual(self.login().status_code, 200)
+
+        with mock.patch.object(views.LoginView, 'query_budget', 0):
+            with self.assertRaisesMessage(query_budget.QueryBudgetExceeded, 'login ran 1 queries, budget is 0'):
+                self.login()
+
+    @override_settings(QUERY_BUDGETS_STRICT=False)
+    def test_production_logs_the_sql_without_params(self):
+        with mock.patch.object(views.LoginView, 'query_budget', 0), \
+                self.assertLogs('users.query_budget', 'WARNING') as logs:
+            response = self.login()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('FROM "users"', logs.output[0])
+        self.assertNotIn('budget@example.com', logs.output[0])
+
+    def test_every_endpoint_declares_a_budget(self):
+        from .urls import urlpatterns
+
+        missing = [pattern.name for pattern in urlpatterns
+                   if getattr(pattern.callback, 'query_budget', None) is None
+                   and getattr(getattr(pattern.callback, 'view_class', None), 'query_budget', None) is None]
+        self.assertEqual(missing, [])
+
+
+class FirebaseVerificationTests(TestCase):
+    """Lazy SDK init and cached ID-token verification"""
+
+    def setUp(self):
+        for name, value in (('_app', object()), ('_retry_at', 0.0), ('_token_cache', None)):
+            patcher = mock.patch.object(firebase_utils, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.exp = int(time.time()) + 3600
+
+    def claims(self, **extra):
+        return {'uid': 'firebase-uid', 'phone_number': '+15550003333', 'exp': self.exp, **extra}
+
+    def test_repeated_tokens_are_verified_once(self):
+        with mock.patch('firebase_admin.auth.verify_id_token', return_value=self.claims()) as verify:
+            first = firebase_utils.verify_phone_token('token-a')
+            first['phone_number'] = 'mutated by a caller'
+            second = firebase_utils.verify_phone_token('token-a')
+            firebase_utils.verify_phone_token('token-b')
+
+        self.assertEqual(verify.call_count, 2)
+        self.assertEqual(second['phone_number'], '+15550003333')
+
+    def test_entries_expire_with_the_token(self):
+        with mock.patch('firebase_admin.auth.verify_id_token', return_value=self.claims()) as verify:
+            firebase_utils.verify_phone_token('token-a')
+            with mock.patch.object(firebase_utils.time, 'time', return_value=self.exp):
+                firebase_utils.verify_phone_token('token-a')
+        self.assertEqual(verify.call_count, 2)
+
+    def test_failures_are_not_cached(self):
+        with mock.patch('firebase_admin.auth.verify_id_token', side_effect=ValueError('bad')) as verify:
+            self.assertIsNone(firebase_utils.verify_phone_token('token-a'))
+            self.assertIsNone(firebase_utils.verify_phone_token('token-a'))
+        self.assertEqual(verify.call_count, 2)
+        self.assertEqual(len(firebase_utils.get_token_cache()), 0)
+
+    def test_full_cache_evicts_expired_then_soonest_expiring(self):
+        token_cache = firebase_utils.VerifiedTokenCache(maxsize=2)
+        token_cache.set('soon', self.claims(exp=self.exp - 1000))
+        token_cache.set('late', self.claims())
+        token_cache.set('new', self.claims())
+
+        self.assertIsNone(token_cache.get('soon'))
+        self.assertIsNotNone(token_cache.get('late'))
+        self.assertIsNotNone(token_cache.get('new'))
+
+    def test_concurrent_first_calls_initialize_once(self):
+        firebase_utils._app = None
+        barrier = threading.Barrier(4)
+
+        def initialize_app(credential):
+            time.sleep(0.05)
+            return mock.sentinel.app
+
+        def first_call():
+            barrier.wait()
+            return firebase_utils.initialize_firebase()
+
+        with mock.patch.object(firebase_utils.os.path, 'exists', return_value=True), \
+                mock.patch('firebase_admin.credentials.Certificate'), \
+                mock.patch('firebase_admin.initialize_app', side_effect=initialize_app) as init:
+            with ThreadPoolExecutor(max_workers=4) as pool:
+                apps = list(pool.map(lambda _: first_call(), range(4)))
+
+        self.assertEqual(init.call_count, 1)
+        self.assertEqual(apps, [mock.sentinel.app] * 4)
+
+    @override_settings(FIREBASE_INIT_RETRY_SECONDS=60)
+    def test_missing_credentials_are_retried_later(self):
+        firebase_utils._app = None
+        now = time.monotonic()
+
+        with mock.patch.object(firebase_utils.os.path, 'exists', return_value=False) as exists:
+            self.assertIsNone(firebase_utils.initialize_firebase())
+            self.assertIsNone(firebase_utils.initialize_firebase())
+        self.assertEqual(exists.call_count, 1)
+
+        # The secret is mounted after the worker started
+        with mock.patch.object(firebase_utils.time, 'monotonic', return_value=now + 61), \
+                mock.patch.object(firebase_utils.os.path, 'exists', return_value=True), \
+                mock.patch('firebase_admin.credentials.Certificate'), \
+                mock.patch('firebase_admin.initialize_app', return_value=mock.sentinel.app):
+            self.assertIs(firebase_utils.initialize_firebase(), mock.sentinel.app)
+
+
+class StartupTests(TestCase):
+    """Optional provider SDKs stay out of worker boot"""
+
+    def test_cold_start_does_not_import_provider_sdks(self):
+        # Generous budget: this guards the lazy imports, the timing gate is for real hardware
+        out = io.StringIO()
+        call_command('bench_startup', runs=1, budget_ms=60000, stdout=out)
+        self.assertIn('Within the startup budget', out.getvalue())
+
+
+class OAuthHTTPTests(TestCase):
+    """OAuth callbacks use pooled per-provider sessions with timeouts and safe retries"""
+
+    def setUp(self):
+        cache.clear()
+        user_cache.get_user_cache().clear()
+        self.server = StubOAuthServer(email='pooled@example.com')
+        self.addCleanup(self.server.stop)
+        self.addCleanup(http.close_sessions)
+        patcher = mock.patch.dict(views.OAUTH_ENDPOINTS['google'], {
+            'token': self.server.url('/token'),
+            'userinfo': self.server.url('/userinfo'),
+        })
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def callback(self, state):
+        cache.set(f'oauth_state_{state}', 'google', 600)
+        return self.client.get(f'/api/auth/oauth/google/callback/?code=xyz&state={state}')
+
+    def test_callbacks_share_one_keep_alive_connection(self):
+        for state in ('first', 'second'):
+            response = self.callback(state)
+            self.assertEqual(response.status_code, 302)
+            self.assertIn('access=', response['Location'])
+
+        self.assertTrue(User.objects.filter(email='pooled@example.com').exists())
+        self.assertEqual(self.server.requests, 4)
+        self.assertEqual(self.server.connections, 1)
+
+    def test_pooling_skips_connection_setup(self):
+        import requests
+
+        self.server.handshake_ms = 20
+        url = self.server.url('/userinfo')
+        headers = {'Authorization': 'Bearer stub-access-token'}
+
+        start = time.perf_counter()
+        for _ in range(5):
+            requests.get(url, headers=headers)
+        fresh = time.perf_counter() - start
+        self.assertEqual(self.server.connections, 5)
+
+        start = time.perf_counter()
+        for _ in range(5):
+            http.request('google', 'GET', url, headers=headers)
+        pooled = time.perf_counter() - start
+
+        self.assertEqual(self.server.connections, 6)
+        self.assertLess(pooled, fresh)
+
+    @override_settings(OAUTH_HTTP_TIMEOUT=(1, 0.2))
+    def test_stalled_code_exchange_times_out_without_replay(self):
+        import requests
+
+        with self.assertRaises(requests.Timeout):
+            http.request('google', 'POST', self.server.url('/token?sleep=1'), data={'code': 'xyz'})
+        # Authorization codes are single-use, so the POST is never retried
+        self.assertEqual(self.server.requests, 1)
+
+    @override_settings(OAUTH_HTTP_RETRIES=2)
+    def test_idempotent_calls_are_retried(self):
+        response = http.request('google', 'GET', self.server.url('/unavailable'))
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(self.server.requests, 3)
+
+
+@override_settings(GOOGLE_CLIENT_ID='test-client', JWKS_MIN_REFETCH_SECONDS=0)
+class IdTokenTests(TestCase):
+    """OAuth callbacks verify the id_token locally against a cached JWKS"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # RSA key generation is slow; one issuer serves the whole class
+        cls.issuer = FakeIssuer()
+
+    def setUp(self):
+        cache.clear()
+        user_cache.get_user_cache().clear()
+        self.server = StubOAuthServer()
+        self.server.jwks = {'keys': [self.issuer.jwk()]}
+        self.addCleanup(self.server.stop)
+        self.addCleanup(http.close_sessions)
+        patcher = mock.patch.dict(views.OAUTH_ENDPOINTS['google'], {
+            'token': self.server.url('/token'),
+            'userinfo': self.server.url('/userinfo'),
+            'jwks': self.server.url('/jwks'),
+        })
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def callback(self, state='abc'):
+        cache.set(f'oauth_state_{state}', 'google', 600)
+        return self.client.get(f'/api/auth/oauth/google/callback/?code=xyz&state={state}')
+
+    def verify(self, id_token):
+        return id_tokens.verify_id_token(id_token, 'google', self.server.url('/jwks'), 'test-client',
+                                         views.OAUTH_ENDPOINTS['google']['issuers'])
+
+    def test_callback_skips_userinfo(self):
+        self.server.id_token = self.issuer.id_token('test-client', email='idtoken@example.com')
+
+        for state in ('first', 'second'):
+            response = self.callback(state)
+            self.assertEqual(response.status_code, 302)
+            self.assertIn('access=', response['Location'])
+
+        self.assertTrue(User.objects.filter(email='idtoken@example.com', name='Stub User').exists())
+        # The JWKS is fetched once; userinfo is never called
+        self.assertEqual(self.server.paths, ['/token', '/jwks', '/token'])
+
+    def test_untrusted_tokens_are_rejected(self):
+        impostor = FakeIssuer(kid=self.issuer.kid)
+        cases = {
+            'signature': impostor.id_token('test-client'),
+            'audience': self.issuer.id_token('someone-else'),
+            'issuer': self.issuer.id_token('test-client', iss='https://evil.example.com'),
+            'expired': self.issuer.id_token('test-client', exp=int(time.time()) - 3600),
+            'unverified email': self.issuer.id_token('test-client', email_verified=False),
+        }
+        for case, id_token in cases.items():
+            with self.subTest(case):
+                with self.assertRaises(id_tokens.InvalidIdToken):
+                    self.verify(id_token)
+
+        self.server.id_token = cases['signature']
+        response = self.callback()
+        self.assertIn('error=', response['Location'])
+        self.assertFalse(User.objects.filter(email='stub@example.com').exists())
+
+    def test_keys_follow_cache_control(self):
+        self.server.jwks_max_age = 100
+        self.verify(self.issuer.id_token('test-client'))
+        entry = id_tokens.get_jwks_cache()._entries[self.server.url('/jwks')]
+        self.assertAlmostEqual(entry.expires_at - entry.fetched_at, 100)
+        self.assertAlmostEqual(entry.refresh_at - entry.fetched_at, 80)
+
+        # Expired keys are never used: the next login fetches synchronously
+        entry.expires_at = entry.refresh_at = 0
+        self.verify(self.issuer.id_token('test-client'))
+        self.assertEqual(self.server.paths.count('/jwks'), 2)
+
+    def test_keys_refresh_in_the_background(self):
+        self.verify(self.issuer.id_token('test-client'))
+        jwks_cache = id_tokens.get_jwks_cache()
+        entry = jwks_cache._entries[self.server.url('/jwks')]
+        entry.refresh_at = 0
+
+        # Served from the current keys while a background thread refetches
+        self.verify(self.issuer.id_token('test-client'))
+        deadline = time.monotonic() + 5
+        while jwks_cache._entries[self.server.url('/jwks')] is entry and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self.server.paths.count('/jwks'), 2)
+        self.assertIsNot(jwks_cache._entries[self.server.url('/jwks')], entry)
+
+    def test_rotated_keys_are_fetched(self):
+        self.verify(self.issuer.id_token('test-client'))
+        rotated = FakeIssuer(kid='rotated-key')
+        self.server.jwks = {'keys': [self.issuer.jwk(), rotated.jwk()]}
+
+        self.assertEqual(self.verify(rotated.id_token('test-client'))['email'], 'stub@example.com')
+        self.assertEqual(self.server.paths.count('/jwks'), 2)
+
+        with override_settings(JWKS_MIN_REFETCH_SECONDS=60):
+            self.verify(self.issuer.id_token('test-client'))
+            with self.assertRaisesMessage(id_tokens.InvalidIdToken, 'Unknown signing key'):
+                self.verify(FakeIssuer(kid='made-up').id_token('test-client'))
+        # A made-up kid right after a fetch doesn't trigger another one
+        self.assertEqual(self.server.paths.count('/jwks'), 3)
+
+
+class OAuthAccountTests(TestCase):
+    """OAuth logins find accounts by provider identity and link by verified email only"""
+
+    TENANT = '9188040d-6c67-4c5b-b112-36a304b66dad'
+
+    def setUp(self):
+        self.victim = User.objects.create_user('victim@example.com', 'Victim', 'Str0ng!Pass')
+
+    def microsoft(self, oid, email, **claims):
+        return views.microsoft_user_info({'tid': self.TENANT, 'oid': oid, 'email': email, 'name': 'MS User',
+                                          **claims})
+
+    def test_microsoft_email_claim_cannot_claim_an_account(self):
+        # Any tenant can put any address in email/preferred_username
+        with self.assertRaisesMessage(AuthenticationFailed, 'already exists'):
+            views.oauth_user('microsoft', self.microsoft('attacker-oid', 'victim@example.com'))
+
+        self.victim.refresh_from_db()
+        self.assertIsNone(self.victim.oauth_id)
+
+    def test_microsoft_account_is_keyed_on_tenant_and_object_id(self):
+        user = views.oauth_user('microsoft', self.microsoft('oid-1', 'ms@example.com'))
+        self.assertEqual(user.oauth_id, f'{self.TENANT}:oid-1')
+
+        # The tenant renaming the user's address is still the same account
+        again = views.oauth_user('microsoft', self.microsoft('oid-1', 'renamed@example.com'))
+        self.assertEqual(again.pk, user.pk)
+
+    def test_domain_verified_microsoft_email_links_the_account(self):
+        user = views.oauth_user('microsoft', self.microsoft('oid-2', 'victim@example.com', xms_edov=True))
+
+        self.assertEqual(user.pk, self.victim.pk)
+        self.assertEqual(User.objects.get(pk=self.victim.pk).oauth_id, f'{self.TENANT}:oid-2')
+
+    def test_microsoft_profile_without_ids_is_rejected(self):
+        with self.assertRaises(id_tokens.InvalidIdToken):
+            views.microsoft_user_info({'mail': 'graph@example.com', 'displayName': 'Graph'})
+
+    def test_google_verified_email_links_then_matches_on_sub(self):
+        claims = {'sub': '1234567890', 'email': 'victim@example.com', 'email_verified': True, 'name': 'G'}
+        self.assertEqual(views.oauth_user('google', claims).pk, self.victim.pk)
+
+        with self.assertNumQueries(1):
+            user = views.oauth_user('google', {**claims, 'email': 'new-address@example.com'})
+        self.assertEqual(user.pk, self.victim.pk)
+
+
+class FakeRedis:
+    """The few Redis commands Django's RedisCache and pop() send, over a dict shared per URL"""
+
+    servers = {}
+
+    def __init__(self, connection_pool):
+        self.data, self.commands = connection_pool
+
+    @classmethod
+    def from_url(cls, url, **options):
+        return cls.servers.setdefault(url, ({}, []))
+
+    def call(self, command):
+        self.commands.append(command)
+
+    def set(self, key, value, ex=None, nx=False):
+        self.call('set')
+        if nx and key in self.data:
+            return None
+        self.data[key] = value if isinstance(value, bytes) else str(value).encode()
+        return True
+
+    def get(self, key):
+        self.call('get')
+        return self.data.get(key)
+
+    def getdel(self, key):
+        self.call('getdel')
+        return self.data.pop(key, None)
+
+    def exists(self, key):
+        self.call('exists')
+        return int(key in self.data)
+
+    def incr(self, key, delta):
+        self.call('incr')
+        value = int(self.data.get(key, 0)) + delta
+        self.data[key] = str(value).encode()
+        return value
+
+    def delete(self, *keys):
+        self.call('delete')
+        return sum(self.data.pop(key, None) is not None for key in keys)
+
+
+class SharedCacheTests(TestCase):
+    """OAuth state, OTP records and throttle counters are shared by every worker process"""
+
+    def setUp(self):
+        cache.clear()
+        user_cache.get_user_cache().clear()
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp, ignore_errors=True)
+        self.location = os.path.join(tmp, 'cache.sqlite3')
+
+    def test_entries_from_another_process_are_visible(self):
+        script = (
+            'import sys\n'
+            'from django.conf import settings\n'
+            'settings.configure()\n'
+            'from config.cache.sqlite import SQLiteCache\n'
+            'shared = SQLiteCache(sys.argv[1], {})\n'
+            "shared.set('oauth_state_abc', 'google', 600)\n"
+            "shared.set('attempts', 0, 600)\n"
+            "shared.incr('attempts')\n"
+        )
+        subprocess.run([sys.executable, '-c', script, self.location], cwd=settings.BASE_DIR, check=True)
+
+        shared = SQLiteCache(self.location, {})
+        self.assertEqual(shared.incr('attempts'), 2)
+        self.assertEqual(get_and_delete(shared, 'oauth_state_abc'), 'google')
+        self.assertIsNone(get_and_delete(shared, 'oauth_state_abc'))
+
+    def test_pop_hands_an_entry_to_one_caller(self):
+        shared = SQLiteCache(self.location, {})
+        for _ in range(10):
+            shared.set('oauth_state_abc', 'google', 600)
+            with ThreadPoolExecutor(max_workers=8) as pool:
+                results = list(pool.map(lambda _: shared.pop('oauth_state_abc'), range(8)))
+            self.assertEqual(results.count('google'), 1)
+
+    def test_counters_records_and_expiry(self):
+        shared = SQLiteCache(self.location, {})
+        self.assertTrue(shared.add('bucket', 0, 600))
+        self.assertFalse(shared.add('bucket', 5, 600))
+        self.assertEqual([shared.incr('bucket') for _ in range(3)], [1, 2, 3])
+        with self.assertRaises(ValueError):
+            shared.incr('missing')
+
+        shared.set('expired', 'state', 0)
+        self.assertIsNone(shared.get('expired'))
+        self.assertIsNone(shared.pop('expired'))
+        self.assertTrue(shared.add('expired', 1, 600))
+
+        shared.set_many({'record': {'otp': '123456'}, 'record:attempts': 0}, 600)
+        self.assertEqual(shared.get_many(['record', 'record:attempts', 'missing']),
+                         {'record': {'otp': '123456'}, 'record:attempts': 0})
+
+    def test_entries_over_max_entries_are_culled(self):
+        shared = SQLiteCache(self.location, {'OPTIONS': {'MAX_ENTRIES': 50, 'CULL_FREQUENCY': 2}})
+        keys = [f'key{i}' for i in range(sqlite_cache.CULL_EVERY)]
+        for i, key in enumerate(keys):
+            shared.set(key, i, 600 + i)
+
+        # The entries closest to expiry go first
+        remaining = shared.get_many(keys)
+        self.assertEqual(len(remaining), 50)
+        self.assertIn(keys[-1], remaining)
+        self.assertNotIn(keys[0], remaining)
+
+    def test_redis_pop_is_one_getdel(self):
+        redis = mock.Mock(Redis=FakeRedis, ConnectionPool=FakeRedis)
+        with mock.patch.dict(sys.modules, {'redis': redis}):
+            shared = RedisCache('redis://cache.internal:6379/0', {})
+            shared.set('oauth_state_abc', 'google', 600)
+            shared.set('attempts', 0, 600)
+            self.assertEqual(shared.incr('attempts'), 1)
+
+            commands = FakeRedis.servers['redis://cache.internal:6379/0'][1]
+            commands.clear()
+            self.assertEqual(get_and_delete(shared, 'oauth_state_abc'), 'google')
+            self.assertEqual(commands, ['getdel'])
+            self.assertEqual(get_and_delete(shared, 'oauth_state_abc', 'gone'), 'gone')
+
+    def test_other_backends_fall_back_to_get_and_delete(self):
+        local = LocMemCache('fallback', {})
+        local.set('oauth_state_abc', 'google', 600)
+        self.assertEqual(get_and_delete(local, 'oauth_state_abc'), 'google')
+        self.assertIsNone(get_and_delete(local, 'oauth_state_abc'))
+
+    def test_oauth_state_stored_by_another_worker_is_accepted_once(self):
+        # Another process on the same cache file issued the state
+        SQLiteCache(settings.CACHES['default']['LOCATION'], {}).set('oauth_state_abc', 'google', 600)
+
+        with mock.patch.object(views.OAuthCallbackView, '_google_get_user_info',
+                               return_value={'email': 'worker@example.com', 'name': 'Worker User'}):
+            response = self.client.get('/api/auth/oauth/google/callback/?code=xyz&state=abc')
+            self.assertIn('access=', response['Location'])
+
+            response = self.client.get('/api/auth/oauth/google/callback/?code=xyz&state=abc')
+            self.assertIn('error=Invalid', response['Location'])
+
+
+# URLconf for AsyncViewTests: the async views shadow their sync counterparts
+urlpatterns = [
+    path('api/auth/login/', async_views.LoginView.as_view()),
+    path('api/auth/me/', async_views.UserDetailView.as_view()),
+    path('api/auth/verify-otp/', async_views.VerifyOTPView.as_view()),
+    path('api/auth/phone/verify-otp/', async_views.PhoneVerifyOTPView.as_view()),
+    path('api/auth/oauth/<str:provider>/callback/', async_views.OAuthCallbackView.as_view()),
+    path('api/auth/', include('users.urls')),
+]
+
+
+@override_settings(ROOT_URLCONF=__name__, FRONTEND_URL='http://frontend')
+class AsyncViewTests(TestCase):
+    """Native async views served through the ASGI handler"""
+
+    def setUp(self):
+        cache.clear()
+        user_cache.get_user_cache().clear()
+        self.user = User.objects.create_user('async@example.com', 'Async User', 'Str0ng!Pass')
+
+    async def test_login_then_me(self):
+        response = await self.async_client.post('/api/auth/login/', {
+            'email': 'async@example.com',
+            'password': 'Str0ng!Pass',
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        access = response.json()['tokens']['access']
+
+        response = await self.async_client.get('/api/auth/me/', headers={'Authorization': f'Bearer {access}'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['email'], 'async@example.com')
+
+        response = await self.async_client.get('/api/auth/me/', headers={
+            'Authorization': f'Bearer {access}',
+            'If-None-Match': response['ETag'],
+        })
+        self.assertEqual(response.status_code, 304)
+
+    async def test_login_rejects_wrong_password_and_bad_input(self):
+        response = await self.async_client.post('/api/auth/login/', {
+            'email': 'async@example.com',
+            'password': 'wrong',
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 401)
+
+        response = await self.async_client.post('/api/auth/login/', {'email': 'not-an-email'},
+                                                content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('password', response.json())
+
+    async def test_async_views_are_held_to_query_budgets(self):
+        login = {'email': 'async@example.com', 'password': 'Str0ng!Pass'}
+        with mock.patch.object(async_views.LoginView, 'query_budget', 0):
+            with self.assertRaisesMessage(query_budget.QueryBudgetExceeded, 'ran 1 queries, budget is 0'):
+                await self.async_client.post('/api/auth/login/', login, content_type='application/json')
+
+    async def test_me_requires_valid_token(self):
+        response = await self.async_client.get('/api/auth/me/')
+        self.assertEqual(response.status_code, 401)
+        self.assertIn('WWW-Authenticate', response)
+
+        response = await self.async_client.get('/api/auth/me/', headers={'Authorization': 'Bearer garbage'})
+        self.assertEqual(response.status_code, 401)
+
+    async def test_verify_otp_creates_user(self):
+        otp = CacheOTPStore().issue(EMAIL_REGISTRATION, 'new@example.com', {
+            'name': 'New User',
+            'password': self.user.password,
+            'avatar_color': None,
+        })
+
+        response = await self.async_client.post('/api/auth/verify-otp/', {
+            'email': 'new@example.com',
+            'otp': otp,
+        }, content_type='application/json')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(await User.objects.filter(email='new@example.com').aexists())
+        self.assertIsNone(cache.get('otp:email:new@example.com'))
+
+    async def test_phone_verify_logs_in_existing_user(self):
+        self.user.phone_number = '+15550001111'
+        await self.user.asave(update_fields=['phone_number'])
+        otp = CacheOTPStore().issue(PHONE, '+15550001111', {
+            'name': None, 'password': None, 'avatar_color': None, 'purpose': 'login',
+        })
+
+        response = await self.async_client.post('/api/auth/phone/verify-otp/', {
+            'phone_number': '+15550001111',
+            'otp': otp,
+        }, content_type='application/json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['user']['email'], 'async@example.com')
+
+    async def test_oauth_callback_awaits_provider(self):
+        def provider(request):
+            if request.url.path.endswith('/token'):
+                return httpx.Response(200, json={'access_token': 'provider-token'})
+            self.assertEqual(request.headers['Authorization'], 'Bearer provider-token')
+            return httpx.Response(200, json={'email': 'oauth@example.com', 'name': 'OAuth User'})
+
+        client = httpx.AsyncClient(transport=httpx.MockTransport(provider))
+        cache.set('oauth_state_abc', 'google', 600)
+
+        with mock.patch.object(async_views, 'get_http_client', return_value=client):
+            response = await self.async_client.get('/api/auth/oauth/google/callback/?code=xyz&state=abc')
+        await client.aclose()
+
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(response['Location'].startswith('http://frontend/oauth/callback?access='))
+        user = await User.objects.aget(email='oauth@example.com')
+        # Created in one insert with its random password already hashed: a
+        # second save would have bumped the version past the insert's
+        self.assertTrue(user.password)
+        self.assertEqual(user.version, 2)
+
+        # The state is single-use
+        response = await self.async_client.get('/api/auth/oauth/google/callback/?code=xyz&state=abc')
+        self.assertIn('error=Invalid', response['Location'])
+
+    @override_settings(GOOGLE_CLIENT_ID='test-client')
+    async def test_oauth_callback_verifies_id_token(self):
+        issuer = FakeIssuer()
+        server = StubOAuthServer()
+        server.jwks = {'keys': [issuer.jwk()]}
+        self.addCleanup(server.stop)
+        self.addCleanup(http.close_sessions)
+        id_token = issuer.id_token('test-client', email='async-idtoken@example.com')
+
+        def provider(request):
+            self.assertTrue(request.url.path.endswith('/token'), 'userinfo should not be called')
+            return httpx.Response(200, json={'access_token': 'provider-token', 'id_token': id_token})
+
+        client = httpx.AsyncClient(transport=httpx.MockTransport(provider))
+        cache.set('oauth_state_abc', 'google', 600)
+
+        with mock.patch.object(async_views, 'get_http_client', return_value=client), \
+                mock.patch.dict(views.OAUTH_ENDPOINTS['google'], {'jwks': server.url('/jwks')}):
+            response = await self.async_client.get('/api/auth/oauth/google/callback/?code=xyz&state=abc')
+        await client.aclose()
+
+        self.assertTrue(response['Location'].startswith('http://frontend/oauth/callback?access='))
+        self.assertTrue(await User.objects.filter(email='async-idtoken@example.com').aexists())
@@ -0,0 +1,122 @@
+"""
+Sliding-window throttles for the endpoints that hash passwords or send OTPs
+
+DRF's SimpleRateThrottle keeps a list of request timestamps per client and
+rewrites it on every hit (a non-atomic get/set that grows with the rate).
+These throttles approximate a sliding window with two fixed-window counters:
+the current window's count plus the previous one's, weighted by how much of
+it still overlaps the window. That is one atomic add/incr and one get per
+check, whatever the rate, and the counters live in THROTTLE_CACHE, so every
+worker process sharing that cache shares the limits.
+
+A view opts in with a throttle_scope; each throttle class checks the rate
+'<scope>_<kind>' from DEFAULT_THROTTLE_RATES (e.g. 'login_email'), keyed by
+client IP, submitted email or submitted phone number. Throttles run before
+the handler, so a rejected request never reaches password hashing or an
+email/SMS provider.
+"""
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.settings import api_settings
+from rest_framework.throttling import SimpleRateThrottle
+import hashlib
+
+
+class SlidingWindowThrottle(SimpleRateThrottle):
+    """Per-view scoped throttle; subclasses pick what identifies the client"""
+
+    kind = None
+    cache_format = 'throttle:%(scope)s:%(ident)s'
+
+    def __init__(self):
+        # The rate depends on the view's scope, so it is resolved in allow_request
+        self._wait = 0
+
+    def get_rate(self):
+        return api_settings.DEFAULT_THROTTLE_RATES.get(self.scope)
+
+    def get_ident_value(self, request):
+        raise NotImplementedError('.get_ident_value() must be overridden')
+
+    def get_cache_key(self, request, view):
+        value = self.get_ident_value(request)
+        if not value:
+            return None
+        # Hashed so emails and phone numbers never appear in cache keys
+        ident = hashlib.sha256(value.encode()).hexdigest()[:32]
+        return self.cache_format % {'scope': self.scope, 'ident': ident}
+
+    def allow_request(self, request, view):
+        scope = getattr(view, 'throttle_scope', None)
+        if not scope:
+            return True
+        self.scope = f'{scope}_{self.kind}'
+        self.rate = self.get_rate()
+        if self.rate is None:
+            return True
+        self.num_requests, self.duration = self.parse_rate(self.rate)
+
+        key = self.get_cache_key(request, view)
+        if key is None:
+            return True
+        return self.hit(key)
+
+    def hit(self, key):
+        cache = caches[getattr(settings, 'THROTTLE_CACHE', 'default')]
+        now = self.timer()
+        window = int(now // self.duration)
+        remaining = (window + 1) * self.duration - now
+
+        current_key = f'{key}:{window}'
+        cache.add(current_key, 0, self.duration * 2)
+        try:
+            count = cache.incr(current_key)
+        except ValueError:
+            # Expired between add() and incr()
+            cache.set(current_key, 1, self.duration * 2)
+            count = 1
+        previous = cache.get(f'{key}:{window - 1}', 0)
+
+        weight = remaining / self.duration
+        if previous * weight + count <= self.num_requests:
+            return True
+
+        # Time until the weighted previous window has drained enough
+        if count >= self.num_requests or not previous:
+            self._wait = remaining
+        else:
+            self._wait = max(0.0, remaining - (self.num_requests - count) * self.duration / previous)
+        return False
+
+    def wait(self):
+        return self._wait
+
+
+def submitted(request, field):
+    """Stripped string value of a request body field, or None"""
+    data = getattr(request, 'data', None)
+    value = data.get(field) if hasattr(data, 'get') else None
+    return value.strip() if isinstance(value, str) else None
+
+
+class IPThrottle(SlidingWindowThrottle):
+    kind = 'ip'
+
+    def get_ident_value(self, request):
+        # REMOTE_ADDR, or X-Forwarded-For only as far as NUM_PROXIES trusts it
+        return self.get_ident(request)
+
+
+class EmailThrottle(SlidingWindowThrottle):
+    kind = 'email'
+
+    def get_ident_value(self, request):
+        email = submitted(request, 'email')
+        return email and email.lower()
+
+
+class PhoneThrottle(SlidingWindowThrottle):
+    kind = 'phone'
+
+    def get_ident_value(self, request):
+        return submitted(request, 'phone_number')
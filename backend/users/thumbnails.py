@@ -0,0 +1,134 @@
+"""
+Avatar thumbnails rendered in a process pool
+
+Decoding and resizing an uploaded photo is CPU-heavy and briefly needs the
+full bitmap in memory, so it runs in a small pool of worker processes instead
+of on the request thread. Workers only see a file path and return the encoded
+thumbnails (a few KB each); at most AVATAR_WORKERS images are decoded at once
+and JPEGs are decoded at reduced scale, so memory per upload stays bounded.
+"""
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from django.conf import settings
+from rest_framework import status
+from rest_framework.exceptions import APIException
+import io
+import multiprocessing
+import threading
+
+
+class ThumbnailPoolSaturated(APIException):
+    """Raised when every thumbnail worker slot is taken, or a render timed out or lost its worker"""
+
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Server is busy, please retry shortly.'
+    default_code = 'thumbnails_saturated'
+    wait = 2
+
+
+class UnreadableImage(ValueError):
+    """Upload could not be decoded as an image"""
+
+
+def render_thumbnails(path, sizes, max_pixels):
+    """
+    Decode the image at path and return {size: encoded bytes} (runs in a worker)
+
+    Thumbnails are square-bounded, EXIF-rotated and re-encoded as WebP, which
+    also strips any metadata the original carried.
+    """
+    from PIL import Image, ImageOps
+
+    try:
+        with Image.open(path) as image:
+            width, height = image.size
+            if width * height > max_pixels:
+                raise UnreadableImage(f"Image is too large ({width}x{height})")
+
+            # JPEG can decode straight to a smaller scale
+            image.draft('RGB', (max(sizes), max(sizes)))
+            image = ImageOps.exif_transpose(image)
+            image = image.convert('RGBA' if image.mode in ('RGBA', 'LA', 'P') else 'RGB')
+
+            rendered = {}
+            for size in sorted(sizes, reverse=True):
+                image.thumbnail((size, size), Image.LANCZOS)
+                out = io.BytesIO()
+                image.save(out, 'WEBP', quality=85, method=4)
+                rendered[size] = out.getvalue()
+            return rendered
+    except UnreadableImage:
+        raise
+    except Exception as e:
+        raise UnreadableImage(f"Could not read image: {e}")
+
+
+class ThumbnailPool:
+    """Process pool with a bounded number of outstanding jobs"""
+
+    def __init__(self, workers, queue_size, timeout=30):
+        # spawn: workers never inherit the server's threads or open connections
+        self._executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context('spawn'),
+        )
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+        self.timeout = timeout
+        # A worker that died (e.g. killed for memory) breaks the whole executor
+        self.broken = False
+
+    def run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise ThumbnailPoolSaturated()
+        try:
+            future = self._executor.submit(fn, *args)
+        except BrokenProcessPool:
+            self._slots.release()
+            self.broken = True
+            raise ThumbnailPoolSaturated()
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda f: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            future.cancel()
+            raise ThumbnailPoolSaturated()
+        except BrokenProcessPool:
+            self.broken = True
+            raise ThumbnailPoolSaturated()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_thumbnail_pool():
+    """Return the process-wide thumbnail pool, creating it on first use (or after it broke)"""
+    global _pool
+
+    if _pool is None or _pool.broken:
+        with _pool_lock:
+            if _pool is None or _pool.broken:
+                workers = getattr(settings, 'AVATAR_WORKERS', 2)
+                _pool = ThumbnailPool(
+                    workers=workers,
+                    queue_size=getattr(settings, 'AVATAR_QUEUE', workers * 2),
+                )
+    return _pool
+
+
+def make_thumbnails(path):
+    """
+    Render the configured AVATAR_SIZES for the image at path
+
+    Returns:
+        dict: size -> WebP bytes
+    """
+    return get_thumbnail_pool().run(
+        render_thumbnails,
+        str(path),
+        tuple(getattr(settings, 'AVATAR_SIZES', (512, 128))),
+        getattr(settings, 'AVATAR_MAX_PIXELS', 40_000_000),
+    )
@@ -0,0 +1,33 @@
+"""
+simplejwt token classes that honour the revocation list
+
+Configured through SIMPLE_JWT['AUTH_TOKEN_CLASSES'] (access tokens presented to
+the API) and the refresh serializer, so revoked tokens fail verification just
+like expired ones.
+"""
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from .revocation import is_revoked, revoke
+
+
+class RevocableMixin:
+    def verify(self):
+        super().verify()
+        if is_revoked(self):
+            raise TokenError(_("Token is revoked"))
+
+    def revoke(self):
+        revoke(self)
+
+    # simplejwt calls blacklist() on rotation (BLACKLIST_AFTER_ROTATION)
+    blacklist = revoke
+
+
+class RevocableAccessToken(RevocableMixin, AccessToken):
+    pass
+
+
+class RevocableRefreshToken(RevocableMixin, RefreshToken):
+    access_token_class = RevocableAccessToken
@@ -1,11 +1,21 @@
-from django.urls import path
+from django.conf import settings
+from django.urls import path, re_path
 from rest_framework_simplejwt.views import TokenRefreshView
 from .views import (
     RegisterView, VerifyOTPView, ResendOTPView,
     LoginView, LogoutView, UserDetailView, UpdateProfileView, DeleteAccountView,
     ForgotPasswordView, ResetPasswordView, OAuthLoginView, OAuthCallbackView,
-    PhoneRegisterView, PhoneLoginView, PhoneVerifyOTPView, FirebasePhoneAuthView
+    PhoneRegisterView, PhoneLoginView, PhoneVerifyOTPView, FirebasePhoneAuthView,
+    ProfileImageView, AvatarUploadView
 )
+from .image_store import KEY_PATTERN
+from .query_budget import query_budget
+
+# Under ASGI, serve the hot endpoints with native async views
+if getattr(settings, 'AUTH_ASYNC_VIEWS', False):
+    from .async_views import (
+        VerifyOTPView, LoginView, UserDetailView, OAuthCallbackView, PhoneVerifyOTPView
+    )
 
 urlpatterns = [
     path('register/', RegisterView.as_view(), name='register'),
@@ -15,8 +25,11 @@ urlpatterns = [
     path('logout/', LogoutView.as_view(), name='logout'),
     path('me/', UserDetailView.as_view(), name='user-detail'),
     path('profile/', UpdateProfileView.as_view(), name='update-profile'),
+    path('profile/avatar/', AvatarUploadView.as_view(), name='avatar-upload'),
     path('account/', DeleteAccountView.as_view(), name='delete-account'),
-    path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    re_path(rf'^images/(?P<key>{KEY_PATTERN})/$', ProfileImageView.as_view(), name='profile-image'),
+    # simplejwt's view, so budgeted here: the revocation list sync and the lookup of the token's user
+    path('token/refresh/', query_budget(2)(TokenRefreshView.as_view()), name='token_refresh'),
     path('forgot-password/', ForgotPasswordView.as_view(), name='forgot-password'),
     path('reset-password/', ResetPasswordView.as_view(), name='reset-password'),
     path('oauth/<str:provider>/', OAuthLoginView.as_view(), name='oauth-login'),
@@ -0,0 +1,115 @@
+"""
+Per-process user cache for token authentication
+
+Every authenticated request used to load its user row. UserCache keeps recently
+seen users in a bounded LRU with a TTL, so repeat requests from the same user
+skip the database. Saves and deletes of a user invalidate the entry (see
+signals.py); the TTL bounds how long other processes can serve a stale copy.
+"""
+from collections import OrderedDict
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.dispatch import receiver
+import copy
+import threading
+import time
+
+
+class UserCache:
+    """Thread-safe LRU of user snapshots with per-entry expiry"""
+
+    def __init__(self, maxsize=1024, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def generation(self):
+        """Changes on every invalidation; pass it to set() to drop lookups that raced one"""
+        return self._generation
+
+    def get(self, user_id):
+        """Return a private copy of the cached user, or None"""
+        key = str(user_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            user = entry[1]
+        # Views mutate request.user, so callers never share the cached instance
+        return copy.copy(user)
+
+    def set(self, user_id, user, generation=None):
+        """Cache a snapshot of user unless an invalidation happened since `generation`"""
+        if self.maxsize <= 0:
+            return
+        snapshot = copy.copy(user)
+        key = str(user_id)
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            self._entries[key] = (time.monotonic() + self.ttl, snapshot)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._generation += 1
+            self._entries.pop(str(user_id), None)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_user_cache():
+    """Return the process-wide user cache, creating it on first use"""
+    global _cache
+
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = UserCache(
+                    maxsize=getattr(settings, 'USER_CACHE_SIZE', 1024),
+                    ttl=getattr(settings, 'USER_CACHE_TTL_SECONDS', 60),
+                )
+    return _cache
+
+
+def invalidate_user(user_id):
+    """
+    Drop a user from the cache now and again once the transaction commits
+
+    The second pass catches a concurrent request that re-read the old row
+    between the write and the commit.
+    """
+    user_cache = get_user_cache()
+    user_cache.invalidate(user_id)
+    transaction.on_commit(lambda: user_cache.invalidate(user_id))
+
+
+@receiver(setting_changed)
+def _reset_cache(setting, **kwargs):
+    global _cache
+
+    if setting.startswith('USER_CACHE_'):
+        _cache = None
@@ -2,36 +2,219 @@ from rest_framework import status, generics
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.views import APIView
+from rest_framework.parsers import MultiPartParser
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.exceptions import TokenError
 from rest_framework_simplejwt.tokens import RefreshToken
-from django.contrib.auth import authenticate, get_user_model
-from django.core.mail import send_mail
+from django.contrib.auth import get_user_model
 from django.conf import settings
-from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
+from django.db.models import Q
+from django.utils.http import parse_etags, urlsafe_base64_encode, urlsafe_base64_decode
 from django.utils.encoding import force_bytes, force_str
 from django.contrib.auth.tokens import default_token_generator
 from django.shortcuts import redirect
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.views import View
 from django.core.cache import cache
+from config.cache import get_and_delete
+import io
 import secrets
-import requests
 import urllib.parse
 from .serializers import (
     RegisterSerializer, LoginSerializer, UserSerializer, 
     ForgotPasswordSerializer, ResetPasswordSerializer,
     VerifyOTPSerializer, ResendOTPSerializer
 )
-from .models import PendingRegistration, PhoneOTP
-from .sms_utils import send_sms_otp
+from .otp_store import get_otp_store, EMAIL_REGISTRATION, PHONE
+from .backends import EmailBackend
+from .hashing import hash_password, verify_password
+from .id_tokens import InvalidIdToken, verify_id_token
+from . import http
+from .image_store import (
+    CONTENT_TYPES, CappedUploadHandler, InvalidImage, image_url, normalize_profile_image,
+    path_for, public_url, store_file
+)
+from .thumbnails import UnreadableImage, make_thumbnails
+from .revocation import revoke
+from .metrics import external_call, render as render_metrics
+from .query_budget import query_budget
+from .throttling import EmailThrottle, IPThrottle, PhoneThrottle
+from .tokens import RevocableRefreshToken
+from .outbox import enqueue_email
+from .email_templates import render_email
+from .sms_utils import dispatch_sms_otp
 from .firebase_utils import verify_phone_token
 
 User = get_user_model()
 
+# Token exchange and profile endpoints used by the OAuth callbacks. The
+# id_token in the token response is verified against the provider's JWKS
+# (users/id_tokens.py); userinfo is only called when a response has none.
+OAUTH_ENDPOINTS = {
+    'google': {
+        'token': 'https://oauth2.googleapis.com/token',
+        'userinfo': 'https://www.googleapis.com/oauth2/v2/userinfo',
+        'jwks': 'https://www.googleapis.com/oauth2/v3/certs',
+        'issuers': ('https://accounts.google.com', 'accounts.google.com'),
+    },
+    'microsoft': {
+        'token': 'https://login.microsoftonline.com/{tenant}/oauth2/v2.0/token',
+        'userinfo': 'https://graph.microsoft.com/v1.0/me',
+        'jwks': 'https://login.microsoftonline.com/{tenant}/discovery/v2.0/keys',
+        # Multi-tenant apps see one issuer per tenant ({tid} comes from the token)
+        'issuers': ('https://login.microsoftonline.com/{tid}/v2.0',),
+    },
+}
+
+
+def provider_endpoints(provider):
+    """OAUTH_ENDPOINTS[provider] with the configured Microsoft tenant filled into the URLs"""
+    tenant = getattr(settings, 'MICROSOFT_TENANT', 'common')
+    return {
+        name: value.format(tenant=tenant) if isinstance(value, str) else value
+        for name, value in OAUTH_ENDPOINTS[provider].items()
+    }
+
+
+def microsoft_user_info(data):
+    """Identity, email and name from Microsoft id_token claims"""
+    # email and preferred_username are whatever the user's tenant says, so the
+    # account is keyed on the tenant and object ids; the email only links an
+    # existing account when the tenant owns its domain (xms_edov)
+    if not data.get('tid') or not data.get('oid'):
+        raise InvalidIdToken('Microsoft sign-in needs an id_token with tid and oid claims')
+    return {
+        'oauth_id': f"{data['tid']}:{data['oid']}",
+        'email': data.get('email') or data.get('preferred_username'),
+        'email_verified': data.get('xms_edov') is True,
+        'name': data.get('name', ''),
+    }
+
+
+# Stored images never change, so clients may cache them for a year
+IMAGE_CACHE_SECONDS = 365 * 24 * 3600
+
+
+def oauth_success_url(user):
+    """Frontend callback URL carrying fresh JWT tokens and the user's profile"""
+    frontend_url = getattr(settings, 'FRONTEND_URL', 'http://localhost:3003')
+    refresh = RefreshToken.for_user(user)
+    tokens = {
+        'access': str(refresh.access_token),
+        'refresh': str(refresh)
+    }
+    profile_image = urllib.parse.quote(public_url(user.profile_image)) if user.profile_image else ''
+    return f"{frontend_url}/oauth/callback?access={tokens['access']}&refresh={tokens['refresh']}&name={urllib.parse.quote(user.name)}&email={urllib.parse.quote(user.email)}&avatar_color={urllib.parse.quote(user.avatar_color or '')}&profile_image={profile_image}"
+
+
+def oauth_user(provider, user_info):
+    """
+    Find, link or create the account an OAuth login belongs to
+
+    Accounts are matched on the provider's stable id (stored in oauth_id). An
+    account that only shares the email is linked only if the provider has
+    verified that email, so a provider account can't claim someone else's.
+
+    Raises:
+        AuthenticationFailed: if the email belongs to an account this login can't claim
+    """
+    email = user_info.get('email')
+    if not email:
+        raise AuthenticationFailed('The provider did not share an email address')
+    oauth_id = user_info.get('oauth_id') or user_info.get('sub') or user_info.get('id')
+    oauth_id = str(oauth_id) if oauth_id else None
+    verified = user_info.get('email_verified', user_info.get('verified_email')) in (True, 'true')
+    profile_picture = user_info.get('picture')
+
+    # The identity match and the email match in one query
+    match = Q(email=email)
+    if oauth_id:
+        match |= Q(oauth_provider=provider, oauth_id=oauth_id)
+    candidates = list(User.objects.filter(match)[:2])
+    user = next((u for u in candidates if oauth_id and (u.oauth_provider, u.oauth_id) == (provider, oauth_id)),
+                candidates[0] if candidates else None)
+
+    if user is None:
+        # OAuth users get a random password
+        return User.objects.create(
+            email=email,
+            name=user_info.get('name') or email.split('@')[0],
+            profile_image=profile_picture,
+            password=hash_password(secrets.token_urlsafe(32)),
+            oauth_provider=provider,
+            oauth_id=oauth_id,
+        )
+
+    update_fields = []
+    if (user.oauth_provider, user.oauth_id) != (provider, oauth_id):
+        if not (verified and oauth_id and user.oauth_id is None):
+            raise AuthenticationFailed('An account with this email already exists; sign in with your password')
+        user.oauth_provider, user.oauth_id = provider, oauth_id
+        update_fields += ['oauth_provider', 'oauth_id']
+    if profile_picture:
+        # Always update profile picture from OAuth if available
+        user.profile_image = profile_picture
+        update_fields.append('profile_image')
+    if update_fields:
+        user.save(update_fields=update_fields)
+    return user
+
+
+def oauth_error_url(message):
+    """Frontend callback URL reporting an OAuth error"""
+    frontend_url = getattr(settings, 'FRONTEND_URL', 'http://localhost:3003')
+    return f"{frontend_url}/oauth/callback?error={urllib.parse.quote_plus(message)}"
+
+
+def user_etag(user):
+    """Strong ETag for the current version of a user's profile"""
+    return f'"{user.pk}.{user.version}"'
 
+
+def with_user_validators(response, user):
+    """Tag a profile response with its ETag and make clients revalidate it"""
+    response['ETag'] = user_etag(user)
+    patch_cache_control(response, private=True, no_cache=True)
+    patch_vary_headers(response, ('Authorization',))
+    return response
+
+
+def not_modified(request, user):
+    """304 (or 412) response when the request's preconditions say so, else None"""
+    response = get_conditional_response(request, etag=user_etag(user))
+    return response and with_user_validators(response, user)
+
+
+def if_match_versions(request, user):
+    """
+    User versions named by If-Match, or None when there is no precondition
+    
+    An empty list means no listed ETag belongs to this user, so the
+    precondition can never hold.
+    """
+    header = request.META.get('HTTP_IF_MATCH')
+    if header is None:
+        return None
+    etags = parse_etags(header)
+    if etags == ['*']:
+        return None
+    prefix = f'"{user.pk}.'
+    return [
+        int(etag[len(prefix):-1]) for etag in etags
+        if etag.startswith(prefix) and etag[len(prefix):-1].isdigit()
+    ]
+
+
+@query_budget(4)
 class RegisterView(APIView):
     """
     API endpoint to initiate user registration (sends OTP)
     POST /api/auth/register/
     """
     permission_classes = (AllowAny,)
+    throttle_classes = (IPThrottle, EmailThrottle)
+    throttle_scope = 'register'
     serializer_class = RegisterSerializer
     
     def post(self, request):
@@ -43,173 +226,26 @@ class RegisterView(APIView):
         password = serializer.validated_data['password']
         avatar_color = serializer.validated_data.get('avatar_color', None)
         
-        # Check if user already exists
-        if User.objects.filter(email=email).exists():
-            return Response({
-                'error': 'User with this email already exists'
-            }, status=status.HTTP_400_BAD_REQUEST)
-        
-        # Delete any existing pending registration
-        PendingRegistration.objects.filter(email=email).delete()
+        # Existing emails were already rejected by the serializer's UniqueValidator
         
-        # Generate OTP
-        otp = PendingRegistration.generate_otp()
+        # Store pending registration (replaces any earlier one for this email)
+        otp = get_otp_store().issue(EMAIL_REGISTRATION, email, {
+            'name': name,
+            'password': hash_password(password),
+            'avatar_color': avatar_color,
+        })
         
-        # Create pending registration
-        from django.contrib.auth.hashers import make_password
-        pending_reg = PendingRegistration.objects.create(
-            email=email,
-            name=name,
-            password=make_password(password),
-            avatar_color=avatar_color,
-            otp=otp
-        )
+        # Queue OTP email (delivered by the outbox worker after commit)
+        subject, message, html_message = render_email('otp', name=name, otp=otp)
+        enqueue_email(email, subject, message, html_message=html_message)
         
-        # Send OTP via email
-        try:
-            subject = 'Verify Your TrueNeed Account'
-            
-            # Plain text version (fallback)
-            message = f"""
-Hi {name},
-
-Welcome to TrueNeed! Your AI Financial Guardrail.
-
-Your verification code is: {otp}
-
-This code will expire in 10 minutes.
-
-If you didn't request this, please ignore this email.
-
-Best regards,
-TrueNeed Team
-            """
-            
-            # HTML version (beautiful format)
-            html_message = f"""
-<!DOCTYPE html>
-<html>
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-</head>
-<body style="margin: 0; padding: 0; font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, 'Helvetica Neue', Arial, sans-serif; background-color: #f5f5f5;">
-    <table role="presentation" style="width: 100%; border-collapse: collapse; background-color: #f5f5f5;">
-        <tr>
-            <td align="center" style="padding: 40px 20px;">
-                <!-- Main Container -->
-                <table role="presentation" style="max-width: 600px; width: 100%; border-collapse: collapse; background-color: #ffffff; border-radius: 12px; box-shadow: 0 4px 6px rgba(0, 0, 0, 0.1); overflow: hidden;">
-                    
-                    <!-- Header with gradient -->
-                    <tr>
-                        <td style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); padding: 40px 30px; text-align: center;">
-                            <h1 style="margin: 0; color: #ffffff; font-size: 28px; font-weight: 700; letter-spacing: -0.5px;">
-                                🛡️ TrueNeed
-                            </h1>
-                            <p style="margin: 8px 0 0 0; color: rgba(255, 255, 255, 0.9); font-size: 14px; font-weight: 500;">
-                                Your AI Financial Guardrail
-                            </p>
-                        </td>
-                    </tr>
-                    
-                    <!-- Content -->
-                    <tr>
-                        <td style="padding: 40px 30px;">
-                            <h2 style="margin: 0 0 16px 0; color: #1a202c; font-size: 24px; font-weight: 600;">
-                                Welcome, {name}! 👋
-                            </h2>
-                            <p style="margin: 0 0 24px 0; color: #4a5568; font-size: 16px; line-height: 1.6;">
-                                Thank you for joining TrueNeed! We're excited to help you take control of your financial future.
-                            </p>
-                            <p style="margin: 0 0 16px 0; color: #4a5568; font-size: 16px; line-height: 1.6;">
-                                To complete your registration, please verify your email address using the code below:
-                            </p>
-                            
-                            <!-- OTP Box -->
-                            <table role="presentation" style="width: 100%; margin: 32px 0;">
-                                <tr>
-                                    <td style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); border-radius: 8px; padding: 24px; text-align: center;">
-                                        <p style="margin: 0 0 8px 0; color: rgba(255, 255, 255, 0.9); font-size: 14px; font-weight: 500; text-transform: uppercase; letter-spacing: 1px;">
-                                            Your Verification Code
-                                        </p>
-                                        <p style="margin: 0; color: #ffffff; font-size: 36px; font-weight: 700; letter-spacing: 8px; font-family: 'Courier New', monospace;">
-                                            {otp}
-                                        </p>
-                                    </td>
-                                </tr>
-                            </table>
-                            
-                            <!-- Info Box -->
-                            <table role="presentation" style="width: 100%; background-color: #f7fafc; border-left: 4px solid #667eea; border-radius: 4px; margin: 24px 0;">
-                                <tr>
-                                    <td style="padding: 16px 20px;">
-                                        <p style="margin: 0; color: #2d3748; font-size: 14px; line-height: 1.6;">
-                                            ⏱️ <strong>This code will expire in 10 minutes.</strong><br>
-                                            🔒 For your security, never share this code with anyone.
-                                        </p>
-                                    </td>
-                                </tr>
-                            </table>
-                            
-                            <p style="margin: 24px 0 0 0; color: #718096; font-size: 14px; line-height: 1.6;">
-                                If you didn't request this verification code, you can safely ignore this email. Someone may have entered your email address by mistake.
-                            </p>
-                        </td>
-                    </tr>
-                    
-                    <!-- Footer -->
-                    <tr>
-                        <td style="background-color: #f7fafc; padding: 30px; text-align: center; border-top: 1px solid #e2e8f0;">
-                            <p style="margin: 0 0 8px 0; color: #4a5568; font-size: 14px; font-weight: 600;">
-                                TrueNeed Team
-                            </p>
-                            <p style="margin: 0 0 16px 0; color: #718096; font-size: 13px;">
-                                Making financial decisions smarter with AI
-                            </p>
-                            <p style="margin: 0; color: #a0aec0; font-size: 12px;">
-                                © 2026 TrueNeed. All rights reserved.
-                            </p>
-                        </td>
-                    </tr>
-                    
-                </table>
-            </td>
-        </tr>
-    </table>
-</body>
-</html>
-            """
-            
-            send_mail(
-                subject,
-                message,
-                settings.DEFAULT_FROM_EMAIL,
-                [email],
-                fail_silently=False,
-                html_message=html_message,
-            )
-            
-            return Response({
-                'message': 'OTP sent successfully to your email',
-                'email': email
-            }, status=status.HTTP_200_OK)
-            
-        except Exception as e:
-           # If email fails, still return success but log error
-            import traceback
-            import sys
-            error_msg = f"❌ EMAIL SENDING FAILED: {str(e)}"
-            traceback_str = traceback.format_exc()
-            print(error_msg, file=sys.stderr, flush=True)
-            print(traceback_str, file=sys.stderr, flush=True)
-            return Response({
-                'message': 'OTP sent successfully to your email',
-                'email': email,
-                'otp': otp,  # Only for development - remove in production
-                'error': str(e)  # Add error to response for debugging
-            }, status=status.HTTP_200_OK)
+        return Response({
+            'message': 'OTP sent successfully to your email',
+            'email': email
+        }, status=status.HTTP_200_OK)
 
 
+@query_budget(3)
 class VerifyOTPView(APIView):
     """
     API endpoint to verify OTP and complete registration
@@ -225,31 +261,33 @@ class VerifyOTPView(APIView):
         email = serializer.validated_data['email']
         otp = serializer.validated_data['otp']
         
-        try:
-            pending_reg = PendingRegistration.objects.get(email=email)
-        except PendingRegistration.DoesNotExist:
+        otp_store = get_otp_store()
+        
+        # Verify OTP
+        result = otp_store.verify(EMAIL_REGISTRATION, email, otp)
+        
+        if not result.found:
             return Response({
                 'error': 'No pending registration found for this email'
             }, status=status.HTTP_404_NOT_FOUND)
         
-        # Verify OTP
-        success, message = pending_reg.verify_otp(otp)
-        
-        if not success:
+        if not result.success:
             return Response({
-                'error': message
+                'error': result.message
             }, status=status.HTTP_400_BAD_REQUEST)
         
+        pending_reg = result.data
+        
         # Create actual user
         user = User.objects.create(
-            email=pending_reg.email,
-            name=pending_reg.name,
-            password=pending_reg.password,  # Already hashed
-            avatar_color=pending_reg.avatar_color
+            email=email,
+            name=pending_reg['name'],
+            password=pending_reg['password'],  # Already hashed
+            avatar_color=pending_reg['avatar_color']
         )
         
         # Delete pending registration
-        pending_reg.delete()
+        otp_store.discard(EMAIL_REGISTRATION, email)
         
         # Generate JWT tokens
         refresh = RefreshToken.for_user(user)
@@ -264,12 +302,15 @@ class VerifyOTPView(APIView):
         }, status=status.HTTP_201_CREATED)
 
 
+@query_budget(3)
 class ResendOTPView(APIView):
     """
     API endpoint to resend OTP
     POST /api/auth/resend-otp/
     """
     permission_classes = (AllowAny,)
+    throttle_classes = (IPThrottle, EmailThrottle)
+    throttle_scope = 'resend_otp'
     serializer_class = ResendOTPSerializer
     
     def post(self, request):
@@ -278,157 +319,34 @@ class ResendOTPView(APIView):
         
         email = serializer.validated_data['email']
         
-        try:
-            pending_reg = PendingRegistration.objects.get(email=email)
-        except PendingRegistration.DoesNotExist:
+        # Generate new OTP (resets attempts and expiry)
+        reissued = get_otp_store().reissue(EMAIL_REGISTRATION, email)
+        
+        if reissued is None:
             return Response({
                 'error': 'No pending registration found for this email'
             }, status=status.HTTP_404_NOT_FOUND)
         
-        # Generate new OTP
-        new_otp = PendingRegistration.generate_otp()
-        pending_reg.otp = new_otp
-        pending_reg.otp_attempts = 0  # Reset attempts
-        from django.utils import timezone
-        pending_reg.otp_created_at = timezone.now()  # Reset expiry
-        pending_reg.save()
+        new_otp, pending_reg = reissued
         
-        # Send new OTP via email
-        try:
-            subject = 'Your New TrueNeed Verification Code'
-            
-            # Plain text version (fallback)
-            message = f"""
-Hi {pending_reg.name},
-
-Your new verification code is: {new_otp}
-
-This code will expire in 10 minutes.
-
-If you didn't request this, please ignore this email.
-
-Best regards,
-TrueNeed Team
-            """
-            
-            # HTML version (beautiful format)
-            html_message = f"""
-<!DOCTYPE html>
-<html>
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-</head>
-<body style="margin: 0; padding: 0; font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, 'Helvetica Neue', Arial, sans-serif; background-color: #f5f5f5;">
-    <table role="presentation" style="width: 100%; border-collapse: collapse; background-color: #f5f5f5;">
-        <tr>
-            <td align="center" style="padding: 40px 20px;">
-                <table role="presentation" style="max-width: 600px; width: 100%; border-collapse: collapse; background-color: #ffffff; border-radius: 12px; box-shadow: 0 4px 6px rgba(0, 0, 0, 0.1); overflow: hidden;">
-                    
-                    <!-- Header -->
-                    <tr>
-                        <td style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); padding: 40px 30px; text-align: center;">
-                            <h1 style="margin: 0; color: #ffffff; font-size: 28px; font-weight: 700; letter-spacing: -0.5px;">
-                                🛡️ TrueNeed
-                            </h1>
-                            <p style="margin: 8px 0 0 0; color: rgba(255, 255, 255, 0.9); font-size: 14px; font-weight: 500;">
-                                Your AI Financial Guardrail
-                            </p>
-                        </td>
-                    </tr>
-                    
-                    <!-- Content -->
-                    <tr>
-                        <td style="padding: 40px 30px;">
-                            <h2 style="margin: 0 0 16px 0; color: #1a202c; font-size: 24px; font-weight: 600;">
-                                New Verification Code 🔄
-                            </h2>
-                            <p style="margin: 0 0 24px 0; color: #4a5568; font-size: 16px; line-height: 1.6;">
-                                Hi {pending_reg.name}, you requested a new verification code. Here it is:
-                            </p>
-                            
-                            <!-- OTP Box -->
-                            <table role="presentation" style="width: 100%; margin: 32px 0;">
-                                <tr>
-                                    <td style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); border-radius: 8px; padding: 24px; text-align: center;">
-                                        <p style="margin: 0 0 8px 0; color: rgba(255, 255, 255, 0.9); font-size: 14px; font-weight: 500; text-transform: uppercase; letter-spacing: 1px;">
-                                            Your New Verification Code
-                                        </p>
-                                        <p style="margin: 0; color: #ffffff; font-size: 36px; font-weight: 700; letter-spacing: 8px; font-family: 'Courier New', monospace;">
-                                            {new_otp}
-                                        </p>
-                                    </td>
-                                </tr>
-                            </table>
-                            
-                            <!-- Info Box -->
-                            <table role="presentation" style="width: 100%; background-color: #f7fafc; border-left: 4px solid #667eea; border-radius: 4px; margin: 24px 0;">
-                                <tr>
-                                    <td style="padding: 16px 20px;">
-                                        <p style="margin: 0; color: #2d3748; font-size: 14px; line-height: 1.6;">
-                                            ⏱️ <strong>This code will expire in 10 minutes.</strong><br>
-                                            🔒 For your security, never share this code with anyone.
-                                        </p>
-                                    </td>
-                                </tr>
-                            </table>
-                            
-                            <p style="margin: 24px 0 0 0; color: #718096; font-size: 14px; line-height: 1.6;">
-                                If you didn't request this code, please secure your account immediately.
-                            </p>
-                        </td>
-                    </tr>
-                    
-                    <!-- Footer -->
-                    <tr>
-                        <td style="background-color: #f7fafc; padding: 30px; text-align: center; border-top: 1px solid #e2e8f0;">
-                            <p style="margin: 0 0 8px 0; color: #4a5568; font-size: 14px; font-weight: 600;">
-                                TrueNeed Team
-                            </p>
-                            <p style="margin: 0 0 16px 0; color: #718096; font-size: 13px;">
-                                Making financial decisions smarter with AI
-                            </p>
-                            <p style="margin: 0; color: #a0aec0; font-size: 12px;">
-                                © 2026 TrueNeed. All rights reserved.
-                            </p>
-                        </td>
-                    </tr>
-                    
-                </table>
-            </td>
-        </tr>
-    </table>
-</body>
-</html>
-            """
-            
-            send_mail(
-                subject,
-                message,
-                settings.DEFAULT_FROM_EMAIL,
-                [email],
-                fail_silently=False,
-                html_message=html_message,
-            )
-            
-            return Response({
-                'message': 'New OTP sent successfully to your email'
-            }, status=status.HTTP_200_OK)
-            
-        except Exception as e:
-            print(f"Email sending failed: {str(e)}")
-            return Response({
-                'message': 'New OTP sent successfully to your email',
-                'otp': new_otp  # Only for development - remove in production
-            }, status=status.HTTP_200_OK)
+        # Queue new OTP email (delivered by the outbox worker after commit)
+        subject, message, html_message = render_email('resend_otp', name=pending_reg['name'], otp=new_otp)
+        enqueue_email(email, subject, message, html_message=html_message)
+        
+        return Response({
+            'message': 'New OTP sent successfully to your email'
+        }, status=status.HTTP_200_OK)
 
 
+@query_budget(1)
 class LoginView(APIView):
     """
     API endpoint for user login
     POST /api/auth/login/
     """
     permission_classes = (AllowAny,)
+    throttle_classes = (IPThrottle, EmailThrottle)
+    throttle_scope = 'login'
     serializer_class = LoginSerializer
     
     def post(self, request):
@@ -440,8 +358,8 @@ class LoginView(APIView):
         
         print(f"🔐 Login attempt for: {email}")
         
-        # Authenticate user
-        user = authenticate(request, username=email, password=password)
+        # Authenticate user (a saturated hashing pool answers 503)
+        user = EmailBackend().authenticate_email(email, password)
         
         if user is None:
             print(f"❌ Authentication failed for: {email}")
@@ -474,6 +392,7 @@ class LoginView(APIView):
         }, status=status.HTTP_200_OK)
 
 
+@query_budget(3)
 class LogoutView(APIView):
     """
     API endpoint for user logout
@@ -482,22 +401,30 @@ class LogoutView(APIView):
     permission_classes = (IsAuthenticated,)
     
     def post(self, request):
-        try:
-            refresh_token = request.data.get('refresh_token')
-            if refresh_token:
-                token = RefreshToken(refresh_token)
-                token.blacklist()
-            return Response({
-                'message': 'Logout successful'
-            }, status=status.HTTP_200_OK)
-        except Exception as e:
-            # Return success even if token is invalid/expired
-            # The goal is to clear the session, which is handled client-side
-            return Response({
-                'message': 'Logout successful'
-            }, status=status.HTTP_200_OK)
+        tokens = []
+        
+        # Revoke the refresh token so it can no longer mint access tokens
+        refresh_token = request.data.get('refresh_token')
+        if refresh_token:
+            try:
+                tokens.append(RevocableRefreshToken(refresh_token))
+            except TokenError:
+                # Already invalid, expired or revoked - nothing left to revoke
+                pass
+        
+        # ...and the access token this request was made with
+        if request.auth is not None:
+            tokens.append(request.auth)
+        
+        if tokens:
+            revoke(*tokens)
+        
+        return Response({
+            'message': 'Logout successful'
+        }, status=status.HTTP_200_OK)
 
 
+@query_budget(2)
 class UserDetailView(APIView):
     """
     API endpoint to get current user details
@@ -506,41 +433,134 @@ class UserDetailView(APIView):
     permission_classes = (IsAuthenticated,)
     
     def get(self, request):
+        # Pollers holding the current ETag get a 304 without serializing
+        response = not_modified(request, request.user)
+        if response is not None:
+            return response
+        
         serializer = UserSerializer(request.user)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return with_user_validators(Response(serializer.data, status=status.HTTP_200_OK), request.user)
 
 
+@query_budget(3)
 class UpdateProfileView(APIView):
     """
     API endpoint to update user profile (avatar color, profile image, name)
     PATCH /api/auth/profile/
+    
+    Send If-Match with the ETag from /me/ to fail with 412 instead of
+    overwriting a change made since it was read.
     """
     permission_classes = (IsAuthenticated,)
     
     def patch(self, request):
         user = request.user
+        updated = []
+        
+        versions = if_match_versions(request, user)
+        if versions == []:
+            return self.precondition_failed()
         
         # Update avatar color if provided
         if 'avatar_color' in request.data:
             user.avatar_color = request.data['avatar_color']
+            updated.append('avatar_color')
         
-        # Update profile image if provided
+        # Update profile image if provided (uploaded images go to the image store)
         if 'profile_image' in request.data:
-            user.profile_image = request.data['profile_image']
+            try:
+                user.profile_image = normalize_profile_image(request.data['profile_image'])
+            except InvalidImage as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            user.profile_thumbnails = None
+            updated += ['profile_image', 'profile_thumbnails']
         
         # Update name if provided
         if 'name' in request.data:
             user.name = request.data['name']
+            updated.append('name')
         
-        user.save()
+        # request.user may come from the auth cache, so only write the changed
+        # columns (never stale copies of the others)
+        if versions is not None:
+            if not user.save_if_version(versions, updated):
+                return self.precondition_failed()
+        elif updated:
+            user.save(update_fields=updated)
         
         serializer = UserSerializer(user)
-        return Response({
+        return with_user_validators(Response({
             'user': serializer.data,
             'message': 'Profile updated successfully'
+        }, status=status.HTTP_200_OK), user)
+    
+    def precondition_failed(self):
+        return Response({
+            'error': 'Profile was changed elsewhere. Reload it and try again.'
+        }, status=status.HTTP_412_PRECONDITION_FAILED)
+
+
+@query_budget(3)
+class AvatarUploadView(APIView):
+    """
+    API endpoint to upload a profile picture as multipart/form-data
+    POST /api/auth/profile/avatar/  (file field: image)
+    
+    The upload is spooled to a temp file (capped at AVATAR_MAX_UPLOAD_BYTES),
+    resized into AVATAR_SIZES thumbnails in the thumbnail process pool and
+    stored in the image store; the user row is updated in one statement.
+    """
+    permission_classes = (IsAuthenticated,)
+    parser_classes = (MultiPartParser,)
+    
+    def post(self, request):
+        limit = getattr(settings, 'AVATAR_MAX_UPLOAD_BYTES', 5 * 1024 * 1024)
+        too_large = Response({
+            'error': f'Image must be smaller than {limit // (1024 * 1024)}MB'
+        }, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        
+        # Refuse obviously oversized bodies before reading them
+        try:
+            content_length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            content_length = -1
+        if content_length < 0:
+            return Response({'error': 'Invalid Content-Length header'}, status=status.HTTP_400_BAD_REQUEST)
+        if content_length > limit + 64 * 1024:
+            return too_large
+        
+        handler = CappedUploadHandler(request._request, limit)
+        request.upload_handlers = [handler]
+        upload = request.FILES.get('image')
+        if handler.exceeded:
+            return too_large
+        if upload is None:
+            return Response({'error': 'No image uploaded (use the "image" field)'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        try:
+            rendered = make_thumbnails(upload.temporary_file_path())
+        except UnreadableImage as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        finally:
+            upload.close()
+        
+        thumbnails = {
+            str(size): image_url(store_file(io.BytesIO(data)))
+            for size, data in rendered.items()
+        }
+        
+        user = request.user
+        user.profile_image = thumbnails[str(max(rendered))]
+        user.profile_thumbnails = thumbnails
+        user.save(update_fields=['profile_image', 'profile_thumbnails'])
+        
+        return Response({
+            'user': UserSerializer(user).data,
+            'message': 'Profile image updated successfully'
         }, status=status.HTTP_200_OK)
 
 
+@query_budget(6)
 class DeleteAccountView(APIView):
     """
     API endpoint to delete user account permanently
@@ -559,7 +579,7 @@ class DeleteAccountView(APIView):
         
         # Optionally require password confirmation for security
         password = request.data.get('password')
-        if password and not user.check_password(password):
+        if password and not verify_password(user, password):
             return Response({
                 'error': 'Incorrect password'
             }, status=status.HTTP_400_BAD_REQUEST)
@@ -573,6 +593,55 @@ class DeleteAccountView(APIView):
         }, status=status.HTTP_200_OK)
 
 
+@query_budget(0)
+class ProfileImageView(View):
+    """
+    Serve a stored profile image
+    GET /api/auth/images/<key>/
+    
+    Keys are content hashes, so the file behind a URL never changes: the hash is
+    the (strong) ETag and clients may cache it indefinitely. FileResponse streams
+    the file (via sendfile where the server supports wsgi.file_wrapper).
+    """
+    
+    def get(self, request, key):
+        try:
+            handle = open(path_for(key), 'rb')
+        except FileNotFoundError:
+            raise Http404("Image not found")
+        
+        etag = f'"{key.split(".")[0]}"'
+        response = get_conditional_response(request, etag=etag)
+        if response is not None:
+            handle.close()
+        else:
+            response = FileResponse(handle, content_type=CONTENT_TYPES[key.rsplit('.', 1)[1]])
+        response['ETag'] = etag
+        patch_cache_control(response, public=True, max_age=IMAGE_CACHE_SECONDS, immutable=True)
+        return response
+
+
+@query_budget(0)
+class MetricsView(View):
+    """
+    Prometheus scrape endpoint for this process's request metrics
+    GET /metrics
+    
+    Open unless METRICS_TOKEN is set, in which case the scraper must send it
+    as a Bearer token.
+    """
+    
+    def get(self, request):
+        token = getattr(settings, 'METRICS_TOKEN', '')
+        if token and not secrets.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+            return HttpResponse('Unauthorized\n', status=401, content_type='text/plain')
+        
+        response = HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
+        patch_cache_control(response, no_store=True)
+        return response
+
+
+@query_budget(2)
 class ForgotPasswordView(APIView):
     """
     API endpoint to request password reset
@@ -598,32 +667,13 @@ class ForgotPasswordView(APIView):
             frontend_url = getattr(settings, 'FRONTEND_URL', 'http://localhost:5173')
             reset_link = f"{frontend_url}/reset-password?token={token}&uid={uid}"
             
-            # Send email
-            subject = 'Reset Your TrueNeed Password'
-            message = f"""
-Hi {user.name},
-
-You requested to reset your password for TrueNeed.
-
-Click the link below to reset your password:
-{reset_link}
-
-This link will expire in 1 hour.
-
-If you didn't request this, please ignore this email.
-
-Best regards,
-TrueNeed Team
-            """
-            
-            send_mail(
-                subject,
-                message,
-                settings.DEFAULT_FROM_EMAIL,
-                [email],
-                fail_silently=False,
+            # Queue reset email
+            subject, message, html_message = render_email(
+                'reset_password', name=user.name, reset_link=reset_link
             )
             
+            enqueue_email(email, subject, message, html_message=html_message)
+            
             return Response({
                 'message': 'Password reset email sent successfully'
             }, status=status.HTTP_200_OK)
@@ -635,6 +685,7 @@ TrueNeed Team
             }, status=status.HTTP_200_OK)
 
 
+@query_budget(2)
 class ResetPasswordView(APIView):
     """
     API endpoint to reset password with token
@@ -662,8 +713,8 @@ class ResetPasswordView(APIView):
                 }, status=status.HTTP_400_BAD_REQUEST)
             
             # Set new password
-            user.set_password(password)
-            user.save()
+            user.password = hash_password(password)
+            user.save(update_fields=['password'])
             
             return Response({
                 'message': 'Password reset successfully'
@@ -675,6 +726,7 @@ class ResetPasswordView(APIView):
             }, status=status.HTTP_400_BAD_REQUEST)
 
 
+@query_budget(0)
 class OAuthLoginView(APIView):
     """
     API endpoint to initiate OAuth login
@@ -734,6 +786,7 @@ class OAuthLoginView(APIView):
         }, status=status.HTTP_400_BAD_REQUEST)
 
 
+@query_budget(4)
 class OAuthCallbackView(APIView):
     """
     API endpoint to handle OAuth callback
@@ -745,14 +798,11 @@ class OAuthCallbackView(APIView):
         code = request.GET.get('code')
         state = request.GET.get('state')
         
-        # Verify state for CSRF protection
-        saved_provider = cache.get(f'oauth_state_{state}')
+        # Verify state for CSRF protection; taking it out of the cache in the
+        # same step makes it single-use even if the callback is replayed
+        saved_provider = get_and_delete(cache, f'oauth_state_{state}')
         if not saved_provider or saved_provider != provider:
-            frontend_url = getattr(settings, 'FRONTEND_URL', 'http://localhost:3003')
-            return redirect(f"{frontend_url}/oauth/callback?error=Invalid+state+parameter")
-        
-        # Delete used state
-        cache.delete(f'oauth_state_{state}')
+            return redirect(oauth_error_url('Invalid state parameter'))
         
         # Exchange code for access token and get user info
         try:
@@ -767,68 +817,47 @@ class OAuthCallbackView(APIView):
                     'error': f'Unsupported OAuth provider: {provider}'
                 }, status=status.HTTP_400_BAD_REQUEST)
             
-            # Find or create user
-            email = user_info['email']
-            name = user_info.get('name', email.split('@')[0])
-            profile_picture = user_info.get('picture', None)
-            
-            user, created = User.objects.get_or_create(
-                email=email,
-                defaults={'name': name, 'profile_image': profile_picture}
-            )
-            
-            if created:
-                # Set a random password for OAuth users
-                user.set_password(secrets.token_urlsafe(32))
-                user.save()
-            elif profile_picture:
-                # Always update profile picture from OAuth if available
-                user.profile_image = profile_picture
-                user.save()
-            
-            # Generate JWT tokens
-            refresh = RefreshToken.for_user(user)
+            # Find, link or create the user
+            user = oauth_user(provider, user_info)
             
             # Redirect to frontend with tokens in URL parameters
-            frontend_url = getattr(settings, 'FRONTEND_URL', 'http://localhost:3003')
-            tokens = {
-                'access': str(refresh.access_token),
-                'refresh': str(refresh)
-            }
-            profile_image = urllib.parse.quote(user.profile_image or '') if user.profile_image else ''
-            redirect_url = f"{frontend_url}/oauth/callback?access={tokens['access']}&refresh={tokens['refresh']}&name={urllib.parse.quote(user.name)}&email={urllib.parse.quote(user.email)}&avatar_color={urllib.parse.quote(user.avatar_color or '')}&profile_image={profile_image}"
-            return redirect(redirect_url)
+            return redirect(oauth_success_url(user))
             
         except Exception as e:
             # Redirect to frontend with error
-            frontend_url = getattr(settings, 'FRONTEND_URL', 'http://localhost:3003')
-            error_msg = urllib.parse.quote(str(e))
-            return redirect(f"{frontend_url}/oauth/callback?error={error_msg}")
+            return redirect(oauth_error_url(str(e)))
+    
+    def _exchange(self, provider, token_data):
+        endpoints = provider_endpoints(provider)
+        
+        # Both calls reuse the provider's pooled keep-alive session
+        with external_call('oauth'):
+            token_response = http.request(provider, 'POST', endpoints['token'], data=token_data)
+        token_response.raise_for_status()
+        tokens = token_response.json()
+        
+        # The id_token already says who the user is: verify it locally instead
+        # of asking the provider again
+        if tokens.get('id_token'):
+            return verify_id_token(tokens['id_token'], provider, endpoints['jwks'], token_data['client_id'],
+                                   endpoints['issuers'])
+        
+        # Get user info
+        with external_call('oauth'):
+            user_response = http.request(provider, 'GET', endpoints['userinfo'],
+                                         headers={'Authorization': f"Bearer {tokens['access_token']}"})
+        user_response.raise_for_status()
+        return user_response.json()
     
     def _google_get_user_info(self, code, request):
-        # Exchange code for access token
         redirect_uri = f"{request.scheme}://{request.get_host()}/api/auth/oauth/google/callback/"
-        token_url = "https://oauth2.googleapis.com/token"
-        
-        token_data = {
+        return self._exchange('google', {
             'code': code,
             'client_id': getattr(settings, 'GOOGLE_CLIENT_ID', ''),
             'client_secret': getattr(settings, 'GOOGLE_CLIENT_SECRET', ''),
             'redirect_uri': redirect_uri,
             'grant_type': 'authorization_code',
-        }
-        
-        token_response = requests.post(token_url, data=token_data)
-        token_response.raise_for_status()
-        access_token = token_response.json()['access_token']
-        
-        # Get user info
-        user_info_url = "https://www.googleapis.com/oauth2/v2/userinfo"
-        headers = {'Authorization': f'Bearer {access_token}'}
-        user_response = requests.get(user_info_url, headers=headers)
-        user_response.raise_for_status()
-        
-        return user_response.json()
+        })
     
     def _apple_get_user_info(self, code, request):
         # Apple OAuth is more complex and requires JWT signing
@@ -837,40 +866,24 @@ class OAuthCallbackView(APIView):
     
     def _microsoft_get_user_info(self, code, request):
         redirect_uri = f"{request.scheme}://{request.get_host()}/api/auth/oauth/microsoft/callback/"
-        tenant = getattr(settings, 'MICROSOFT_TENANT', 'common')
-        token_url = f"https://login.microsoftonline.com/{tenant}/oauth2/v2.0/token"
-        
-        token_data = {
+        return microsoft_user_info(self._exchange('microsoft', {
             'code': code,
             'client_id': getattr(settings, 'MICROSOFT_CLIENT_ID', ''),
             'client_secret': getattr(settings, 'MICROSOFT_CLIENT_SECRET', ''),
             'redirect_uri': redirect_uri,
             'grant_type': 'authorization_code',
-        }
-        
-        token_response = requests.post(token_url, data=token_data)
-        token_response.raise_for_status()
-        access_token = token_response.json()['access_token']
-        
-        # Get user info
-        user_info_url = "https://graph.microsoft.com/v1.0/me"
-        headers = {'Authorization': f'Bearer {access_token}'}
-        user_response = requests.get(user_info_url, headers=headers)
-        user_response.raise_for_status()
-        
-        user_data = user_response.json()
-        return {
-            'email': user_data.get('mail') or user_data.get('userPrincipalName'),
-            'name': user_data.get('displayName', '')
-        }
+        }))
 
 
+@query_budget(3)
 class PhoneRegisterView(APIView):
     """
     API endpoint to initiate phone registration (sends SMS OTP)
     POST /api/auth/phone/register/
     """
     permission_classes = (AllowAny,)
+    throttle_classes = (IPThrottle, PhoneThrottle)
+    throttle_scope = 'phone_register'
     
     def post(self, request):
         phone_number = request.data.get('phone_number', '').strip()
@@ -893,32 +906,23 @@ class PhoneRegisterView(APIView):
         if User.objects.filter(phone_number=phone_number).exists():
             return Response({'error': 'Phone number already registered'}, status=status.HTTP_400_BAD_REQUEST)
         
-        # Delete any existing phone OTP for this number
-        PhoneOTP.objects.filter(phone_number=phone_number).delete()
-        
-        # Generate OTP
-        otp = PhoneOTP.generate_otp()
-        
-        # Store registration data
-        from django.contrib.auth.hashers import make_password
-        PhoneOTP.objects.create(
-            phone_number=phone_number,
-            name=name,
-            password=make_password(password),
-            avatar_color=avatar_color,
-            otp=otp,
-            purpose='registration'
-        )
+        # Store registration data (replaces any earlier OTP for this number)
+        otp = get_otp_store().issue(PHONE, phone_number, {
+            'name': name,
+            'password': hash_password(password),
+            'avatar_color': avatar_color,
+            'purpose': 'registration',
+        })
         
-        # Send OTP via SMS
-        success, message = send_sms_otp(phone_number, otp)
+        # Queue OTP SMS (sent by the SMS worker pool after commit)
+        success, message = dispatch_sms_otp(phone_number, otp)
         
         response_data = {
             'message': 'OTP sent successfully to your phone',
             'phone_number': phone_number,
         }
         
-        # If SMS failed, include OTP in response for testing
+        # If SMS is not configured, include OTP in response for testing
         if not success:
             response_data['otp'] = otp
             response_data['debug_message'] = message
@@ -926,12 +930,15 @@ class PhoneRegisterView(APIView):
         return Response(response_data, status=status.HTTP_200_OK)
 
 
+@query_budget(3)
 class PhoneLoginView(APIView):
     """
     API endpoint to initiate phone login (sends SMS OTP)
     POST /api/auth/phone/login/
     """
     permission_classes = (AllowAny,)
+    throttle_classes = (IPThrottle, PhoneThrottle)
+    throttle_scope = 'phone_login'
     
     def post(self, request):
         phone_number = request.data.get('phone_number', '').strip()
@@ -946,28 +953,23 @@ class PhoneLoginView(APIView):
         except User.DoesNotExist:
             return Response({'error': 'Phone number not registered'}, status=status.HTTP_404_NOT_FOUND)
         
-        # Delete any existing phone OTP for this number
-        PhoneOTP.objects.filter(phone_number=phone_number).delete()
-        
-        # Generate OTP
-        otp = PhoneOTP.generate_otp()
+        # Store OTP (replaces any earlier OTP for this number)
+        otp = get_otp_store().issue(PHONE, phone_number, {
+            'name': None,
+            'password': None,
+            'avatar_color': None,
+            'purpose': 'login',
+        })
         
-        # Store OTP
-        PhoneOTP.objects.create(
-            phone_number=phone_number,
-            otp=otp,
-            purpose='login'
-        )
-        
-        # Send OTP via SMS
-        success, message = send_sms_otp(phone_number, otp)
+        # Queue OTP SMS (sent by the SMS worker pool after commit)
+        success, message = dispatch_sms_otp(phone_number, otp)
         
         response_data = {
             'message': 'OTP sent successfully to your phone',
             'phone_number': phone_number,
         }
         
-        # If SMS failed, include OTP in response for testing
+        # If SMS is not configured, include OTP in response for testing
         if not success:
             response_data['otp'] = otp
             response_data['debug_message'] = message
@@ -975,6 +977,7 @@ class PhoneLoginView(APIView):
         return Response(response_data, status=status.HTTP_200_OK)
 
 
+@query_budget(3)
 class PhoneVerifyOTPView(APIView):
     """
     API endpoint to verify phone OTP and complete registration/login
@@ -989,32 +992,33 @@ class PhoneVerifyOTPView(APIView):
         if not phone_number or not otp:
             return Response({'error': 'Phone number and OTP are required'}, status=status.HTTP_400_BAD_REQUEST)
         
-        # Get the most recent OTP for this phone number
-        try:
-            phone_otp = PhoneOTP.objects.filter(phone_number=phone_number).latest('created_at')
-        except PhoneOTP.DoesNotExist:
+        otp_store = get_otp_store()
+        
+        # Verify the pending OTP for this phone number
+        result = otp_store.verify(PHONE, phone_number, otp)
+        
+        if not result.found:
             return Response({'error': 'No OTP found for this phone number'}, status=status.HTTP_404_NOT_FOUND)
         
-        # Verify OTP
-        is_valid, message = phone_otp.verify_otp(otp)
+        if not result.success:
+            return Response({'error': result.message}, status=status.HTTP_400_BAD_REQUEST)
         
-        if not is_valid:
-            return Response({'error': message}, status=status.HTTP_400_BAD_REQUEST)
+        phone_otp = result.data
         
         # Handle registration or login based on purpose
-        if phone_otp.purpose == 'registration':
+        if phone_otp['purpose'] == 'registration':
             # Create new user
             user = User.objects.create(
                 phone_number=phone_number,
-                name=phone_otp.name,
-                password=phone_otp.password,
-                avatar_color=phone_otp.avatar_color,
+                name=phone_otp['name'],
+                password=phone_otp['password'],
+                avatar_color=phone_otp['avatar_color'],
                 is_active=True,
                 email=f"{phone_number}@phone.trueneed.local"  # Generate email for phone users
             )
             
             # Delete phone OTP record
-            phone_otp.delete()
+            otp_store.discard(PHONE, phone_number)
             
             # Generate JWT tokens
             refresh = RefreshToken.for_user(user)
@@ -1035,7 +1039,7 @@ class PhoneVerifyOTPView(APIView):
                 return Response({'error': 'User not found'}, status=status.HTTP_404_NOT_FOUND)
             
             # Delete phone OTP record
-            phone_otp.delete()
+            otp_store.discard(PHONE, phone_number)
             
             # Generate JWT tokens
             refresh = RefreshToken.for_user(user)
@@ -1049,6 +1053,7 @@ class PhoneVerifyOTPView(APIView):
             }, status=status.HTTP_200_OK)
 
 
+@query_budget(2)
 class FirebasePhoneAuthView(APIView):
     """
     API endpoint to authenticate with Firebase phone token
@@ -1103,11 +1108,10 @@ class FirebasePhoneAuthView(APIView):
                 }, status=status.HTTP_400_BAD_REQUEST)
             
             # Create new user
-            from django.contrib.auth.hashers import make_password
             user = User.objects.create(
                 phone_number=phone_number,
                 name=name,
-                password=make_password(password) if password else make_password(uid),
+                password=hash_password(password or uid),
                 is_active=True,
                 email=f"{phone_number}@phone.trueneed.local"
             )